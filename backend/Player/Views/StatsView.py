@@ -66,7 +66,16 @@ def generateGraphValues(stats):
 
 
 
-def calculateStats(stats, win, loss):
+def leagueRanks(league):
+    # Rank (from 1) of every stats of a league, by stats id.
+    ids = Stats.objects.filter(league__icontains=league).order_by("-xp").values_list("id", flat=True)
+    return {stats_id: rank for rank, stats_id in enumerate(ids, 1)}
+
+
+def calculateStats(stats, win, loss, ranks=None):
+    # ``ranks`` caches leagueRanks by league across the players of a batch.
+    if ranks is None:
+        ranks = {}
     newWin = int(stats.win) + int(win)
     newLoss = int(stats.loss) + int(loss)
 
@@ -77,11 +86,9 @@ def calculateStats(stats, win, loss):
     league = getLeague(newXp)
     progress_bar = league["progress_bar"]
     league = league["league"]
-    stats_list = list(Stats.objects.filter(league__icontains=league).order_by("-xp"))
-    try:
-        newRank = stats_list.index(stats) + 1
-    except ValueError:
-        newRank = 1
+    if league not in ranks:
+        ranks[league] = leagueRanks(league)
+    newRank = ranks[league].get(stats.id, 1)
     return {"win": newWin, "loss": newLoss, "rank": newRank, "progress_bar": progress_bar, "league": league, "xp": newXp}
 
 
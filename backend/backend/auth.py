@@ -0,0 +1,35 @@
+"""JWT authentication of WebSocket connections.
+
+Browsers cannot set headers on a WebSocket handshake, so the client passes
+its access token in the query string (``?token=...``). A valid token sets
+``scope["user"]``; without one the session user of AuthMiddlewareStack
+stays, usually AnonymousUser.
+"""
+
+from urllib.parse import parse_qs
+
+from channels.middleware import BaseMiddleware
+from django.contrib.auth import get_user_model
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .database import database
+
+
+@database
+def get_user_from_token(token):
+    try:
+        user_id = AccessToken(token)["user_id"]
+    except (TokenError, KeyError):
+        return None
+    return get_user_model().objects.filter(id=user_id).first()
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    async def __call__(self, scope, receive, send):
+        token = parse_qs(scope.get("query_string", b"").decode()).get("token", [None])[0]
+        if token:
+            user = await get_user_from_token(token)
+            if user is not None:
+                scope = dict(scope, user=user)
+        return await super().__call__(scope, receive, send)
@@ -0,0 +1,87 @@
+"""Database access for async code (consumers, game loops).
+
+ORM calls are blocking, so async code runs them through ``run`` (or the
+``database`` decorator), on a small pool of threads kept for the database
+alone. Queries never run on the event loop that drives the games, and a burst
+of slow queries queues up in the pool instead of taking the threads that
+``sync_to_async`` shares with everything else. Each thread keeps its own
+connection between calls for ``DATABASE_CONN_MAX_AGE`` seconds, checked
+before reuse. Only these threads do: views run on a thread per request
+under ASGI and keep closing their connection after each request.
+
+How long calls wait for a thread and how long they run is exported per call
+on /metrics.
+"""
+
+import time
+import asyncio
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+from prometheus_client import Histogram
+
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+DB_CALL_DURATION = Histogram(
+    "db_call_duration_seconds",
+    "Time an async database call spent running in the database pool",
+    ["call"],
+    buckets=DB_BUCKETS,
+)
+DB_CALL_WAIT = Histogram(
+    "db_call_wait_seconds",
+    "Time an async database call waited for a database pool thread",
+    ["call"],
+    buckets=DB_BUCKETS,
+)
+
+
+def _init_thread():
+    # The connections of this thread get their own settings, so that only
+    # they persist.
+    for connection in connections.all():
+        connection.settings_dict = dict(
+            connection.settings_dict,
+            CONN_MAX_AGE=settings.DATABASE_CONN_MAX_AGE,
+            CONN_HEALTH_CHECKS=True,
+        )
+
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.DATABASE_THREADS,
+    thread_name_prefix="database",
+    initializer=_init_thread,
+)
+
+
+def _call(func, name, queued, args, kwargs):
+    started = time.perf_counter()
+    DB_CALL_WAIT.labels(name).observe(started - queued)
+    # Drops connections that are too old or broken, as a request would.
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+        DB_CALL_DURATION.labels(name).observe(time.perf_counter() - started)
+
+
+async def run(func, *args, **kwargs):
+    """Run the blocking ``func(*args, **kwargs)`` in the database pool"""
+    name = getattr(func, "__qualname__", repr(func))
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, _call, func, name, time.perf_counter(), args, kwargs)
+    return await asyncio.get_running_loop().run_in_executor(executor, call)
+
+
+def database(func):
+    """Make a blocking function that queries the database awaitable"""
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run(func, *args, **kwargs)
+
+    return wrapper
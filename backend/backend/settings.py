@@ -109,12 +109,77 @@ TEMPLATES = [
 # WSGI_APPLICATION = 'backend.wsgi.application'
 ASGI_APPLICATION = "backend.asgi.application"  # new
 
-CHANNEL_LAYERS = {
-    "default": {
-        "BACKEND": "channels.layers.InMemoryChannelLayer",
-    },
-}
+# With REDIS_URLS set (comma separated, e.g. redis://redis:6379/0) every ASGI
+# process shares a Redis channel layer, so the backend can run as several
+# workers; channels and groups are sharded over the listed hosts. Without it
+# the layer is in-memory and the backend must run as a single process.
+REDIS_URLS = env.list("REDIS_URLS", default=[])
+
+if REDIS_URLS:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.core.RedisChannelLayer",
+            "CONFIG": {
+                "hosts": REDIS_URLS,
+                # Game sockets get bursts of group messages (start, timers,
+                # round events): allow more than the default 100 per channel,
+                # but drop them quickly, a late game message is useless.
+                "capacity": env.int("CHANNEL_LAYER_CAPACITY", default=1000),
+                "expiry": env.int("CHANNEL_LAYER_EXPIRY", default=10),
+                "group_expiry": env.int("CHANNEL_LAYER_GROUP_EXPIRY", default=3600),
+            },
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels.layers.InMemoryChannelLayer",
+        },
+    }
+
+# Where waiting players are kept: "local" pairs within one process, "redis"
+# (the default with REDIS_URLS) pairs across every worker sharing the Redis.
+MATCHMAKING_STORE = env.str("MATCHMAKING_STORE", default="redis" if REDIS_URLS else "local")
+
+# Pong physics steps per second. Collisions are swept, so lowering it does
+# not change the game, it only saves CPU.
+GAME_TICK_RATE = env.int("GAME_TICK_RATE", default=60)
 
+# State snapshots are sent to the players at this (lower or equal) rate. The
+# client draws the last snapshot as is, without interpolating, so a lower
+# rate is a lower frame rate for the players: keep every tick by default.
+GAME_SNAPSHOT_RATE = env.int("GAME_SNAPSHOT_RATE", default=GAME_TICK_RATE)
+
+# Paddle inputs a single connection may send per second; more are dropped.
+GAME_MAX_INPUT_RATE = env.int("GAME_MAX_INPUT_RATE", default=120)
+
+# Ball state frames per second sent to spectators of a match.
+GAME_SPECTATOR_RATE = env.int("GAME_SPECTATOR_RATE", default=15)
+
+# Record every Pong match (seed and inputs) as a GameReplay for playback.
+GAME_RECORD_REPLAYS = env.bool("GAME_RECORD_REPLAYS", default=True)
+
+# Number of separate processes Pong simulations are sharded over (pinned by
+# room name). 0 runs them on the ASGI server's own event loop.
+GAME_SIMULATION_WORKERS = env.int("GAME_SIMULATION_WORKERS", default=0)
+
+# "numpy" advances the balls of all Pong games in one vectorized step;
+# "python" steps every game on its own. Falls back to "python" without numpy.
+GAME_PHYSICS_ENGINE = env.str("GAME_PHYSICS_ENGINE", default="python")
+
+# Game and Othello rooms older than this (seconds) are dropped by the room
+# reaper even if their sockets never cleaned up after them.
+GAME_ROOM_TTL = env.int("GAME_ROOM_TTL", default=3600)
+
+# Finished Pong matches are written to the database in batches, at most this
+# many seconds after they end.
+GAME_RESULTS_FLUSH_INTERVAL = env.float("GAME_RESULTS_FLUSH_INTERVAL", default=1.0)
+
+# Processes the Othello AI searches run in, and how many search jobs may be
+# queued or running at once before new searches fall back to a one-ply move.
+# A hard-mode search is split over the workers that are idle.
+OTHELLO_AI_WORKERS = env.int("OTHELLO_AI_WORKERS", default=os.cpu_count() or 1)
+OTHELLO_AI_MAX_PENDING = env.int("OTHELLO_AI_MAX_PENDING", default=64)
 
 DATABASES = {
     "default": {
@@ -127,6 +192,12 @@ DATABASES = {
     }
 }
 
+# Threads async code (consumers, games) runs its ORM calls on, see
+# backend/database.py. Each keeps a connection of its own open for up to
+# DATABASE_CONN_MAX_AGE seconds; views keep the default of one per request.
+DATABASE_THREADS = env.int("DATABASE_THREADS", default=4)
+DATABASE_CONN_MAX_AGE = env.int("DATABASE_CONN_MAX_AGE", default=60)
+
 AUTH_USER_MODEL = "accounts.User"
 
 REST_FRAMEWORK = {
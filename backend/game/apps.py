@@ -1,6 +1,25 @@
+import logging
+
 from django.apps import AppConfig
 
+logger = logging.getLogger(__name__)
+
 
 class GameConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'game'
+
+    def ready(self):
+        from django.conf import settings
+        from .metrics import observe_tick
+        from .scheduler import scheduler, snapshot_interval
+
+        scheduler.observers.append(observe_tick)
+        if settings.GAME_PHYSICS_ENGINE != "numpy":
+            return
+        try:
+            from .batch_physics import BatchPhysics
+        except ImportError:
+            logger.warning("numpy is not installed, using the Python Pong physics")
+            return
+        scheduler.engine = BatchPhysics(snapshot_interval(settings.GAME_SNAPSHOT_RATE))
@@ -0,0 +1,172 @@
+import numpy as np
+
+from .physics import MAX_BOUNCES, SPEED_RAMP
+
+
+def _time_to_travel(distance, speed):
+    # physics.time_to_travel over arrays, with the same rounding.
+    distance = np.maximum(distance, 0.0)
+    return 2 * distance / (speed + np.sqrt(speed * speed + 2 * SPEED_RAMP * distance))
+
+
+def _move(x, y, dx, dy, t):
+    # The moves of physics.sweep over arrays, with the same rounding.
+    sx = np.where(dx >= 0, SPEED_RAMP, -SPEED_RAMP)
+    sy = np.where(dy >= 0, SPEED_RAMP, -SPEED_RAMP)
+    half = t * t / 2
+    return x + (dx * t + sx * half), y + (dy * t + sy * half), dx + sx * t, dy + sy * t
+
+
+class BatchPhysics:
+    """Ball physics of every running round, advanced in one vectorized step.
+
+    Balls and paddles live in structure-of-arrays buffers, one slot per
+    GameLoop, instead of in each game's ``Ball``. The rules are the ones of
+    ``physics.sweep``: the ball moves, speeding up, until it meets a wall,
+    where it bounces, or a side, where it bounces off the paddle or scores.
+    Each pass handles the next collision of every ball that has one before
+    the end of the tick, so a tick takes as many passes as the most bounces
+    a ball makes in it, usually one. A game's ``ball`` and ``ticks`` are only
+    written back when it needs them (to build a frame, or when it leaves the
+    engine).
+    """
+
+    FIELDS = ("x", "y", "dx", "dy", "radius", "width", "height", "paddle", "left", "right", "duration")
+    COUNTERS = ("ticks", "published")
+
+    def __init__(self, snapshot_every=1, capacity=64):
+        self.snapshot_every = snapshot_every
+        self.games = []
+        self.slots = {}
+        for field in self.FIELDS:
+            setattr(self, field, np.zeros(capacity))
+        for field in self.COUNTERS:
+            setattr(self, field, np.zeros(capacity, dtype=np.int64))
+
+    def __len__(self):
+        return len(self.games)
+
+    def __contains__(self, game):
+        return game in self.slots
+
+    def add(self, game):
+        if game in self.slots:
+            return
+        slot = len(self.games)
+        if slot == len(self.x):
+            self._grow()
+        self.games.append(game)
+        self.slots[game] = slot
+        ball = game.ball
+        self.x[slot] = ball.x
+        self.y[slot] = ball.y
+        self.dx[slot] = ball.dx
+        self.dy[slot] = ball.dy
+        self.radius[slot] = ball.radius
+        self.width[slot] = game.canvas_width
+        self.height[slot] = game.canvas_height
+        self.paddle[slot] = game.racquet["height"]
+        self.left[slot] = game.controler.y
+        self.right[slot] = game.opponent.y
+        self.duration[slot] = game.step
+        self.ticks[slot] = game.ticks
+        self.published[slot] = game.last_snapshot
+        game.engine = self
+
+    def remove(self, game):
+        slot = self.slots.pop(game, None)
+        if slot is None:
+            return
+        self.sync(game, slot)
+        game.engine = None
+        last = len(self.games) - 1
+        moved = self.games.pop()
+        if slot != last:
+            # Keep the buffers dense: the last game takes the freed slot.
+            self.games[slot] = moved
+            self.slots[moved] = slot
+            for field in self.FIELDS + self.COUNTERS:
+                array = getattr(self, field)
+                array[slot] = array[last]
+
+    def tick(self, game):
+        return int(self.ticks[self.slots[game]])
+
+    def set_paddle(self, game, left, y):
+        slot = self.slots.get(game)
+        if slot is not None:
+            (self.left if left else self.right)[slot] = y
+
+    def sync(self, game, slot=None):
+        """Write a game's state back to its ``ball`` and ``ticks``"""
+        if slot is None:
+            slot = self.slots[game]
+        ball = game.ball
+        ball.x = float(self.x[slot])
+        ball.y = float(self.y[slot])
+        ball.dx = float(self.dx[slot])
+        ball.dy = float(self.dy[slot])
+        game.ticks = int(self.ticks[slot])
+
+    def due(self):
+        """Games whose next snapshot is due, marked as published"""
+        n = len(self.games)
+        ticks, published = self.ticks[:n], self.published[:n]
+        slots = np.flatnonzero(ticks - published >= self.snapshot_every)
+        published[slots] = ticks[slots]
+        return [self.games[slot] for slot in slots]
+
+    def step(self):
+        """Advance every game one tick; return ``(game, scorer)`` for points"""
+        n = len(self.games)
+        if not n:
+            return []
+        self.ticks[:n] += 1
+        points = []
+        # Slots of the balls still moving this tick, and their time left.
+        moving = np.arange(n)
+        remaining = self.duration[:n].copy()
+        for _ in range(MAX_BOUNCES):
+            x, y, dx, dy = self.x[moving], self.y[moving], self.dx[moving], self.dy[moving]
+            radius = self.radius[moving]
+            rightward = dx >= 0
+            speed_y, speed_x = np.abs(dy), np.abs(dx)
+            wall = np.where(dy >= 0, self.height[moving] - radius - y, y - radius)
+            side = np.where(rightward, self.width[moving] - radius - x, x - radius)
+            ramped = SPEED_RAMP * remaining * remaining / 2
+            free = (wall > speed_y * remaining + ramped) & (side > speed_x * remaining + ramped)
+            to_wall = _time_to_travel(wall, speed_y)
+            to_side = _time_to_travel(side, speed_x)
+            t = np.minimum(to_wall, to_side)
+            done = free | (t > remaining)
+            x, y, dx, dy = _move(x, y, dx, dy, np.where(done, remaining, t))
+            remaining -= t
+
+            bounced = ~done & (to_wall <= to_side)
+            np.negative(dy, out=dy, where=bounced)
+            reached = ~done & ~bounced
+            top = np.where(rightward, self.right[moving], self.left[moving])
+            hit = reached & (top <= y) & (y <= top + self.paddle[moving])
+            np.negative(dx, out=dx, where=hit)
+            self.x[moving], self.y[moving], self.dx[moving], self.dy[moving] = x, y, dx, dy
+
+            missed = reached & ~hit
+            # A miss on the left side is a point for the opponent, and vice versa.
+            for slot, right in zip(moving[missed], rightward[missed]):
+                game = self.games[slot]
+                points.append((game, game.controler if right else game.opponent))
+            bouncing = ~done & ~missed
+            moving, remaining = moving[bouncing], remaining[bouncing]
+            if not len(moving):
+                break
+        else:
+            x, y, dx, dy = _move(
+                self.x[moving], self.y[moving], self.dx[moving], self.dy[moving], remaining
+            )
+            self.x[moving], self.y[moving], self.dx[moving], self.dy[moving] = x, y, dx, dy
+        return points
+
+    def _grow(self):
+        for field in self.FIELDS + self.COUNTERS:
+            array = getattr(self, field)
+            setattr(self, field, np.concatenate([array, np.zeros_like(array)]))
@@ -0,0 +1,59 @@
+import json
+import asyncio
+
+
+class Frame:
+    """A message encoded once and shared as-is by every subscriber"""
+
+    __slots__ = ("message", "status", "_text", "binary", "snapshot")
+
+    def __init__(self, message, binary=None, snapshot=None, text=None, status=None):
+        self.message = message
+        # "Game" for ball state snapshots, which later ones supersede.
+        self.status = message.get("status") if status is None and message else status
+        self._text = text
+        # Optional binary encodings, one per side (see protocol.pack_state).
+        self.binary = binary
+        # Optional protocol.Snapshot for subscribers using delta frames.
+        self.snapshot = snapshot
+
+    @property
+    def text(self):
+        # Only encoded when a JSON subscriber asks for it, then reused.
+        if self._text is None:
+            self._text = json.dumps({"message": self.message})
+        return self._text
+
+
+class RoomBroadcast:
+    """Fans the messages of one game room out to its subscribed sockets.
+
+    Frames go straight to the subscribed consumers instead of through the
+    channel layer, which would copy the message for every group member and
+    have each consumer run ``json.dumps`` on it again.
+    """
+
+    def __init__(self, subscribers=()):
+        self.subscribers = dict.fromkeys(subscribers)
+
+    def subscribe(self, consumer):
+        self.subscribers[consumer] = None
+
+    def unsubscribe(self, consumer):
+        self.subscribers.pop(consumer, None)
+
+    def __len__(self):
+        return len(self.subscribers)
+
+    async def publish(self, message, binary=None, snapshot=None):
+        await self.deliver(Frame(message, binary, snapshot))
+
+    async def deliver(self, frame):
+        subscribers = list(self.subscribers)
+        if len(subscribers) == 1:
+            await subscribers[0].send_frame(frame)
+        elif subscribers:
+            # A socket failing mid-send must not stop the others' frames.
+            await asyncio.gather(
+                *(s.send_frame(frame) for s in subscribers), return_exceptions=True
+            )
@@ -2,10 +2,30 @@ import json
 import asyncio
 import logging
 import random
+from django.conf import settings
+from .scheduler import scheduler, snapshot_interval
+from .protocol import FORMAT_BINARY, FORMAT_DELTA, negotiate, pack_state, quantize, Snapshot, SnapshotHistory
+from .broadcast import RoomBroadcast
+from .replay import ReplayRecorder, quantize_paddle
+from .physics import LEFT, REFERENCE_RATE, Ball, sweep
+from .results import results
+from backend.database import database
+logger = logging.getLogger(__name__)
+
+
+@database
+def create_replay(**fields):
+    from .models import GameReplay
+    return GameReplay.objects.create(**fields)
+
+
 class GameLoop :
-    def __init__(self, controler, opponent):
+    def __init__(self, controler, opponent, seed=None, record=None, tick_rate=None, save_result=True):
         self.controler = controler
         self.opponent = opponent
+        self.broadcast = RoomBroadcast((controler, opponent))
+        # A spectators.SpectatorTier, subscribed once someone watches the room.
+        self.spectators = None
         self.controler.score = 0
         self.opponent.score = 0
         self.active = False
@@ -18,34 +38,77 @@ class GameLoop :
         self.task = None
         self.pause = False
         self._game_over = False
-        self.ball_direction = random.choice([-1, 1])
+        self._round = None
+        self.ticks = 0
+        self.frames = None
+        self.snapshot = None
+        # Physics runs at the scheduler's rate, state goes out at GAME_SNAPSHOT_RATE.
+        self.tick_rate = scheduler.rate if tick_rate is None else tick_rate
+        # How far a tick moves the ball, in 1/REFERENCE_RATE s.
+        self.step = REFERENCE_RATE / self.tick_rate
+        self.snapshot_every = snapshot_interval(settings.GAME_SNAPSHOT_RATE, self.tick_rate)
+        self.last_snapshot = 0
+        self.seq = 0
+        self.history = SnapshotHistory()
+        # Set by the scheduler's batch engine while this game's ball lives there.
+        self.engine = None
+        # Every random draw of a match comes from this seeded generator, so the
+        # seed and the recorded inputs are enough to replay it.
+        self.seed = random.getrandbits(32) if seed is None else seed
+        self.rng = random.Random(self.seed)
+        if record is None:
+            record = settings.GAME_RECORD_REPLAYS
+        self.recorder = ReplayRecorder(self.seed, self.tick_rate) if record else None
+        # Cleared once the result is queued for the database, or for games
+        # that must not count (replays, benchmarks).
+        self.save_result = save_result
+        # Player id of each side as its socket authenticated, None until it
+        # sent its first data or when it did not ask for the match to count.
+        self.result_ids = [None, None]
+        self.ball_direction = self.rng.choice([-1, 1])
         
 
     async def assign_racquet(self, data, ws):
+        y = quantize_paddle(data['y'])
         if ws == self.controler:
-            self.controler.y = data['y']
+            self.controler.y = y
         else:
-            self.opponent.y = data['y']
+            self.opponent.y = y
+        if self.engine:
+            self.engine.set_paddle(self, ws == self.controler, y)
+        if self.recorder:
+            self.recorder.move(self.current_tick(), 0 if ws == self.controler else 1, y)
+
+    def current_tick(self):
+        return self.engine.tick(self) if self.engine else self.ticks
 
 
     async def rounds_loop(self):
         self._rounds = 5
         for i in range(1, self._rounds + 1):
-            if i % 4 == 1 or i % 4 == 3:
-                self.ball_direction *= -1
-            await self.round_start(i)
-            await self.reset_players()
+            await self.begin_round(i)
             self.active = True
             await asyncio.sleep(4)
             try:
-                await self.game_loop()
-            except Exception as e:
+                scored = await self.game_loop() is not None
+            except Exception:
+                logger.exception("A round of a game failed")
+                scored = True
+            if scored:
                 self.active = False
                 self.break_loop = True
                 await self.round_over()
                 if self.controler.score >= 3 or self.opponent.score >= 3:
                     return 
 
+    async def begin_round(self, round):
+        if round % 4 == 1 or round % 4 == 3:
+            self.ball_direction *= -1
+        if self.recorder:
+            self.recorder.round(self.ticks, round, self.canvas_width, self.canvas_height, self.racquet['height'])
+        await self.round_start(round)
+        await self.reset_players()
+
     async def main(self):
         await self.rounds_loop()
         await self.game_over()
@@ -64,6 +127,8 @@ class GameLoop :
         self.opponent = None
 
     async def forfit(self, ws):
+        if self.recorder:
+            self.recorder.forfeit(self.current_tick(), 0 if ws == self.controler else 1)
         self.opponent.score = 0
         self.controler.score = 0
         if ws == self.controler:
@@ -75,86 +140,145 @@ class GameLoop :
     async def assign_data(self, data, ws):
         self.canvas_width = data['canvas_width']
         self.canvas_height = data['canvas_height']
-        self.reset_players()
+        await self.reset_players()
         self.racquet = data['racquet']
+        ws.frame_format = negotiate(data.get('protocol'))
+        # The id a client claims is only shown; results go to the player the
+        # socket authenticated as.
+        player_id = getattr(ws, 'player_id', None)
         if ws == self.controler:
-            self.controler.id = data['id']
+            self.controler.id = data['id'] if player_id is None else player_id
+            ws.side = 0
         else:
-            self.opponent.id = data['id']
+            self.opponent.id = data['id'] if player_id is None else player_id
+            ws.side = 1
+        if data.get('save') is True:
+            self.result_ids[ws.side] = player_id
         self.ready += 1
         if self.ready == 2:
             self.task = asyncio.create_task(self.main())
             self.ready = 0
 
 
-    async def calculate_ball_movement(self):
-        if self.data['ball_y'] + self.data['ball_radius'] >= self.canvas_height or self.data['ball_y'] - self.data['ball_radius'] <= 0:
-            self.data['ball_dy'] = -self.data['ball_dy']
-
-        if self.data['ball_x'] - self.data['ball_radius'] <= 0: 
-            if self.data['ball_y'] >= self.controler.y and self.data['ball_y'] <= self.controler.y + self.racquet['height']:
-                self.data['ball_dx'] = -self.data['ball_dx']
-            else:
-                self.opponent.score += 1
-                raise Exception("Round Over")
-    
-        elif self.data['ball_x'] + self.data['ball_radius'] >= self.canvas_width: 
-            if self.data['ball_y'] >= self.opponent.y and self.data['ball_y'] <= self.opponent.y + self.racquet['height']:
-                self.data['ball_dx'] = -self.data['ball_dx']
-            else:
-                self.controler.score += 1
-                raise Exception("Round Over")
-        if(self.data['ball_dx'] < 0):
-            self.data['ball_dx'] -= 0.01
-        else:
-            self.data['ball_dx'] += 0.01
-        if(self.data['ball_dy'] < 0):
-            self.data['ball_dy'] -= 0.01
-        else:
-            self.data['ball_dy'] += 0.01
+    def calculate_ball_movement(self):
+        """Sweep the ball through one tick; return the player who scored, or None"""
+        missed = sweep(
+            self.ball, self.step, self.canvas_width, self.canvas_height,
+            self.racquet['height'], self.controler.y, self.opponent.y,
+        )
+        if missed is None:
+            return None
+        # A miss on the left side is a point for the opponent, and vice versa.
+        return self.opponent if missed == LEFT else self.controler
     
 
-    async def store_data(self):
+    def store_data(self):
+        self.seq += 1
+        ball = self.ball
+        controler, opponent = self.controler, self.opponent
+        mirrored_x = self.canvas_width - ball.x
         self.ball_data = {
             'status': 'Game',
+            'seq': self.seq,
+            'tick': self.ticks,
             'player_1': {
-                'id': self.opponent.id,
-                'ball_x':  self.canvas_width - self.data['ball_x'],
-                'ball_dx': -self.data['ball_dx'],
-                'y': self.opponent.y
+                'id': opponent.id,
+                'ball_x': mirrored_x,
+                'ball_dx': -ball.dx,
+                'y': opponent.y
                 
             },
             'player_2': {
-                'id': self.controler.id,
-                'ball_x': self.data['ball_x'],
-                'ball_dx': self.data['ball_dx'],
-                'y': self.controler.y
+                'id': controler.id,
+                'ball_x': ball.x,
+                'ball_dx': ball.dx,
+                'y': controler.y
             },
             'ball': {
-                'y': self.data['ball_y'],
-                'radius': self.data['ball_radius'],
-                'dy': self.data['ball_dy']
+                'y': ball.y,
+                'radius': ball.radius,
+                'dy': ball.dy
             },
         }
+        formats = (getattr(controler, 'frame_format', None), getattr(opponent, 'frame_format', None))
+        self.frames = None
+        self.snapshot = None
+        if FORMAT_BINARY in formats:
+            # One packed frame per side, indexed by the consumer's `side`.
+            self.frames = [
+                pack_state(self.ticks, ball.x, ball.y, ball.dx, ball.dy, ball.radius, controler.y, opponent.y),
+                pack_state(self.ticks, mirrored_x, ball.y, -ball.dx, ball.dy, ball.radius, opponent.y, controler.y),
+            ]
+        if FORMAT_DELTA in formats:
+            sides = (
+                quantize(ball.x, ball.y, ball.dx, ball.dy, controler.y, opponent.y),
+                quantize(mirrored_x, ball.y, -ball.dx, ball.dy, opponent.y, controler.y),
+            )
+            self.snapshot = Snapshot(self.seq, self.ticks, ball.radius, sides, self.history)
 
 
+    def serve(self):
+        if self.recorder:
+            self.recorder.serve(self.ticks)
+        self.ball = Ball(
+            self.canvas_width / 2,
+            self.canvas_height / 2,
+            10  * self.ball_direction,
+            7 * self.rng.choice([-1, 1]),
+            12,
+        )
+
     async def game_loop(self):
-        self.data = {
-            'ball_x': self.canvas_width / 2,
-            'ball_y': self.canvas_height / 2,
-            'ball_radius': 12,
-            'ball_dx': 10  * self.ball_direction,
-            'ball_dy': 7 * random.choice([-1, 1])
-        }
-        while self.active:
-            if self.pause:
-                await asyncio.sleep(0.01667)
-                continue
-            self.data['ball_x'] += self.data['ball_dx']
-            self.data['ball_y'] += self.data['ball_dy']
-            await self.calculate_ball_movement()
-            await self.store_data()
-            await asyncio.gather(self.send_message(self.ball_data), asyncio.sleep(0.01667))                 
+        self.serve()
+        # The round is driven by the shared scheduler, which calls tick()
+        # once per timestep until the round future is resolved.
+        self._round = asyncio.get_running_loop().create_future()
+        scheduler.add(self, paused=self.pause)
+        try:
+            # The player who scored, None when the round was stopped.
+            return await self._round
+        finally:
+            scheduler.remove(self)
+            self._round = None
+
+    async def tick(self, send=True):
+        if not self.active:
+            self._end_round(None)
+            return
+        try:
+            scorer = self.advance()
+        except Exception as e:
+            self._end_round(e)
+            return
+        if scorer is not None:
+            self.score_point(scorer)
+        elif send and self.ticks - self.last_snapshot >= self.snapshot_every:
+            await self.publish()
+
+    def advance(self):
+        """Step the ball one tick; return the player who scored, or None"""
+        self.ticks += 1
+        return self.calculate_ball_movement()
+
+    async def publish(self):
+        if not self.active:
+            self._end_round(None)
+            return
+        self.last_snapshot = self.ticks
+        self.store_data()
+        await self.send_message(self.ball_data, self.frames, self.snapshot)
+
+    def score_point(self, player):
+        player.score += 1
+        self._end_round(player)
+
+    def _end_round(self, result):
+        scheduler.remove(self)
+        if self._round and not self._round.done():
+            if isinstance(result, Exception):
+                self._round.set_exception(result)
+            else:
+                self._round.set_result(result)
 
 
     async def round_start(self, round):
@@ -178,11 +302,9 @@ class GameLoop :
         await self.send_message(message)
 
 
-    async def send_message(self, message):
-        if self.controler:
-            await self.controler.send_message(message, 'game_message')
-        elif self.opponent:
-            await self.opponent.send_message(message, 'game_message')
+    async def send_message(self, message, frames=None, snapshot=None):
+        # Encoded once, then the same payload goes to every subscriber.
+        await self.broadcast.publish(message, frames, snapshot)
 
 
 
@@ -221,9 +343,51 @@ class GameLoop :
             }
         await self.send_message(message)
         self.active = False
+        self.queue_result()
+        await self.save_replay()
+
+    def queue_result(self):
+        save, self.save_result = self.save_result, False
+        if not save or not self.controler or not self.opponent:
+            return
+        # Only matches both authenticated players asked to count are recorded.
+        if None in self.result_ids:
+            return
+        results.put(*self.result_ids, self.controler.score, self.opponent.score)
+
+    async def save_replay(self):
+        recorder, self.recorder = self.recorder, None
+        if not recorder or not recorder.rounds:
+            return
+        recorder.end(self.current_tick())
+        try:
+            await create_replay(
+                seed=recorder.seed,
+                player_1=self.controler.id if self.controler else None,
+                player_2=self.opponent.id if self.opponent else None,
+                player_1_score=self.controler.score if self.controler else 0,
+                player_2_score=self.opponent.score if self.opponent else 0,
+                ticks=self.ticks,
+                log=recorder.dump(),
+            )
+        except Exception:
+            logger.exception("Could not save the replay of a game")
+
+    def close(self):
+        """Stop a room the reaper dropped, without a result or a replay"""
+        self.active = False
+        self.break_loop = True
+        self._game_over = True
+        self.recorder = None
+        self.save_result = False
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        scheduler.remove(self)
 
     async def pause_game(self):
         self.pause = True
+        scheduler.suspend(self)
         message = {
             'status': 'Pause'
         }
@@ -231,6 +395,7 @@ class GameLoop :
 
     async def resume_game(self):
         self.pause = False
+        scheduler.resume(self)
         message = {
             'status': 'Resume'
         }
@@ -2,9 +2,19 @@ import time
 import asyncio
 import json
 from channels.generic.websocket import AsyncWebsocketConsumer
-from . clients import GameLoop
-from asgiref.sync import sync_to_async
-game_queue = {}
+from channels.layers import get_channel_layer
+from . workers import WorkerHandle, create_game
+from . matchstore import get_match_store
+from . protocol import FORMAT_JSON, FORMAT_BINARY, FORMAT_DELTA
+from . inputs import InputCoalescer
+from . spectators import SpectatorTier
+from . registry import Registry, approximate_size
+from . scheduler import scheduler
+from . metrics import ACTIVE_ROOMS, FRAMES_SENT, GROUP_SEND_LATENCY, QUEUED_PLAYERS
+from django.conf import settings
+from backend.database import database
+from Player.Models.PlayerModel import Player
+from Player.Models.StatsModel import Stats
 import logging
 
 async def join_room(client):
@@ -13,16 +23,6 @@ async def join_room(client):
         client.channel_name
     )
 
-async def add_to_room(opponent, controler):
-	await join_room(opponent)
-	await join_room(controler)
-
-def add_to_game_queue(client, queue):
-    if client.room_group_name not in queue:
-        queue[client.room_group_name] = []
-    queue[client.room_group_name].append(client)
-	# add client to queue depending on the room_group_name
-
 async def remove_from_channel_layer(player):
     await player.channel_layer.group_discard(
         player.room_group_name,
@@ -30,6 +30,12 @@ async def remove_from_channel_layer(player):
     )
 
 
+async def group_send(client, event):
+    start = time.perf_counter()
+    await client.channel_layer.group_send(client.room_group_name, event)
+    GROUP_SEND_LATENCY.observe(time.perf_counter() - start)
+
+
 async def timer(client, seconds):
     for i in range(seconds):
         message = { 'time' : seconds - (i + 1) }
@@ -37,21 +43,47 @@ async def timer(client, seconds):
 
 # async def is_already_in_queue(client, queue):
 
+
+async def close_room(room, game):
+    game.close()
+    # Closes whatever sockets are still in the room.
+    await get_channel_layer().group_send(room, {'type': 'terminate_game'})
+
+
+def room_size(game):
+    # Sockets, simulation workers and the batch engine are shared by the process.
+    return approximate_size(game, exclude=(AsyncWebsocketConsumer, PeerSocket, WorkerHandle, type(scheduler.engine)))
+
+
 class GameConsumer(AsyncWebsocketConsumer):
-    rooms = {}
+    rooms = Registry(
+        'game_rooms', settings.GAME_ROOM_TTL,
+        finished=lambda game: game._game_over, on_expire=close_room, sizeof=room_size,
+    )
     async def connect(self):
         self.room_name = self.scope['url_route']['kwargs']['room_name']
         self.room_group_name = self.room_name
         self.close_code = 0
         self.task = None
+        # Match results are only recorded for an authenticated player.
+        self.player_id = await get_player_id(self.scope.get('user'))
+        self.frame_format = FORMAT_JSON
+        self.side = None
+        self.acked_seq = None
+        self.inputs = InputCoalescer(self.move_paddle, settings.GAME_MAX_INPUT_RATE)
+        # Set when the room's GameLoop runs on another worker: everything
+        # this socket receives is relayed to the consumer there.
+        self.relay_to = None
+        # Players of this room whose sockets are on other workers.
+        self.peers = {}
         await self.channel_layer.group_add(
             self.room_group_name,
             self.channel_name
         )
-        add_to_game_queue(self, game_queue)
+        self.pairing = await get_match_store().join_room(self.room_group_name, self)
 
         await self.accept()
-        if len(game_queue[self.room_group_name]) == 1:
+        if not self.pairing.done():
             self.task = asyncio.create_task(self.waiting())
             
             # add variable of the task the game queue of this room
@@ -66,62 +98,110 @@ class GameConsumer(AsyncWebsocketConsumer):
             await self.close()
 
     async def start (self):
-        while len(game_queue[self.room_group_name]) < 2:
-            await asyncio.sleep(0.1)
-        if len(game_queue[self.room_group_name]) >= 2:
-            player_1 = game_queue[self.room_group_name].pop(0)
-            player_2 = game_queue[self.room_group_name].pop(0)
-            GameConsumer.rooms[self.room_group_name] = GameLoop(player_1, player_2)
-            await self.send_message({'status': 'game_start'}, function='game_message')
-
-        await self.accept()
+        player_1, player_2 = await self.pairing
+        GameConsumer.rooms[self.room_group_name] = create_game(self.room_group_name, player_1, player_2)
+        await self.send_message({'status': 'game_start'}, function='game_message')
 
     async def receive(self, text_data):
-        text_data_json = json.loads(text_data)
+        if self.relay_to:
+            await self.channel_layer.send(self.relay_to, {
+                'type': 'peer_message', 'channel': self.channel_name, 'text': text_data
+            })
+            return
+        await self.handle(json.loads(text_data), self)
+
+    async def handle(self, text_data_json, ws):
         if text_data_json['message'] == 'firstdata':
-            await GameConsumer.rooms[self.room_group_name].assign_data(text_data_json, self)
+            await GameConsumer.rooms[self.room_group_name].assign_data(text_data_json, ws)
+            if ws.frame_format != FORMAT_JSON:
+                await ws.send(text_data=json.dumps({
+                    'message': {'status': 'Protocol', 'format': ws.frame_format}
+                }))
+        if text_data_json['message'] == 'ack':
+            # A malformed ack is dropped; the next one moves the baseline on.
+            try:
+                seq = int(text_data_json['seq'])
+            except (KeyError, TypeError, ValueError):
+                seq = None
+            if seq is not None and (ws.acked_seq is None or seq > ws.acked_seq):
+                ws.acked_seq = seq
         if text_data_json['message'] == 'move':
-            await GameConsumer.rooms[self.room_group_name].assign_racquet(text_data_json, self)
+            await ws.inputs.push(text_data_json)
         if text_data_json['message'] == 'pause':
             await GameConsumer.rooms[self.room_group_name].pause_game()
         if text_data_json['message'] == 'resume':
             await GameConsumer.rooms[self.room_group_name].resume_game()
+
+    async def move_paddle(self, y):
+        game = GameConsumer.rooms.get(self.room_group_name)
+        if game:
+            await game.assign_racquet({'message': 'move', 'y': y}, self)
     
     async def disconnect(self, close_code):
         self.close_code = close_code
+        self.inputs.close()
         await remove_from_channel_layer(self)
         if self.task:
             self.task.cancel()
-        if self.room_group_name in game_queue :
-            if self in game_queue[self.room_group_name]:
-                game_queue[self.room_group_name].remove(self)
-            if game_queue[self.room_group_name] == []:
-                del game_queue[self.room_group_name]
+        await get_match_store().leave_room(self.room_group_name, self)
+        if self.relay_to:
+            await self.channel_layer.send(self.relay_to, {'type': 'peer_left', 'channel': self.channel_name})
+            return
+        await self.player_left(self)
+        # Remote players are closed by terminate_game and cannot report back.
+        for peer in list(self.peers.values()):
+            await self.player_left(peer)
+        self.peers.clear()
+
+    async def player_left(self, ws):
         if(self.room_group_name in GameConsumer.rooms):
+            GameConsumer.rooms[self.room_group_name].broadcast.unsubscribe(ws)
             GameConsumer.rooms[self.room_group_name].closed += 1
             if(GameConsumer.rooms[self.room_group_name]._game_over == False):
-                await GameConsumer.rooms[self.room_group_name].cancel_game(self)
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {
-                        'type': 'terminate_game',
-                    }
-                )
+                await GameConsumer.rooms[self.room_group_name].cancel_game(ws)
+                await group_send(self, {'type': 'terminate_game'})
             if GameConsumer.rooms[self.room_group_name].closed == 2 :
                 del GameConsumer.rooms[self.room_group_name]
+
+    async def room_paired(self, event):
+        peer = PeerSocket(self, event['channel'], event.get('player'))
+        self.peers[peer.channel_name] = peer
+        get_match_store().room_paired(self, peer)
+
+    async def peer_message(self, event):
+        peer = self.peers.get(event['channel'])
+        if peer:
+            await self.handle(json.loads(event['text']), peer)
+
+    async def peer_left(self, event):
+        peer = self.peers.pop(event['channel'], None)
+        if peer:
+            peer.inputs.close()
+            await self.player_left(peer)
+
+    async def peer_frame(self, event):
+        if event.get('bytes') is not None:
+            await self.send(bytes_data=event['bytes'])
+        else:
+            await self.send(text_data=event['text'])
         
             
     async def terminate_game(self, event):
         await self.close()
 
     async def send_message(self, message, function='game_message'):
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': function,
-                'message': message
-            }
-        )
+        await group_send(self, {'type': function, 'message': message})
+
+    async def send_frame(self, frame):
+        if frame.snapshot and self.frame_format == FORMAT_DELTA:
+            await self.send(bytes_data=frame.snapshot.encode(self.side, self.acked_seq))
+            FRAMES_SENT.labels(FORMAT_DELTA).inc()
+        elif frame.binary and self.frame_format == FORMAT_BINARY:
+            await self.send(bytes_data=frame.binary[self.side])
+            FRAMES_SENT.labels(FORMAT_BINARY).inc()
+        else:
+            await self.send(text_data=frame.text)
+            FRAMES_SENT.labels(FORMAT_JSON).inc()
     
     async def game_message(self, event):
         # try:
@@ -133,37 +213,99 @@ class GameConsumer(AsyncWebsocketConsumer):
         # except Exception as e:
         #     print("Error", e)
 
-match_making_queue = []
-def add_to_match_making_queue(client, queue):
-    queue.append(client)
-	# add client to queue depending on the room_group_name
+
+class PeerSocket:
+    """Stands in for a player whose GameConsumer is on another worker.
+
+    Frames for that player go through the channel layer to its consumer,
+    which writes them to the socket; its messages come back as peer_message
+    events to the consumer owning the room.
+    """
+
+    send_frame = GameConsumer.send_frame
+
+    def __init__(self, owner, channel_name, player_id=None):
+        self.owner = owner
+        self.channel_layer = owner.channel_layer
+        self.channel_name = channel_name
+        self.room_group_name = owner.room_group_name
+        self.frame_format = FORMAT_JSON
+        self.side = None
+        self.acked_seq = None
+        self.player_id = player_id
+        self.id = None
+        self.y = 0
+        self.score = 0
+        self.inputs = InputCoalescer(self.move_paddle, settings.GAME_MAX_INPUT_RATE)
+
+    async def send(self, text_data=None, bytes_data=None):
+        await self.channel_layer.send(self.channel_name, {
+            'type': 'peer_frame', 'text': text_data, 'bytes': bytes_data
+        })
+
+    async def move_paddle(self, y):
+        game = GameConsumer.rooms.get(self.room_group_name)
+        if game:
+            await game.assign_racquet({'message': 'move', 'y': y}, self)
+
+
+class SpectatorConsumer(AsyncWebsocketConsumer):
+    """Read-only socket following a live match at the spectator rate"""
+    async def connect(self):
+        self.room_group_name = self.scope['url_route']['kwargs']['room_name']
+        self.game = GameConsumer.rooms.get(self.room_group_name)
+        if self.game is None or self.game._game_over:
+            await self.close()
+            return
+        if self.game.spectators is None:
+            # Thinned out from the players' snapshot rate, shared by all spectators.
+            every = max(1, round(settings.GAME_SNAPSHOT_RATE / settings.GAME_SPECTATOR_RATE))
+            self.game.spectators = SpectatorTier(every)
+            self.game.broadcast.subscribe(self.game.spectators)
+        await self.accept()
+        self.game.spectators.add(self)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        pass
+
+    async def disconnect(self, close_code):
+        if self.game is not None and self.game.spectators is not None:
+            self.game.spectators.remove(self)
+
+
+@database
+def get_player_id(user):
+    if user is None or not user.is_authenticated:
+        return None
+    return Player.objects.filter(user=user).values_list('id', flat=True).first()
+
+
+@database
+def get_rating(player_id):
+    if not str(player_id).isdigit():
+        return 0
+    xp = Stats.objects.filter(stats__id=player_id).values_list('xp', flat=True).first()
+    return xp or 0
+
 
 class MatchMaikingConsumer(AsyncWebsocketConsumer):
-    rooms = {}
     async def connect(self):
         self.id = self.scope['url_route']['kwargs']['id']
         self.close_code = 0
         self.room_group_name = 0
         self.task = None
-        if not await self.is_already_in_queue(match_making_queue):
-            add_to_match_making_queue(self, match_making_queue)
+        rating = await get_rating(self.id)
+        self.pairing = await get_match_store().join_queue(self, rating)
+        if self.pairing is not None:
             await self.accept()
-            if len(match_making_queue) == 1:
-                self.task = asyncio.create_task(self.waiting())
+            self.task = asyncio.create_task(self.waiting())
         else:
             self.close_code = 4001
             await self.close()
-    async def is_already_in_queue(self, queue):
-        for client in queue:
-            if client.id == self.id:
-                return True
-        return False
-
     async def receive(self, text_data):
         data = json.loads(text_data)
-        if data['message'] == 'start':
-            MatchMaikingConsumer.rooms[self.room_group_name] += 1
-            if MatchMaikingConsumer.rooms[self.room_group_name] == 2:
+        if data['message'] == 'start' and self.room_group_name:
+            if await get_match_store().ready(self.room_group_name) == 2:
                 await timer(self, 4)
     
     async def waiting(self):
@@ -177,13 +319,10 @@ class MatchMaikingConsumer(AsyncWebsocketConsumer):
             self.close_code = close_code
             if self.task:
                 self.task.cancel()
-            if self in match_making_queue:
-                match_making_queue.remove(self)
-            if self.room_group_name and self.room_group_name in MatchMaikingConsumer.rooms:
+            await get_match_store().leave_queue(self)
+            if self.room_group_name:
                 await remove_from_channel_layer(self)
-                MatchMaikingConsumer.rooms[self.room_group_name] -= 1
-                if MatchMaikingConsumer.rooms[self.room_group_name] == 0:
-                    del MatchMaikingConsumer.rooms[self.room_group_name]
+                await get_match_store().unready(self.room_group_name)
                 # await self.channel_layer.group_send(
                 #     self.room_group_name,
                 #     {
@@ -195,33 +334,25 @@ class MatchMaikingConsumer(AsyncWebsocketConsumer):
     async def terminate_game(self, event):
         await self.close()
 
+    async def matched(self, event):
+        get_match_store().matched(self, event['pair'])
+
     async def wait_for_opponent(self):
-        while len(match_making_queue) < 2 and not self.close_code:
-            await asyncio.sleep(0.1)
-    
-        if len(match_making_queue) >= 2:
-            player_1 = match_making_queue.pop(0)
-            player_2 = match_making_queue.pop(0)
-            player_1.room_group_name = f"{player_2.id}-{player_1.id}"
-            player_2.room_group_name = f"{player_2.id}-{player_1.id}"
-            await add_to_room(player_1, player_2)
-            message = {
-                'text': 'Opponent found',
-                'room_group_name': "game_" + player_1.room_group_name,
-                'user_1': player_1.id,
-                'user_2': player_2.id,
-            }
-            await self.send_message(message=message , function='match_maiking_message')
-            MatchMaikingConsumer.rooms[self.room_group_name] = 0
+        # The opponent may be on another worker: each side joins the room
+        # group and announces the match to its own socket.
+        player_1, player_2 = await self.pairing
+        self.room_group_name = f"{player_2}-{player_1}"
+        await join_room(self)
+        message = {
+            'text': 'Opponent found',
+            'room_group_name': "game_" + self.room_group_name,
+            'user_1': player_1,
+            'user_2': player_2,
+        }
+        await self.match_maiking_message({'message': message})
 
     async def send_message(self, message, function='match_maiking_message'):
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': function,
-                'message': message
-            }
-        )
+        await group_send(self, {'type': function, 'message': message})
     
     async def match_maiking_message(self, event):
         message = event['message']
@@ -236,4 +367,9 @@ class MatchMaikingConsumer(AsyncWebsocketConsumer):
 
     async def timer_message(self, event):
         await self.match_maiking_message(event)
-        await asyncio.sleep(1)
\ No newline at end of file
+        await asyncio.sleep(1)
+
+
+ACTIVE_ROOMS.set_function(lambda: len(GameConsumer.rooms))
+QUEUED_PLAYERS.labels('game').set_function(lambda: get_match_store().waiting_rooms())
+QUEUED_PLAYERS.labels('matchmaking').set_function(lambda: get_match_store().queued())
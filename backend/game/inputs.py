@@ -0,0 +1,104 @@
+import asyncio
+import logging
+
+from .metrics import INPUTS_APPLIED, INPUTS_COALESCED, INPUTS_DROPPED
+from .scheduler import TICK_RATE
+
+logger = logging.getLogger(__name__)
+
+INPUT_BURST = 10
+
+DROP_RATE_LIMITED = "rate_limited"
+DROP_STALE = "stale"
+DROP_DUPLICATE = "duplicate"
+DROP_INVALID = "invalid"
+
+
+class InputCoalescer:
+    """Filters the paddle "move" messages of one connection.
+
+    At most one position per tick reaches the game: the first input of a tick
+    is applied right away, later ones only replace a pending position that is
+    applied when the tick is over. Inputs carrying a ``seq`` lower than one
+    already seen are stale, inputs repeating the last position are
+    duplicates; both are dropped, as is everything above ``max_rate`` inputs
+    per second (a token bucket allowing short bursts of ``burst`` inputs).
+    """
+
+    def __init__(self, apply, max_rate, burst=INPUT_BURST, window=1 / TICK_RATE):
+        self.apply = apply
+        self.max_rate = max_rate
+        self.burst = burst
+        self.window = window
+        self.tokens = burst
+        self.refilled = None
+        self.last_seq = None
+        self.last_y = None
+        self.pending = None
+        self.window_end = 0
+        self.flush_handle = None
+        self.flush_task = None
+        self.dropped = 0
+        self.coalesced = 0
+
+    async def push(self, data):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        if not self._take_token(now):
+            if not self.dropped:
+                logger.warning("Paddle inputs above %s/s, dropping", self.max_rate)
+            return self._drop(DROP_RATE_LIMITED)
+        try:
+            y = float(data['y'])
+            seq = data.get('seq')
+            seq = None if seq is None else int(seq)
+        except (KeyError, TypeError, ValueError):
+            return self._drop(DROP_INVALID)
+        if seq is not None:
+            if self.last_seq is not None and seq <= self.last_seq:
+                return self._drop(DROP_STALE)
+            self.last_seq = seq
+        if y == self.last_y:
+            return self._drop(DROP_DUPLICATE)
+        self.last_y = y
+
+        if now >= self.window_end and self.flush_handle is None:
+            self.window_end = now + self.window
+            INPUTS_APPLIED.inc()
+            await self.apply(y)
+            return
+        if self.pending is not None:
+            self.coalesced += 1
+            INPUTS_COALESCED.inc()
+        self.pending = y
+        if self.flush_handle is None:
+            self.flush_handle = loop.call_at(self.window_end, self._flush)
+
+    def close(self):
+        if self.flush_handle:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        self.pending = None
+
+    def _take_token(self, now):
+        if self.refilled is not None:
+            elapsed = now - self.refilled
+            self.tokens = min(self.burst, self.tokens + elapsed * self.max_rate)
+        self.refilled = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def _drop(self, reason):
+        self.dropped += 1
+        INPUTS_DROPPED.labels(reason).inc()
+
+    def _flush(self):
+        self.flush_handle = None
+        y, self.pending = self.pending, None
+        if y is None:
+            return
+        self.window_end = asyncio.get_running_loop().time() + self.window
+        INPUTS_APPLIED.inc()
+        self.flush_task = asyncio.ensure_future(self.apply(y))
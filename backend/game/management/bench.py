@@ -0,0 +1,57 @@
+"""Helpers shared by the game benchmark commands"""
+
+import random
+import statistics
+
+from game.othello import START_BLACK, START_WHITE, legal_moves, play, square, squares
+from game.protocol import FORMAT_JSON
+
+
+def sample_frame(tick):
+    return {
+        "status": "Game",
+        "player_1": {"id": 1, "ball_x": 150.0 - tick, "ball_dx": -10.5, "y": 75.0},
+        "player_2": {"id": 2, "ball_x": 150.0 + tick, "ball_dx": 10.5, "y": 62.5},
+        "ball": {"y": 75.0 + tick % 40, "radius": 12, "dy": 7.25},
+    }
+
+
+def percentile(samples, q):
+    if len(samples) < 2:
+        return samples[0] if samples else 0.0
+    return statistics.quantiles(samples, n=100, method="inclusive")[q - 1]
+
+
+class HeadlessPlayer:
+    """A GameConsumer stand-in without a socket: counts what it is sent"""
+
+    def __init__(self, id):
+        self.id = id
+        self.y = 0
+        self.score = 0
+        self.side = None
+        self.frame_format = FORMAT_JSON
+        self.frames = 0
+        self.bytes = 0
+
+    async def send_frame(self, frame):
+        self.frames += 1
+        self.bytes += len(frame.text)
+
+
+def othello_positions(count, plies, seed):
+    """``count`` positions ``(player, opponent)`` reached by ``plies`` random moves"""
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        player, opponent = START_BLACK, START_WHITE
+        for _ in range(plies):
+            moves = legal_moves(player, opponent)
+            if not moves:
+                player, opponent = opponent, player
+                continue
+            move = square(*rng.choice(squares(moves)))
+            opponent, player = play(player, opponent, move)
+        if legal_moves(player, opponent):
+            positions.append((player, opponent))
+    return positions
@@ -0,0 +1,92 @@
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from game.clients import GameLoop
+from game.management.bench import HeadlessPlayer
+from game.protocol import FORMAT_BINARY, FORMAT_DELTA, FORMAT_JSON
+from game.registry import approximate_size
+
+CANVAS_WIDTH = 1900
+CANVAS_HEIGHT = 900
+RACQUET = {"height": 110, "width": 8}
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the time and memory allocated per call of a Pong game's "
+        "ball physics step and state frame builder"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--ticks", type=int, default=100000)
+        parser.add_argument(
+            "--format",
+            choices=(FORMAT_JSON, FORMAT_BINARY, FORMAT_DELTA),
+            default=FORMAT_JSON,
+            help="frame format of both players, which decides what store_data builds",
+        )
+        parser.add_argument(
+            "--tick-rate",
+            type=int,
+            default=settings.GAME_TICK_RATE,
+            help="physics steps per second, which sets how far a call moves the ball",
+        )
+
+    def handle(self, *args, **options):
+        rate = options["tick_rate"]
+        game = self.make_game(options["format"], rate)
+        ticks = options["ticks"]
+        self.stdout.write(f"{'':<24} {'time':>12} {'peak alloc':>14} {'per second':>14}")
+        for name, step in (("calculate_ball_movement", game.advance), ("store_data", game.store_data)):
+            elapsed = self.time_calls(game, step, ticks)
+            peak = self.peak_allocation(game, step, min(ticks, 10000))
+            # store_data runs at the snapshot rate whatever the tick rate.
+            calls = rate if step == game.advance else rate / game.snapshot_every
+            self.stdout.write(
+                f"{name:<24} {elapsed:>9.0f} ns {peak:>8.0f} bytes {elapsed * calls / 1e3:>8.1f} us/s"
+            )
+        self.stdout.write(f"{'ball state':<24} {approximate_size(game.ball):>21} bytes")
+
+    def make_game(self, frame_format, tick_rate):
+        players = (HeadlessPlayer(1), HeadlessPlayer(2))
+        game = GameLoop(*players, seed=1, record=False, tick_rate=tick_rate)
+        game.canvas_width = CANVAS_WIDTH
+        game.canvas_height = CANVAS_HEIGHT
+        game.racquet = RACQUET
+        for side, player in enumerate(players):
+            player.side = side
+            player.frame_format = frame_format
+        game.serve()
+        return game
+
+    def follow_ball(self, game):
+        # Paddles track the ball so that rounds last.
+        for player in game.get_players():
+            player.y = game.ball.y - RACQUET["height"] / 2
+        if game.advance() is not None:
+            game.serve()
+
+    def time_calls(self, game, step, ticks):
+        total = 0
+        for _ in range(ticks):
+            self.follow_ball(game)
+            started = time.perf_counter_ns()
+            step()
+            total += time.perf_counter_ns() - started
+        return total / ticks
+
+    def peak_allocation(self, game, step, ticks):
+        """Mean of the memory a call allocates beyond what it started with"""
+        tracemalloc.start()
+        total = 0
+        for _ in range(ticks):
+            self.follow_ball(game)
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            step()
+            total += tracemalloc.get_traced_memory()[1] - before
+        tracemalloc.stop()
+        return total / ticks
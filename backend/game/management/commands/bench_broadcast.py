@@ -0,0 +1,95 @@
+import json
+import time
+import asyncio
+
+from channels.layers import InMemoryChannelLayer
+from django.core.management.base import BaseCommand
+
+from game.broadcast import RoomBroadcast
+from game.consumers import GameConsumer
+from game.management.bench import sample_frame
+from game.protocol import FORMAT_JSON
+from game.spectators import SpectatorTier
+
+GROUP = "bench_room"
+
+
+class FakeSocket:
+    """Stands in for a GameConsumer whose socket accepts frames instantly"""
+
+    frame_format = FORMAT_JSON
+    side = 0
+    send_frame = GameConsumer.send_frame
+
+    def __init__(self):
+        self.sent = 0
+
+    async def send(self, text_data=None, bytes_data=None):
+        self.sent += 1
+
+    async def close(self):
+        pass
+
+
+class Command(BaseCommand):
+    help = "Measure the per-tick cost of sending one Pong frame to a room"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--ticks", type=int, default=2000)
+        parser.add_argument("--spectators", type=int, default=50)
+
+    def handle(self, *args, **options):
+        ticks = options["ticks"]
+        self.stdout.write(
+            f"{'subscribers':>12} {'channel layer':>16} {'broadcast':>16} {'spectator tier':>16}"
+        )
+        for subscribers in (2, 2 + options["spectators"]):
+            layer = asyncio.run(self.bench_channel_layer(subscribers, ticks))
+            broadcast = asyncio.run(self.bench_broadcast(subscribers, ticks))
+            tier = asyncio.run(self.bench_spectator_tier(subscribers - 2, ticks))
+            self.stdout.write(
+                f"{subscribers:>12} {layer:>11.1f} us/t {broadcast:>11.1f} us/t"
+                f" {tier:>11.1f} us/t"
+            )
+
+    async def bench_channel_layer(self, subscribers, ticks):
+        """The previous path: group_send, then json.dumps in every consumer"""
+        layer = InMemoryChannelLayer(capacity=ticks + 1)
+        channels = [await layer.new_channel() for _ in range(subscribers)]
+        sockets = [FakeSocket() for _ in channels]
+        for channel in channels:
+            await layer.group_add(GROUP, channel)
+        start = time.perf_counter()
+        for tick in range(ticks):
+            await layer.group_send(
+                GROUP, {"type": "game_message", "message": sample_frame(tick)}
+            )
+            for channel, socket in zip(channels, sockets):
+                event = await layer.receive(channel)
+                await socket.send(text_data=json.dumps({"message": event["message"]}))
+        return (time.perf_counter() - start) / ticks * 1e6
+
+    async def bench_broadcast(self, subscribers, ticks):
+        """The room broadcast: encode once, hand the frame to every socket"""
+        broadcast = RoomBroadcast(FakeSocket() for _ in range(subscribers))
+        start = time.perf_counter()
+        for tick in range(ticks):
+            await broadcast.publish(sample_frame(tick))
+        return (time.perf_counter() - start) / ticks * 1e6
+
+    async def bench_spectator_tier(self, spectators, ticks):
+        """Players served directly, spectators behind a SpectatorTier"""
+        tier = SpectatorTier()
+        for _ in range(spectators):
+            tier.add(FakeSocket())
+        broadcast = RoomBroadcast((FakeSocket(), FakeSocket(), tier))
+        elapsed = 0
+        for tick in range(ticks):
+            start = time.perf_counter()
+            await broadcast.publish(sample_frame(tick))
+            elapsed += time.perf_counter() - start
+            # Let the spectator writers run outside of the timed section.
+            await asyncio.sleep(0)
+        for spectator in list(tier.spectators):
+            tier.remove(spectator)
+        return elapsed / ticks * 1e6
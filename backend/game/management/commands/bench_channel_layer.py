@@ -0,0 +1,67 @@
+import time
+import asyncio
+
+from channels.layers import InMemoryChannelLayer
+from django.core.management.base import BaseCommand, CommandError
+
+from game.management.bench import percentile, sample_frame
+
+GROUP = "bench_group"
+
+
+class Command(BaseCommand):
+    help = "Compare group_send latency of the in-memory and Redis channel layers"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--redis", default="redis://localhost:6379/0")
+        parser.add_argument("--members", type=int, default=2)
+        parser.add_argument("--messages", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        from channels_redis.core import RedisChannelLayer
+        from redis.exceptions import ConnectionError as RedisConnectionError
+
+        layers = [
+            ("in-memory", InMemoryChannelLayer(capacity=1000)),
+            ("redis", RedisChannelLayer(hosts=[options["redis"]], capacity=1000)),
+        ]
+        self.stdout.write(
+            f"{options['members']} members, {options['messages']} messages, times in ms"
+        )
+        self.stdout.write(
+            f"{'layer':>10} {'send p50':>9} {'send p99':>9} {'recv p50':>9} {'recv p99':>9}"
+        )
+        for name, layer in layers:
+            try:
+                send, received = asyncio.run(
+                    self.measure(layer, options["members"], options["messages"])
+                )
+            except (OSError, RedisConnectionError) as e:
+                raise CommandError(f"Could not reach {options['redis']}: {e}")
+            self.stdout.write(
+                f"{name:>10} {percentile(send, 50):>9.3f} {percentile(send, 99):>9.3f}"
+                f" {percentile(received, 50):>9.3f} {percentile(received, 99):>9.3f}"
+            )
+
+    async def measure(self, layer, members, messages):
+        """Time group_send itself and until every member received the message"""
+        channels = [await layer.new_channel() for _ in range(members)]
+        for channel in channels:
+            await layer.group_add(GROUP, channel)
+        send, received = [], []
+        try:
+            for tick in range(messages):
+                start = time.perf_counter()
+                await layer.group_send(
+                    GROUP, {"type": "game_message", "message": sample_frame(tick)}
+                )
+                sent = time.perf_counter()
+                await asyncio.gather(*(layer.receive(channel) for channel in channels))
+                done = time.perf_counter()
+                send.append((sent - start) * 1e3)
+                received.append((done - start) * 1e3)
+        finally:
+            for channel in channels:
+                await layer.group_discard(GROUP, channel)
+            await layer.flush()
+        return send, received
@@ -0,0 +1,93 @@
+import asyncio
+import time
+
+from django.core.management.base import BaseCommand
+
+from game.management.bench import othello_positions
+from game.othello_ai import LEVELS, search
+from game.othello_workers import SearchPool
+
+
+class Command(BaseCommand):
+    help = (
+        "Search a fixed set of Othello positions with the server AI and "
+        "report the depth reached and nodes searched per second"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--positions", type=int, default=8)
+        parser.add_argument(
+            "--plies", type=int, default=20, help="random moves played from the start position"
+        )
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument(
+            "--level",
+            choices=tuple(LEVELS),
+            default="ai_hard",
+            help="AI mode whose time budget and depth limit are used",
+        )
+        parser.add_argument("--budget", type=float, help="seconds per move (default: the level's)")
+        parser.add_argument("--depth", type=int, help="depth limit (default: the level's)")
+        parser.add_argument(
+            "--workers",
+            help="comma separated worker counts (e.g. 1,2,4,8): run the parallel search "
+            "in a process pool of each size and compare; use --depth to time a fixed depth",
+        )
+
+    def handle(self, *args, **options):
+        budget, max_depth, _ = LEVELS[options["level"]]
+        budget = options["budget"] or budget
+        max_depth = options["depth"] or max_depth
+        positions = othello_positions(options["positions"], options["plies"], options["seed"])
+        if options["workers"]:
+            workers = [int(count) for count in options["workers"].split(",")]
+            self.scaling(positions, budget, max_depth, workers)
+        else:
+            self.single(positions, budget, max_depth)
+
+    def single(self, positions, budget, max_depth):
+        self.stdout.write(f"{'position':<10} {'move':>8} {'depth':>6} {'nodes':>10} {'time':>9} {'nps':>10}")
+        nodes = elapsed = depth = 0
+        for index, (player, opponent) in enumerate(positions):
+            result = search(player, opponent, budget, max_depth)
+            nodes += result.nodes
+            elapsed += result.elapsed
+            depth += result.depth
+            self.stdout.write(
+                f"{index:<10} {str(result.square):>8} {result.depth:>6} {result.nodes:>10}"
+                f" {result.elapsed:>7.3f} s {result.nps:>10.0f}"
+            )
+        self.stdout.write(
+            f"{'total':<10} {'':>8} {depth / len(positions):>6.1f} {nodes:>10}"
+            f" {elapsed:>7.3f} s {nodes / elapsed:>10.0f}"
+        )
+
+    def scaling(self, positions, budget, max_depth, workers):
+        self.stdout.write(
+            f"{'workers':<8} {'depth':>6} {'nodes':>10} {'time':>9} {'nps':>10} {'speedup':>8}"
+        )
+        baseline = None
+        for count in workers:
+            depth, nodes, elapsed = asyncio.run(self.run_pool(positions, budget, max_depth, count))
+            baseline = baseline or elapsed
+            self.stdout.write(
+                f"{count:<8} {depth / len(positions):>6.1f} {nodes:>10} {elapsed:>7.3f} s"
+                f" {nodes / elapsed:>10.0f} {baseline / elapsed:>7.2f}x"
+            )
+
+    async def run_pool(self, positions, budget, max_depth, count):
+        pool = SearchPool(count, count * len(positions))
+        try:
+            # Start every worker before the clock runs.
+            await asyncio.gather(*(
+                pool.search(*positions[0], budget, 1) for _ in range(count)
+            ))
+            depth = nodes = 0
+            started = time.perf_counter()
+            for player, opponent in positions:
+                result = await pool.search(player, opponent, budget, max_depth, parallel=True)
+                depth += result.depth
+                nodes += result.nodes
+            return depth, nodes, time.perf_counter() - started
+        finally:
+            pool.shutdown()
@@ -0,0 +1,182 @@
+import time
+import random
+import asyncio
+import tracemalloc
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from game.clients import GameLoop
+from game.management.bench import HeadlessPlayer, percentile
+from game.scheduler import scheduler, snapshot_interval
+
+CANVAS_WIDTH = 1900
+CANVAS_HEIGHT = 900
+RACQUET = {"height": 110, "width": 8}
+INPUT_RATE = 30
+
+
+class Command(BaseCommand):
+    help = (
+        "Run many headless Pong games on the tick scheduler and report tick "
+        "jitter, CPU and memory per game"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--games", type=int, default=1000)
+        parser.add_argument("--seconds", type=float, default=10.0)
+        parser.add_argument(
+            "--warmup",
+            type=float,
+            default=5.0,
+            help="seconds before measuring; rounds start after a 4 s countdown",
+        )
+        parser.add_argument(
+            "--miss-rate",
+            type=float,
+            default=0.01,
+            help="chance that a scripted paddle input moves away from the ball",
+        )
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument(
+            "--engine",
+            choices=("python", "numpy"),
+            help="physics engine to step the games with (default: GAME_PHYSICS_ENGINE)",
+        )
+        parser.add_argument(
+            "--tick-rate",
+            type=int,
+            help="physics steps per second (default: GAME_TICK_RATE)",
+        )
+        parser.add_argument(
+            "--max-p99-ms",
+            type=float,
+            help="fail when the p99 tick jitter exceeds this many milliseconds",
+        )
+
+    def handle(self, *args, **options):
+        random.seed(options["seed"])
+        if options["tick_rate"]:
+            scheduler.rate = options["tick_rate"]
+            scheduler.timestep = 1 / scheduler.rate
+        if options["engine"] == "python":
+            scheduler.engine = None
+        elif options["engine"] == "numpy" or (options["tick_rate"] and scheduler.engine is not None):
+            from game.batch_physics import BatchPhysics
+
+            scheduler.engine = BatchPhysics(
+                snapshot_interval(settings.GAME_SNAPSHOT_RATE, scheduler.rate)
+            )
+        report = asyncio.run(self.run(options))
+        games = options["games"]
+        self.stdout.write(f"games                {games}")
+        engine = "numpy" if scheduler.engine is not None else "python"
+        self.stdout.write(f"physics engine       {engine}")
+        self.stdout.write(f"tick rate            {scheduler.rate} Hz")
+        self.stdout.write(f"ticks measured       {report['ticks']}")
+        self.stdout.write(
+            f"tick interval        p50 {report['interval_p50']:.3f} ms"
+            f"  p99 {report['interval_p99']:.3f} ms"
+        )
+        self.stdout.write(
+            f"tick jitter          p50 {report['jitter_p50']:.3f} ms"
+            f"  p99 {report['jitter_p99']:.3f} ms"
+        )
+        self.stdout.write(
+            f"tick duration        p50 {report['duration_p50']:.3f} ms"
+            f"  p99 {report['duration_p99']:.3f} ms"
+        )
+        self.stdout.write(f"catch-up steps       {report['catch_up']}")
+        self.stdout.write(
+            f"cpu per game         {report['cpu_per_game']:.3f} ms per second of play"
+        )
+        self.stdout.write(f"memory per game      {report['memory_per_game'] / 1024:.1f} KiB")
+        self.stdout.write(f"frames sent          {report['frames']}")
+        limit = options["max_p99_ms"]
+        if limit is not None and report["jitter_p99"] > limit:
+            raise CommandError(
+                f"p99 tick jitter {report['jitter_p99']:.3f} ms exceeds {limit} ms"
+            )
+
+    async def run(self, options):
+        count = options["games"]
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        games = [await self.start_game(i) for i in range(count)]
+        driver = asyncio.create_task(self.drive_paddles(games, options["miss_rate"]))
+        await asyncio.sleep(options["warmup"])
+        memory = (tracemalloc.get_traced_memory()[0] - baseline) / count
+        tracemalloc.stop()
+
+        wakeups = []
+
+        def observe(started, lateness, duration, steps):
+            wakeups.append((started, lateness, duration, steps))
+
+        scheduler.observers.append(observe)
+        frames = sum(game.controler.frames + game.opponent.frames for game in games)
+        cpu = time.process_time()
+        await asyncio.sleep(options["seconds"])
+        cpu = time.process_time() - cpu
+        frames = (
+            sum(game.controler.frames + game.opponent.frames for game in games) - frames
+        )
+        scheduler.observers.remove(observe)
+
+        driver.cancel()
+        for game in games:
+            if game.controler:
+                await game.cancel_game(game.controler)
+
+        if len(wakeups) < 2:
+            raise CommandError("the scheduler did not tick; is --warmup long enough?")
+        intervals = [
+            (later[0] - earlier[0]) * 1e3 for earlier, later in zip(wakeups, wakeups[1:])
+        ]
+        timestep = scheduler.timestep * 1e3
+        jitter = [abs(interval - timestep) for interval in intervals]
+        durations = [wakeup[2] * 1e3 for wakeup in wakeups]
+        return {
+            "ticks": len(wakeups),
+            "interval_p50": percentile(intervals, 50),
+            "interval_p99": percentile(intervals, 99),
+            "jitter_p50": percentile(jitter, 50),
+            "jitter_p99": percentile(jitter, 99),
+            "duration_p50": percentile(durations, 50),
+            "duration_p99": percentile(durations, 99),
+            "catch_up": sum(wakeup[3] - 1 for wakeup in wakeups),
+            "cpu_per_game": cpu * 1e3 / count / options["seconds"],
+            "memory_per_game": memory,
+            "frames": frames,
+        }
+
+    async def start_game(self, index):
+        controler = HeadlessPlayer(2 * index + 1)
+        opponent = HeadlessPlayer(2 * index + 2)
+        game = GameLoop(controler, opponent, record=False, save_result=False)
+        for player in (controler, opponent):
+            await game.assign_data(
+                {
+                    "message": "firstdata",
+                    "canvas_width": CANVAS_WIDTH,
+                    "canvas_height": CANVAS_HEIGHT,
+                    "id": player.id,
+                    "racquet": RACQUET,
+                },
+                player,
+            )
+        return game
+
+    async def drive_paddles(self, games, miss_rate):
+        """Send every player's paddle position at a client's input rate"""
+        while True:
+            for game in games:
+                ball = getattr(game, "ball", None)
+                if not ball or not game.active:
+                    continue
+                for player in game.get_players():
+                    y = ball.y - RACQUET["height"] / 2
+                    if random.random() < miss_rate:
+                        y = CANVAS_HEIGHT - RACQUET["height"] - y
+                    await game.assign_racquet({"message": "move", "y": y}, player)
+            await asyncio.sleep(1 / INPUT_RATE)
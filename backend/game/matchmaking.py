@@ -0,0 +1,188 @@
+import asyncio
+
+from sortedcontainers import SortedList
+
+
+class Matchmaker:
+    """Pairs waiting clients without polling.
+
+    Clients waiting under the same key are kept in arrival order, each parked
+    on a future. A join either parks the new client or pairs it with the
+    oldest waiter, resolving both futures with ``(waiter, client)``. Joins and
+    leaves are O(1).
+    """
+
+    def __init__(self):
+        self.waiting = {}
+        self.count = 0
+
+    def join(self, client, key=None):
+        future = asyncio.get_running_loop().create_future()
+        waiter = self._pop_waiter(key)
+        if waiter is None:
+            self.waiting.setdefault(key, {})[client] = future
+            self.count += 1
+            return future
+        first, first_future = waiter
+        pair = (first, client)
+        first_future.set_result(pair)
+        future.set_result(pair)
+        return future
+
+    def leave(self, client, key=None):
+        waiters = self.waiting.get(key)
+        if not waiters or client not in waiters:
+            return False
+        future = waiters.pop(client)
+        self.count -= 1
+        if not waiters:
+            del self.waiting[key]
+        if not future.done():
+            future.cancel()
+        return True
+
+    def waiters(self, key=None):
+        return list(self.waiting.get(key, ()))
+
+    def __len__(self):
+        return self.count
+
+    def _pop_waiter(self, key):
+        waiters = self.waiting.get(key)
+        while waiters:
+            client = next(iter(waiters))
+            future = waiters.pop(client)
+            self.count -= 1
+            if not waiters:
+                del self.waiting[key]
+            # A waiter whose wait timed out but has not left yet is skipped.
+            if not future.done():
+                return client, future
+        return None
+
+
+# Ratings are Stats.xp: a win is worth 150 xp, a league 1000.
+BASE_WINDOW = 150
+WINDOW_GROWTH = 50
+SWEEP_INTERVAL = 1
+
+
+class Ticket:
+    __slots__ = ("client", "rating", "seq", "joined", "future")
+
+    def __init__(self, client, rating, seq, joined, future):
+        self.client = client
+        self.rating = rating
+        self.seq = seq
+        self.joined = joined
+        self.future = future
+
+    @property
+    def key(self):
+        return (self.rating, self.seq)
+
+
+class RatedMatchmaker:
+    """Pairs waiting clients with the closest rating.
+
+    Waiting clients are indexed by ``client.id`` for constant-time duplicate
+    checks and leaves, and kept in a ladder sorted by rating (a SortedList, so
+    inserts and removals stay logarithmic with a long queue), where the
+    nearest opponent is found by bisection. Two clients are paired when their
+    rating gap fits the acceptable window of either; the window starts at
+    ``base_window`` and widens by ``growth`` per second of waiting. Joins pair
+    immediately when they can; a single sweep task re-examines the waiting
+    clients every ``interval`` seconds as their windows widen, and stops once
+    nobody is waiting.
+    """
+
+    def __init__(self, base_window=BASE_WINDOW, growth=WINDOW_GROWTH, interval=SWEEP_INTERVAL):
+        self.base_window = base_window
+        self.growth = growth
+        self.interval = interval
+        self.tickets = {}
+        self.ladder = SortedList()
+        self.seq = 0
+        self.task = None
+
+    def __len__(self):
+        return len(self.tickets)
+
+    def __contains__(self, id):
+        return id in self.tickets
+
+    def join(self, client, rating=0):
+        """Return a future resolving to ``(waiter, client)`` once paired"""
+        if client.id in self.tickets:
+            raise ValueError(f"{client.id} is already waiting")
+        loop = asyncio.get_running_loop()
+        self.seq += 1
+        ticket = Ticket(client, rating, self.seq, loop.time(), loop.create_future())
+        self.tickets[client.id] = ticket
+        self.ladder.add(ticket.key + (client.id,))
+        if not self._match(ticket, ticket.joined) and (self.task is None or self.task.done()):
+            self.task = asyncio.create_task(self.sweep())
+        return ticket.future
+
+    def leave(self, client):
+        ticket = self.tickets.get(client.id)
+        if ticket is None or ticket.client is not client:
+            return False
+        self._remove(ticket)
+        if not ticket.future.done():
+            ticket.future.cancel()
+        return True
+
+    def waiters(self):
+        return [ticket.client for ticket in self.tickets.values()]
+
+    def window(self, ticket, now):
+        return self.base_window + self.growth * (now - ticket.joined)
+
+    async def sweep(self):
+        loop = asyncio.get_running_loop()
+        while self.tickets:
+            await asyncio.sleep(self.interval)
+            now = loop.time()
+            # Oldest first: they have the widest windows.
+            for ticket in list(self.tickets.values()):
+                if self.tickets.get(ticket.client.id) is ticket:
+                    self._match(ticket, now)
+
+    def _match(self, ticket, now):
+        if ticket.future.done():
+            # Its wait timed out but it has not left yet.
+            self._remove(ticket)
+            return False
+        opponent = self._nearest(ticket)
+        while opponent is not None and opponent.future.done():
+            self._remove(opponent)
+            opponent = self._nearest(ticket)
+        if opponent is None:
+            return False
+        gap = abs(opponent.rating - ticket.rating)
+        if gap > max(self.window(ticket, now), self.window(opponent, now)):
+            return False
+        self._remove(ticket)
+        self._remove(opponent)
+        first, second = sorted((ticket, opponent), key=lambda t: t.seq)
+        pair = (first.client, second.client)
+        first.future.set_result(pair)
+        second.future.set_result(pair)
+        return True
+
+    def _nearest(self, ticket):
+        index = self.ladder.bisect_left(ticket.key)
+        best = None
+        for neighbour in (index - 1, index + 1):
+            if 0 <= neighbour < len(self.ladder):
+                candidate = self.tickets[self.ladder[neighbour][2]]
+                if best is None or abs(candidate.rating - ticket.rating) < abs(best.rating - ticket.rating):
+                    best = candidate
+        return best
+
+    def _remove(self, ticket):
+        if self.tickets.get(ticket.client.id) is not ticket:
+            return
+        del self.tickets[ticket.client.id]
+        self.ladder.remove(ticket.key + (ticket.client.id,))
@@ -0,0 +1,338 @@
+import time
+import asyncio
+import logging
+
+from django.conf import settings
+
+from .matchmaking import BASE_WINDOW, SWEEP_INTERVAL, WINDOW_GROWTH, Matchmaker, RatedMatchmaker
+from .registry import Registry
+
+logger = logging.getLogger(__name__)
+
+# Matchmaking state shared by the ASGI workers. Two queues live here:
+#
+#   queue   players of ws/matchmaking/<id>/, paired by rating; a pairing
+#           resolves to the two player ids
+#   rooms   the two sockets of ws/game/<room>/; a pairing resolves to
+#           ``(waiter, joiner)``, the waiter runs the GameLoop
+#
+# LocalMatchStore keeps both in process. RedisMatchStore keeps them in Redis
+# and pairs with Lua scripts, so a pop-pair is atomic across workers. The
+# side that makes a pair tells the other one through the channel layer
+# ("matched" / "room_paired" events); a game socket paired with a waiter on
+# another worker relays its messages to that worker.
+
+KEY_PREFIX = "matchmaking:"
+# A ticket older than this belongs to a socket that died without leaving.
+TICKET_MAX_AGE = 60
+ROOM_TTL = 60
+READY_TTL = 60
+
+
+def chain(inner, convert):
+    """A future resolving to ``convert(inner.result())``; cancelling it cancels inner"""
+    outer = asyncio.get_running_loop().create_future()
+
+    def forward(future):
+        if outer.done():
+            return
+        if future.cancelled():
+            outer.cancel()
+        else:
+            outer.set_result(convert(future.result()))
+
+    def backward(future):
+        if future.cancelled():
+            inner.cancel()
+
+    if inner.done():
+        forward(inner)
+    else:
+        inner.add_done_callback(forward)
+    outer.add_done_callback(backward)
+    return outer
+
+
+def pair_ids(pair):
+    first, second = pair
+    return first.id, second.id
+
+
+class LocalMatchStore:
+    """Matchmaking of a single process"""
+
+    def __init__(self):
+        self.queue = RatedMatchmaker()
+        self.rooms = Matchmaker()
+        # Expire like the Redis counters: a player who never disconnects
+        # cleanly must not hold a room's count forever.
+        self.ready_counts = Registry("matchmaking_ready", READY_TTL)
+
+    def queued(self):
+        return len(self.queue)
+
+    def waiting_rooms(self):
+        return len(self.rooms)
+
+    async def join_queue(self, consumer, rating):
+        """Return a future of the paired ids, None when already queued"""
+        if consumer.id in self.queue:
+            return None
+        return chain(self.queue.join(consumer, rating), pair_ids)
+
+    async def leave_queue(self, consumer):
+        self.queue.leave(consumer)
+
+    def matched(self, consumer, pair):
+        pass
+
+    async def join_room(self, room, consumer):
+        return self.rooms.join(consumer, room)
+
+    async def leave_room(self, room, consumer):
+        self.rooms.leave(consumer, room)
+
+    def room_paired(self, consumer, peer):
+        pass
+
+    async def ready(self, room):
+        self.ready_counts[room] = self.ready_counts.get(room, 0) + 1
+        return self.ready_counts[room]
+
+    async def unready(self, room):
+        count = self.ready_counts.get(room, 0) - 1
+        if count > 0:
+            self.ready_counts[room] = count
+        else:
+            self.ready_counts.pop(room, None)
+
+
+# KEYS: ladder (zset id -> rating), tickets (hash id -> [joined, channel])
+# ARGV: id, rating, channel, now, base window, growth, max age, insert
+# Returns nil, -1 (already queued) or {opponent id, opponent channel, 1 if
+# the opponent joined first}.
+QUEUE_MATCH = """
+local id, rating, now = ARGV[1], tonumber(ARGV[2]), tonumber(ARGV[4])
+local base, growth, max_age = tonumber(ARGV[5]), tonumber(ARGV[6]), tonumber(ARGV[7])
+if ARGV[8] == '1' then
+    if redis.call('HEXISTS', KEYS[2], id) == 1 then
+        return -1
+    end
+    redis.call('HSET', KEYS[2], id, cjson.encode({now, ARGV[3]}))
+    redis.call('ZADD', KEYS[1], rating, id)
+end
+local mine = redis.call('HGET', KEYS[2], id)
+if not mine then
+    return nil
+end
+local joined = cjson.decode(mine)[1]
+local best, best_gap
+local function consider(found)
+    for i = 1, #found, 2 do
+        local gap = math.abs(tonumber(found[i + 1]) - rating)
+        if found[i] ~= id and (not best or gap < best_gap) then
+            best, best_gap = found[i], gap
+        end
+    end
+end
+consider(redis.call('ZREVRANGEBYSCORE', KEYS[1], rating, '-inf', 'WITHSCORES', 'LIMIT', 0, 2))
+consider(redis.call('ZRANGEBYSCORE', KEYS[1], rating, '+inf', 'WITHSCORES', 'LIMIT', 0, 2))
+if not best then
+    return nil
+end
+local other = cjson.decode(redis.call('HGET', KEYS[2], best))
+if now - other[1] > max_age then
+    redis.call('ZREM', KEYS[1], best)
+    redis.call('HDEL', KEYS[2], best)
+    return nil
+end
+if best_gap > base + growth * (now - math.min(joined, other[1])) then
+    return nil
+end
+redis.call('ZREM', KEYS[1], id, best)
+redis.call('HDEL', KEYS[2], id, best)
+return {best, other[2], other[1] <= joined and 1 or 0}
+"""
+
+# KEYS: ladder, tickets  ARGV: id, channel
+QUEUE_LEAVE = """
+local ticket = redis.call('HGET', KEYS[2], ARGV[1])
+if ticket and cjson.decode(ticket)[2] == ARGV[2] then
+    redis.call('ZREM', KEYS[1], ARGV[1])
+    redis.call('HDEL', KEYS[2], ARGV[1])
+end
+"""
+
+# KEYS: room list  ARGV: channel, ttl
+ROOM_JOIN = """
+local waiter = redis.call('LPOP', KEYS[1])
+if waiter then
+    return waiter
+end
+redis.call('RPUSH', KEYS[1], ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return nil
+"""
+
+# KEYS: ready counter  ARGV: ttl
+READY = """
+local count = redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return count
+"""
+
+UNREADY = """
+if redis.call('DECR', KEYS[1]) <= 0 then
+    redis.call('DEL', KEYS[1])
+end
+"""
+
+
+class RedisMatchStore:
+    """Matchmaking shared by every worker connected to the same Redis"""
+
+    def __init__(self, url, base_window=BASE_WINDOW, growth=WINDOW_GROWTH, interval=SWEEP_INTERVAL):
+        from redis.asyncio import Redis
+
+        self.redis = Redis.from_url(url, decode_responses=True)
+        self.base_window = base_window
+        self.growth = growth
+        self.interval = interval
+        self.ladder = KEY_PREFIX + "ladder"
+        self.tickets = KEY_PREFIX + "tickets"
+        self.queue_match = self.redis.register_script(QUEUE_MATCH)
+        self.queue_leave = self.redis.register_script(QUEUE_LEAVE)
+        self.room_join = self.redis.register_script(ROOM_JOIN)
+        self.ready_script = self.redis.register_script(READY)
+        self.unready_script = self.redis.register_script(UNREADY)
+        # This worker's waiting consumers, by player id and by room.
+        self.waiting = {}
+        self.room_waiters = {}
+        self.task = None
+
+    def queued(self):
+        return len(self.waiting)
+
+    def waiting_rooms(self):
+        return sum(len(waiters) for waiters in self.room_waiters.values())
+
+    async def join_queue(self, consumer, rating):
+        """Return a future of the paired ids, None when already queued"""
+        if consumer.id in self.waiting:
+            return None
+        entry = (consumer, rating, asyncio.get_running_loop().create_future())
+        self.waiting[consumer.id] = entry
+        try:
+            found = await self._match(consumer, rating, insert=True)
+        except BaseException:
+            self._forget(entry)
+            raise
+        if found == -1:
+            # Queued through another worker.
+            self._forget(entry)
+            return None
+        future = entry[2]
+        if not future.done() and (self.task is None or self.task.done()):
+            self.task = asyncio.create_task(self.sweep())
+        return future
+
+    async def leave_queue(self, consumer):
+        entry = self.waiting.get(consumer.id)
+        if entry and entry[0] is consumer:
+            del self.waiting[consumer.id]
+            await self.queue_leave(keys=[self.ladder, self.tickets], args=[consumer.id, consumer.channel_name])
+
+    def _forget(self, entry):
+        if self.waiting.get(entry[0].id) is entry:
+            del self.waiting[entry[0].id]
+
+    def matched(self, consumer, pair):
+        """Another worker paired ``consumer``"""
+        entry = self.waiting.pop(consumer.id, None)
+        if entry and not entry[2].done():
+            entry[2].set_result(tuple(pair))
+
+    async def sweep(self):
+        while self.waiting:
+            await asyncio.sleep(self.interval)
+            for consumer, rating, future in list(self.waiting.values()):
+                if future.done():
+                    self.waiting.pop(consumer.id, None)
+                    continue
+                try:
+                    await self._match(consumer, rating, insert=False)
+                except Exception:
+                    logger.exception("Matchmaking sweep failed")
+
+    async def _match(self, consumer, rating, insert):
+        found = await self.queue_match(
+            keys=[self.ladder, self.tickets],
+            args=[
+                consumer.id, rating, consumer.channel_name, time.time(),
+                self.base_window, self.growth, TICKET_MAX_AGE, int(insert),
+            ],
+        )
+        if not found or found == -1:
+            return found
+        opponent, channel, opponent_first = found
+        pair = (opponent, consumer.id) if int(opponent_first) else (consumer.id, opponent)
+        await consumer.channel_layer.send(channel, {"type": "matched", "pair": pair})
+        self.matched(consumer, pair)
+        return found
+
+    async def join_room(self, room, consumer):
+        future = asyncio.get_running_loop().create_future()
+        waiter = await self.room_join(keys=[KEY_PREFIX + "room:" + room], args=[consumer.channel_name, ROOM_TTL])
+        if waiter is None:
+            self.room_waiters.setdefault(room, {})[consumer.channel_name] = (consumer, future)
+            return future
+        local = self.room_waiters.get(room, {}).pop(waiter, None)
+        if local and not local[1].done():
+            # Both sockets are on this worker: pair them directly.
+            pair = (local[0], consumer)
+            local[1].set_result(pair)
+            future.set_result(pair)
+            return future
+        consumer.relay_to = waiter
+        await consumer.channel_layer.send(waiter, {
+            "type": "room_paired",
+            "channel": consumer.channel_name,
+            "player": getattr(consumer, "player_id", None),
+        })
+        future.set_result((None, consumer))
+        return future
+
+    async def leave_room(self, room, consumer):
+        waiters = self.room_waiters.get(room)
+        if waiters and waiters.pop(consumer.channel_name, None):
+            if not waiters:
+                del self.room_waiters[room]
+            await self.redis.lrem(KEY_PREFIX + "room:" + room, 0, consumer.channel_name)
+
+    def room_paired(self, consumer, peer):
+        """A socket on another worker joined the room ``consumer`` waits in"""
+        waiters = self.room_waiters.get(consumer.room_group_name, {})
+        entry = waiters.pop(consumer.channel_name, None)
+        if not waiters:
+            self.room_waiters.pop(consumer.room_group_name, None)
+        if entry and not entry[1].done():
+            entry[1].set_result((consumer, peer))
+
+    async def ready(self, room):
+        return await self.ready_script(keys=[KEY_PREFIX + "ready:" + room], args=[READY_TTL])
+
+    async def unready(self, room):
+        await self.unready_script(keys=[KEY_PREFIX + "ready:" + room])
+
+
+_store = None
+
+
+def get_match_store():
+    global _store
+    if _store is None:
+        if settings.MATCHMAKING_STORE == "redis":
+            _store = RedisMatchStore(settings.REDIS_URLS[0])
+        else:
+            _store = LocalMatchStore()
+    return _store
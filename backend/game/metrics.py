@@ -0,0 +1,118 @@
+"""Prometheus metrics of the game server, exported on /metrics by django_prometheus"""
+
+from prometheus_client import Counter, Gauge, Histogram
+
+# Ticks are 16.7 ms apart at 60 Hz: resolve well below that.
+TICK_BUCKETS = (0.0005, 0.001, 0.002, 0.004, 0.008, 0.012, 0.016, 0.025, 0.05, 0.1, 0.25)
+
+TICK_DURATION = Histogram(
+    "pong_tick_duration_seconds",
+    "Time to step every game of a process once (including catch-up steps)",
+    buckets=TICK_BUCKETS,
+)
+TICK_LATENESS = Histogram(
+    "pong_tick_lateness_seconds",
+    "How late the tick scheduler woke up after its deadline",
+    buckets=TICK_BUCKETS,
+)
+TICK_CATCH_UP = Counter(
+    "pong_tick_catch_up_steps_total",
+    "Physics steps run back to back because the scheduler fell behind",
+)
+FRAMES_SENT = Counter(
+    "pong_frames_sent_total",
+    "Frames written to game sockets",
+    ["format"],
+)
+ACTIVE_ROOMS = Gauge(
+    "pong_active_rooms",
+    "Game rooms with a running or finishing match",
+)
+QUEUED_PLAYERS = Gauge(
+    "pong_queued_players",
+    "Players waiting to be paired",
+    ["queue"],
+)
+GROUP_SEND_LATENCY = Histogram(
+    "pong_group_send_seconds",
+    "Time spent in channel layer group_send by the game consumers",
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1),
+)
+
+
+INPUTS_APPLIED = Counter(
+    "pong_inputs_applied_total",
+    "Paddle inputs passed on to a game",
+)
+INPUTS_COALESCED = Counter(
+    "pong_inputs_coalesced_total",
+    "Paddle inputs replaced by a newer one within the same tick",
+)
+INPUTS_DROPPED = Counter(
+    "pong_inputs_dropped_total",
+    "Paddle inputs discarded before reaching a game",
+    ["reason"],
+)
+
+SPECTATOR_FRAMES_SKIPPED = Counter(
+    "pong_spectator_frames_skipped_total",
+    "State frames a slow spectator never received because a newer one replaced it",
+)
+
+
+def observe_tick(started, lateness, duration, steps):
+    """TickScheduler observer feeding the tick histograms"""
+    TICK_LATENESS.observe(lateness)
+    TICK_DURATION.observe(duration)
+    if steps > 1:
+        TICK_CATCH_UP.inc(steps - 1)
+
+
+REGISTRY_ENTRIES = Gauge(
+    "game_registry_entries",
+    "Entries of an in-process room registry",
+    ["registry"],
+)
+REGISTRY_BYTES = Gauge(
+    "game_registry_bytes",
+    "Approximate memory held by the entries of an in-process room registry",
+    ["registry"],
+)
+REGISTRY_REAPED = Counter(
+    "game_registry_reaped_total",
+    "Registry entries dropped by the reaper instead of their owner",
+    ["registry"],
+)
+
+RESULTS_PENDING = Gauge(
+    "game_results_pending",
+    "Finished matches waiting to be written to the database",
+)
+RESULTS_WRITTEN = Counter(
+    "game_results_written_total",
+    "Finished matches handled by the result queue: saved, dropped or failed",
+    ["outcome"],
+)
+
+# Othello AI searches last up to their level's budget (1.5 s for ai_hard).
+AI_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 1.5, 2, 3, 5)
+
+AI_PENDING = Gauge(
+    "othello_ai_pending",
+    "Othello AI search jobs queued or running; a parallel search is one per worker",
+)
+AI_JOBS = Counter(
+    "othello_ai_jobs_total",
+    "Othello AI searches by outcome: done, cancelled, rejected or failed",
+    ["outcome"],
+)
+AI_WAIT = Histogram(
+    "othello_ai_wait_seconds",
+    "Time an Othello AI search spent waiting for a worker and in transit",
+    buckets=AI_BUCKETS,
+)
+AI_SEARCH_DURATION = Histogram(
+    "othello_ai_search_seconds",
+    "Time an Othello AI search ran in its worker",
+    buckets=AI_BUCKETS,
+)
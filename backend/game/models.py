@@ -32,6 +32,25 @@ class GameHestory(models.Model):
         return str(self.player.user.username)
 
 
+class GameReplay(models.Model):
+    """A recorded Pong match: its RNG seed and the compressed input log"""
+
+    player_1 = models.IntegerField(null=True)
+    player_2 = models.IntegerField(null=True)
+    player_1_score = models.IntegerField(default=0)
+    player_2_score = models.IntegerField(default=0)
+    seed = models.BigIntegerField()
+    ticks = models.IntegerField(default=0)
+    log = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"Replay {self.id}: {self.player_1} vs {self.player_2}"
+
+
 # Othello Game Models
 class OthelloGameHistory(models.Model):
     """Store individual Othello game results"""
@@ -0,0 +1,217 @@
+"""Othello rules on bitboards.
+
+A position is two 64-bit ints, the discs of the player to move and of the
+opponent; bit ``row * 8 + col`` is the square at ``row``, ``col``. Legal
+moves and flips are found for all squares of a direction at once by
+shifting whole boards, instead of walking the eight directions square by
+square.
+"""
+
+BLACK = "B"
+WHITE = "W"
+EMPTY = "E"
+
+FULL = 0xFFFFFFFFFFFFFFFF
+# Boards shifted one column right (left) must not wrap into column 0 (7).
+NOT_COL_0 = 0xFEFEFEFEFEFEFEFE
+NOT_COL_7 = 0x7F7F7F7F7F7F7F7F
+
+# (shift, mask) of the eight directions; a negative shift moves bits down.
+DIRECTIONS = (
+    (1, NOT_COL_0),    # east
+    (-1, NOT_COL_7),   # west
+    (8, FULL),         # south
+    (-8, FULL),        # north
+    (9, NOT_COL_0),    # south-east
+    (7, NOT_COL_7),    # south-west
+    (-7, NOT_COL_0),   # north-east
+    (-9, NOT_COL_7),   # north-west
+)
+
+START_BLACK = (1 << 28) | (1 << 35)
+START_WHITE = (1 << 27) | (1 << 36)
+
+
+def opponent_of(color):
+    return WHITE if color == BLACK else BLACK
+
+
+def square(row, col):
+    """The bit of a square, 0 when it is off the board"""
+    if not (0 <= row < 8 and 0 <= col < 8):
+        return 0
+    return 1 << (row * 8 + col)
+
+
+def squares(bits):
+    """The ``(row, col)`` of every set bit, in board order"""
+    result = []
+    while bits:
+        low = bits & -bits
+        index = low.bit_length() - 1
+        result.append(divmod(index, 8))
+        bits ^= low
+    return result
+
+
+def legal_moves(player, opponent):
+    """Bitboard of the empty squares where ``player`` flips at least a disc"""
+    empty = ~(player | opponent) & FULL
+    moves = 0
+    for shift, mask in DIRECTIONS:
+        # Runs of opponent discs starting next to a player disc, grown one
+        # square at a time; a run is at most six discs long.
+        if shift > 0:
+            run = (player << shift) & mask & opponent
+            for _ in range(5):
+                run |= (run << shift) & mask & opponent
+            moves |= (run << shift) & mask & empty
+        else:
+            shift = -shift
+            run = (player >> shift) & mask & opponent
+            for _ in range(5):
+                run |= (run >> shift) & mask & opponent
+            moves |= (run >> shift) & mask & empty
+    return moves
+
+
+def flips(player, opponent, move):
+    """Bitboard of the opponent discs that ``player`` flips by playing ``move``"""
+    flipped = 0
+    for shift, mask in DIRECTIONS:
+        line = 0
+        if shift > 0:
+            bit = (move << shift) & mask
+            while bit & opponent:
+                line |= bit
+                bit = (bit << shift) & mask
+        else:
+            shift = -shift
+            bit = (move >> shift) & mask
+            while bit & opponent:
+                line |= bit
+                bit = (bit >> shift) & mask
+        if bit & player:
+            flipped |= line
+    return flipped
+
+
+def play(player, opponent, move):
+    """Discs of both sides after ``player`` plays ``move``, still ``(player, opponent)``"""
+    flipped = flips(player, opponent, move)
+    return player | flipped | move, opponent ^ flipped
+
+
+def perft(player, opponent, depth):
+    """Number of move sequences of ``depth`` plies, a pass counting as a ply.
+
+    A finished game ends its sequences early. Used to check move generation
+    against the known counts from the start position.
+    """
+    if depth == 0:
+        return 1
+    moves = legal_moves(player, opponent)
+    if not moves:
+        if not legal_moves(opponent, player):
+            return 1
+        return perft(opponent, player, depth - 1)
+    if depth == 1:
+        return moves.bit_count()
+    total = 0
+    while moves:
+        move = moves & -moves
+        moves ^= move
+        mine, theirs = play(player, opponent, move)
+        total += perft(theirs, mine, depth - 1)
+    return total
+
+
+class Board:
+    """An Othello game in progress.
+
+    The legal moves of both colours and the disc counts are kept with the
+    discs and brought up to date by every move from the flipped discs, so
+    checking a move, the score, a pass or the end of the game is a lookup.
+    ``to_move`` skips a colour that has no move: it only passes when it must.
+    """
+
+    __slots__ = ("discs", "counts", "moves", "to_move")
+
+    def __init__(self, black=START_BLACK, white=START_WHITE, to_move=BLACK):
+        self.discs = {BLACK: black, WHITE: white}
+        self.counts = {BLACK: black.bit_count(), WHITE: white.bit_count()}
+        self.moves = {BLACK: legal_moves(black, white), WHITE: legal_moves(white, black)}
+        self.to_move = to_move
+        if not self.moves[to_move]:
+            self.to_move = opponent_of(to_move)
+
+    def is_legal(self, row, col, color):
+        return bool(self.moves[color] & square(row, col))
+
+    def legal_squares(self, color):
+        return squares(self.moves[color])
+
+    def play(self, row, col):
+        """Play ``to_move`` at ``row``, ``col``, return ``(flipped, passed)``.
+
+        ``passed`` is True when the opponent has no answer, so the same
+        colour moves again.
+        """
+        color = self.to_move
+        opponent = opponent_of(color)
+        move = square(row, col)
+        flipped = flips(self.discs[color], self.discs[opponent], move)
+        self.discs[color] |= move | flipped
+        self.discs[opponent] ^= flipped
+        gained = flipped.bit_count()
+        self.counts[color] += gained + 1
+        self.counts[opponent] -= gained
+        black, white = self.discs[BLACK], self.discs[WHITE]
+        # Moves only change around the new and flipped discs, but a
+        # bitboard regeneration is as cheap as finding those squares.
+        self.moves[BLACK] = legal_moves(black, white)
+        self.moves[WHITE] = legal_moves(white, black)
+        passed = not self.moves[opponent] and bool(self.moves[color])
+        if not passed:
+            self.to_move = opponent
+        return flipped, passed
+
+    @property
+    def game_over(self):
+        return not self.moves[BLACK] and not self.moves[WHITE]
+
+    def score(self):
+        return dict(self.counts)
+
+    def winner(self):
+        if self.counts[BLACK] > self.counts[WHITE]:
+            return BLACK
+        if self.counts[WHITE] > self.counts[BLACK]:
+            return WHITE
+        return None
+
+    def rows(self):
+        return to_rows(self.discs[BLACK], self.discs[WHITE])
+
+
+def from_rows(rows):
+    """Black and white bitboards of an 8x8 list of "B"/"W"/"E" squares"""
+    black = white = 0
+    for row, cells in enumerate(rows):
+        for col, cell in enumerate(cells):
+            if cell == BLACK:
+                black |= square(row, col)
+            elif cell == WHITE:
+                white |= square(row, col)
+    return black, white
+
+
+def to_rows(black, white):
+    """The 8x8 list of "B"/"W"/"E" squares the clients draw"""
+    return [
+        [
+            BLACK if black >> index & 1 else WHITE if white >> index & 1 else EMPTY
+            for index in range(row * 8, row * 8 + 8)
+        ]
+        for row in range(8)
+    ]
@@ -0,0 +1,235 @@
+"""Othello AI: alpha-beta search on the bitboards of othello.py.
+
+The search is a negamax alpha-beta with iterative deepening. Each depth
+starts from the best move of the previous one, and a transposition table
+keeps bounds and best moves between depths. Moves are tried corners first
+and next-to-corner squares last. It stops at a deadline and plays the best
+move of the deepest completed iteration.
+
+A search can also be split over processes by root move: each part deepens
+over its share of the root moves, and the parts are merged at the deepest
+depth they all completed (see othello_workers.SearchPool).
+"""
+
+import time
+
+from .othello import FULL, flips, legal_moves
+
+# Time budget (seconds), depth limit and whether the search is split over
+# the idle AI workers, for the AI modes of OthelloGameHistory.
+LEVELS = {
+    "ai_easy": (0.05, 1, False),
+    "ai_medium": (0.3, 4, False),
+    "ai_hard": (1.5, 64, True),
+}
+
+CORNERS = 0x8100000000000081
+X_SQUARES = 0x0042000000004200
+C_SQUARES = 0x4281000000008142
+EDGES = 0x3C0081818181003C
+INNER = FULL & ~(CORNERS | X_SQUARES | C_SQUARES | EDGES)
+
+# Squares to try first, in order: good moves cut the search early.
+MOVE_ORDER = (CORNERS, EDGES, INNER, C_SQUARES, X_SQUARES)
+SQUARE_WEIGHTS = ((CORNERS, 30), (EDGES, 4), (C_SQUARES, -6), (X_SQUARES, -12))
+MOBILITY_WEIGHT = 6
+# A finished game outscores any evaluation.
+WIN = 10000
+
+EXACT, LOWER, UPPER = 0, 1, 2
+# A table kept from search to search is cleared when it reaches this many
+# entries, about 17 MB at some 270 bytes an entry.
+MAX_TABLE_SIZE = 1 << 16
+CHECK_EVERY = 1023
+
+
+class Timeout(Exception):
+    pass
+
+
+class SearchResult:
+    """The move a search chose, ``None`` when the side to move must pass"""
+
+    __slots__ = ("move", "score", "depth", "nodes", "elapsed")
+
+    def __init__(self, move, score, depth, nodes, elapsed):
+        self.move = move
+        self.score = score
+        self.depth = depth
+        self.nodes = nodes
+        self.elapsed = elapsed
+
+    @property
+    def square(self):
+        """The ``(row, col)`` of the move"""
+        if self.move is None:
+            return None
+        return divmod(self.move.bit_length() - 1, 8)
+
+    @property
+    def nps(self):
+        return self.nodes / self.elapsed if self.elapsed else 0.0
+
+
+def evaluate(player, opponent):
+    """Static score of a position for the side to move"""
+    score = MOBILITY_WEIGHT * (
+        legal_moves(player, opponent).bit_count() - legal_moves(opponent, player).bit_count()
+    )
+    for mask, weight in SQUARE_WEIGHTS:
+        score += weight * ((player & mask).bit_count() - (opponent & mask).bit_count())
+    return score
+
+
+def final_score(player, opponent):
+    """Score of a finished game for the side to move"""
+    diff = player.bit_count() - opponent.bit_count()
+    if diff > 0:
+        return WIN + diff
+    if diff < 0:
+        return diff - WIN
+    return 0
+
+
+def ordered(moves, first=0):
+    """The moves of a bitboard, ``first`` first and then by square group"""
+    result = [first] if first & moves else []
+    moves &= ~first
+    for group in MOVE_ORDER:
+        bits = moves & group
+        while bits:
+            move = bits & -bits
+            result.append(move)
+            bits ^= move
+    return result
+
+
+class Search:
+    """One alpha-beta search; ``table`` may be shared by successive searches"""
+
+    def __init__(self, deadline=None, table=None):
+        self.deadline = deadline
+        self.table = {} if table is None else table
+        self.nodes = 0
+
+    def negamax(self, player, opponent, depth, alpha, beta):
+        self.nodes += 1
+        if not self.nodes & CHECK_EVERY and self.deadline is not None:
+            if time.perf_counter() > self.deadline:
+                raise Timeout
+        key = (player, opponent)
+        entry = self.table.get(key)
+        first = 0
+        if entry is not None:
+            entry_depth, value, flag, first = entry
+            if entry_depth >= depth:
+                if flag == EXACT:
+                    return value
+                if flag == LOWER and value > alpha:
+                    alpha = value
+                elif flag == UPPER and value < beta:
+                    beta = value
+                if alpha >= beta:
+                    return value
+        moves = legal_moves(player, opponent)
+        if not moves:
+            if not legal_moves(opponent, player):
+                return final_score(player, opponent)
+            # A pass does not use up depth: the opponent's reply is still searched.
+            return -self.negamax(opponent, player, depth, -beta, -alpha)
+        if depth == 0:
+            return evaluate(player, opponent)
+        start_alpha = alpha
+        best = -WIN * 2
+        best_move = 0
+        for move in ordered(moves, first):
+            flipped = flips(player, opponent, move)
+            value = -self.negamax(opponent ^ flipped, player | flipped | move, depth - 1, -beta, -alpha)
+            if value > best:
+                best = value
+                best_move = move
+                if value > alpha:
+                    alpha = value
+                    if alpha >= beta:
+                        break
+        if best <= start_alpha:
+            flag = UPPER
+        elif best >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        if len(self.table) >= MAX_TABLE_SIZE:
+            self.table.clear()
+        self.table[key] = (depth, best, flag, best_move)
+        return best
+
+    def root(self, player, opponent, depth, first, moves):
+        """Best ``(move, score)`` of ``moves`` at ``depth``, trying ``first`` first"""
+        alpha, beta = -WIN * 2, WIN * 2
+        best_move, best = 0, -WIN * 2
+        for move in ordered(moves, first):
+            flipped = flips(player, opponent, move)
+            value = -self.negamax(opponent ^ flipped, player | flipped | move, depth - 1, -beta, -alpha)
+            if value > best:
+                best, best_move = value, move
+                alpha = max(alpha, value)
+        return best_move, best
+
+
+def deepen(player, opponent, budget, max_depth, moves, table=None):
+    """Search the root ``moves`` at depths 1, 2, ... within ``budget`` seconds.
+
+    Stops at ``max_depth``, the end of the game or the deadline; depth 1
+    always completes. Returns the ``(move, score)`` of every completed
+    depth, the nodes searched and the time taken.
+    """
+    started = time.perf_counter()
+    searcher = Search(table=table)
+    empties = (~(player | opponent) & FULL).bit_count()
+    best_move = ordered(moves)[0]
+    completed = []
+    for target in range(1, min(max_depth, empties) + 1):
+        try:
+            best_move, score = searcher.root(player, opponent, target, best_move, moves)
+        except Timeout:
+            break
+        completed.append((best_move, score))
+        # Depth 1 ran without a deadline so that there is always a move.
+        searcher.deadline = started + budget
+        if time.perf_counter() > searcher.deadline:
+            break
+    return completed, searcher.nodes, time.perf_counter() - started
+
+
+def search(player, opponent, budget, max_depth=64, table=None):
+    """Choose a move for ``player`` within ``budget`` seconds"""
+    moves = legal_moves(player, opponent)
+    if not moves:
+        return SearchResult(None, 0, 0, 0, 0.0)
+    return merge([deepen(player, opponent, budget, max_depth, moves, table)])
+
+
+def split(player, opponent, parts):
+    """The root moves dealt into at most ``parts`` bitboards.
+
+    Moves are dealt in search order, so every part gets some of the
+    promising ones.
+    """
+    shares = [0] * parts
+    for index, move in enumerate(ordered(legal_moves(player, opponent))):
+        shares[index % parts] |= move
+    return [share for share in shares if share]
+
+
+def merge(parts):
+    """SearchResult of the ``deepen`` results of the parts of a search.
+
+    Each part knows the exact score of its best move at every depth it
+    completed, so the best of those at the deepest depth completed by all
+    parts scores as well as the move a single search to that depth plays.
+    """
+    depth = min(len(completed) for completed, _, _ in parts)
+    move, score = max((completed[depth - 1] for completed, _, _ in parts), key=lambda best: best[1])
+    nodes = sum(nodes for _, nodes, _ in parts)
+    elapsed = max(elapsed for _, _, elapsed in parts)
+    return SearchResult(move, score, depth, nodes, elapsed)
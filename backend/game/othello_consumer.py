@@ -1,21 +1,50 @@
 import json
 import asyncio
+import logging
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from .othello import WHITE, Board, opponent_of
+from .othello_ai import LEVELS, search
+from .othello_workers import AIUnavailable, get_pool
+from .registry import Registry
+
+logger = logging.getLogger(__name__)
 
 # Othello matchmaking queue
 othello_queue = []
 
 
+def room_finished(room):
+    return room["game_over"] or not room["players"]
+
+
+async def close_room(room_group_name, room):
+    if not room["game_over"]:
+        await get_channel_layer().group_send(
+            room_group_name,
+            {"type": "player_disconnected", "message": "Game expired"},
+        )
+
+
 class OthelloGameConsumer(AsyncWebsocketConsumer):
     """WebSocket consumer for real-time Othello multiplayer games"""
 
-    rooms = {}  # Store active game rooms
+    # Store active game rooms
+    rooms = Registry(
+        "othello_rooms", settings.GAME_ROOM_TTL, finished=room_finished, on_expire=close_room
+    )
 
     async def connect(self):
         self.room_name = self.scope["url_route"]["kwargs"]["room_name"]
         self.room_group_name = f"othello_{self.room_name}"
         self.player_id = None
         self.player_color = None
+        self.ai_task = None
+        # ?mode=ai_easy|ai_medium|ai_hard plays against the server AI.
+        mode = parse_qs(self.scope["query_string"].decode()).get("mode", [None])[0]
 
         # Join room group
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
@@ -26,15 +55,17 @@ class OthelloGameConsumer(AsyncWebsocketConsumer):
         if self.room_group_name not in OthelloGameConsumer.rooms:
             OthelloGameConsumer.rooms[self.room_group_name] = {
                 "players": [],
-                "board": self.create_initial_board(),
-                "current_player": "B",
+                "board": Board(),
                 "game_started": False,
                 "game_over": False,
+                # The AI always plays white.
+                "ai": {"color": WHITE, "level": mode} if mode in LEVELS else None,
             }
 
         # Add player to room
         room = OthelloGameConsumer.rooms[self.room_group_name]
-        if len(room["players"]) < 2:
+        seats = 1 if room["ai"] else 2
+        if len(room["players"]) < seats:
             self.player_color = "B" if len(room["players"]) == 0 else "W"
             room["players"].append(
                 {"channel_name": self.channel_name, "color": self.player_color}
@@ -52,27 +83,22 @@ class OthelloGameConsumer(AsyncWebsocketConsumer):
             )
 
             # Start game if both players connected
-            if len(room["players"]) == 2:
+            if len(room["players"]) == seats:
                 room["game_started"] = True
                 await self.channel_layer.group_send(
                     self.room_group_name,
                     {
                         "type": "game_start",
-                        "board": room["board"],
-                        "current_player": room["current_player"],
+                        "board": room["board"].rows(),
+                        "current_player": room["board"].to_move,
                     },
                 )
 
-    def create_initial_board(self):
-        """Create standard Othello starting position"""
-        board = [["E" for _ in range(8)] for _ in range(8)]
-        board[3][3] = "W"
-        board[3][4] = "B"
-        board[4][3] = "B"
-        board[4][4] = "W"
-        return board
-
     async def disconnect(self, close_code):
+        # Drops the AI's search if it is still waiting for a worker.
+        if self.ai_task:
+            self.ai_task.cancel()
+
         # Notify opponent of disconnect
         if self.room_group_name in OthelloGameConsumer.rooms:
             room = OthelloGameConsumer.rooms[self.room_group_name]
@@ -110,9 +136,10 @@ class OthelloGameConsumer(AsyncWebsocketConsumer):
             return
 
         room = OthelloGameConsumer.rooms[self.room_group_name]
+        board = room["board"]
 
         # Validate it's the player's turn
-        if self.player_color != room["current_player"]:
+        if room["game_over"] or self.player_color != board.to_move:
             await self.send(
                 text_data=json.dumps({"type": "error", "message": "Not your turn"})
             )
@@ -122,137 +149,71 @@ class OthelloGameConsumer(AsyncWebsocketConsumer):
         col = data["col"]
 
         # Validate and make move
-        if self.is_valid_move(room["board"], row, col, self.player_color):
-            self.make_move(room["board"], row, col, self.player_color)
-
-            # Switch turn
-            room["current_player"] = "W" if room["current_player"] == "B" else "B"
-
-            # Check if game is over
-            if self.is_game_over(room["board"]):
-                room["game_over"] = True
-                winner = self.get_winner(room["board"])
-
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {
-                        "type": "game_over",
-                        "board": room["board"],
-                        "winner": winner,
-                        "score": self.get_score(room["board"]),
-                    },
-                )
-            else:
-                # Broadcast move to both players
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {
-                        "type": "move_made",
-                        "board": room["board"],
-                        "current_player": room["current_player"],
-                        "row": row,
-                        "col": col,
-                    },
-                )
-        else:
+        if not isinstance(row, int) or not isinstance(col, int) or not board.is_legal(
+            row, col, self.player_color
+        ):
             await self.send(
                 text_data=json.dumps({"type": "error", "message": "Invalid move"})
             )
+            return
 
-    def is_valid_move(self, board, row, col, player):
-        """Check if a move is valid"""
-        if board[row][col] != "E":
-            return False
-
-        directions = [
-            (-1, -1),
-            (-1, 0),
-            (-1, 1),
-            (0, -1),
-            (0, 1),
-            (1, -1),
-            (1, 0),
-            (1, 1),
-        ]
-        opponent = "W" if player == "B" else "B"
-
-        for dr, dc in directions:
-            r, c = row + dr, col + dc
-            found_opponent = False
-
-            while 0 <= r < 8 and 0 <= c < 8:
-                if board[r][c] == opponent:
-                    found_opponent = True
-                elif board[r][c] == player and found_opponent:
-                    return True
-                else:
-                    break
-                r += dr
-                c += dc
-
-        return False
-
-    def make_move(self, board, row, col, player):
-        """Execute a move and flip pieces"""
-        board[row][col] = player
-        directions = [
-            (-1, -1),
-            (-1, 0),
-            (-1, 1),
-            (0, -1),
-            (0, 1),
-            (1, -1),
-            (1, 0),
-            (1, 1),
-        ]
-        opponent = "W" if player == "B" else "B"
-
-        for dr, dc in directions:
-            to_flip = []
-            r, c = row + dr, col + dc
-
-            while 0 <= r < 8 and 0 <= c < 8:
-                if board[r][c] == opponent:
-                    to_flip.append((r, c))
-                elif board[r][c] == player:
-                    for flip_r, flip_c in to_flip:
-                        board[flip_r][flip_c] = player
-                    break
-                else:
-                    break
-                r += dr
-                c += dc
-
-    def is_game_over(self, board):
-        """Check if game is over"""
-        return (
-            len(self.get_valid_moves(board, "B")) == 0
-            and len(self.get_valid_moves(board, "W")) == 0
-        )
+        await self.apply_move(room, row, col)
+        if room["ai"] and not room["game_over"]:
+            # Run as a task so the socket's other messages (and its
+            # disconnect) are handled while the AI thinks.
+            self.ai_task = asyncio.create_task(self.play_ai(room))
+
+    async def apply_move(self, room, row, col):
+        """Play a legal move for the side to move and tell both players"""
+        board = room["board"]
+        # The turn only stays with the player when the opponent must pass.
+        _, passed = board.play(row, col)
+
+        if board.game_over:
+            room["game_over"] = True
+            await self.channel_layer.group_send(
+                self.room_group_name,
+                {
+                    "type": "game_over",
+                    "board": board.rows(),
+                    "winner": board.winner(),
+                    "score": board.score(),
+                },
+            )
+        else:
+            # Broadcast move to both players
+            await self.channel_layer.group_send(
+                self.room_group_name,
+                {
+                    "type": "move_made",
+                    "board": board.rows(),
+                    "current_player": board.to_move,
+                    "row": row,
+                    "col": col,
+                    "passed": passed,
+                },
+            )
 
-    def get_valid_moves(self, board, player):
-        """Get all valid moves for a player"""
-        moves = []
-        for row in range(8):
-            for col in range(8):
-                if self.is_valid_move(board, row, col, player):
-                    moves.append((row, col))
-        return moves
-
-    def get_score(self, board):
-        """Count pieces for each player"""
-        black = sum(row.count("B") for row in board)
-        white = sum(row.count("W") for row in board)
-        return {"B": black, "W": white}
-
-    def get_winner(self, board):
-        """Determine winner"""
-        score = self.get_score(board)
-        if score["B"] > score["W"]:
-            return "B"
-        elif score["W"] > score["B"]:
-            return "W"
-        return None
+    async def play_ai(self, room):
+        """Let the server AI move for as long as it has the turn"""
+        board, ai = room["board"], room["ai"]
+        budget, max_depth, parallel = LEVELS[ai["level"]]
+        while not room["game_over"] and board.to_move == ai["color"]:
+            player = board.discs[ai["color"]]
+            opponent = board.discs[opponent_of(ai["color"])]
+            try:
+                result = await get_pool().search(player, opponent, budget, max_depth, parallel)
+            except AIUnavailable as exc:
+                # A one-ply search takes well under a millisecond.
+                logger.warning("Othello AI falls back to one ply: %s", exc)
+                result = search(player, opponent, budget, 1)
+            except Exception:
+                # Whatever went wrong, the game must not stall on the AI's turn.
+                logger.exception("Othello AI search failed, falling back to one ply")
+                result = search(player, opponent, budget, 1)
+            if OthelloGameConsumer.rooms.get(self.room_group_name) is not room:
+                return
+            await self.apply_move(room, *result.square)
 
     # WebSocket event handlers
     async def game_start(self, event):
@@ -275,6 +236,7 @@ class OthelloGameConsumer(AsyncWebsocketConsumer):
                     "current_player": event["current_player"],
                     "row": event["row"],
                     "col": event["col"],
+                    "passed": event["passed"],
                 }
             )
         )
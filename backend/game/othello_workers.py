@@ -0,0 +1,113 @@
+import time
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+from .metrics import AI_JOBS, AI_PENDING, AI_SEARCH_DURATION, AI_WAIT
+from .othello_ai import SearchResult, deepen, merge, split
+
+logger = logging.getLogger(__name__)
+
+# Othello AI searches are pure CPU work lasting up to their time budget, so
+# they run in a pool of worker processes: the event loop keeps serving game
+# and chat sockets, and simultaneous AI games use every core instead of
+# sharing the one the GIL allows. A job is a plain function call on two
+# ints and the root moves it searches; the worker sends back what
+# othello_ai.deepen found. Each worker keeps its transposition table from
+# job to job, so the next move of a game, or another part of a split
+# search, starts with what earlier searches learnt.
+#
+# A parallel search is split by root move into one job per idle worker, so
+# a single hard-mode game uses every core while the pool is quiet and falls
+# back to one job per search when it is busy.
+#
+# A job still waiting for a worker is dropped when its caller is cancelled
+# (the socket went away). One already running finishes within its budget and
+# its result is thrown away.
+
+
+class AIUnavailable(Exception):
+    """The pool cannot take the search: too many are pending, or it broke"""
+
+
+_pool = None
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        _pool = SearchPool(settings.OTHELLO_AI_WORKERS, settings.OTHELLO_AI_MAX_PENDING)
+    return _pool
+
+
+class SearchPool:
+    """The AI worker processes, started on first use"""
+
+    def __init__(self, size, max_pending):
+        self.size = size
+        self.max_pending = max_pending
+        self.pending = 0
+        self.executor = None
+
+    def start(self):
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.size, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self.executor
+
+    async def search(self, player, opponent, budget, max_depth, parallel=False):
+        """SearchResult of ``player``'s move, searched in the worker processes"""
+        if self.pending >= self.max_pending:
+            AI_JOBS.labels("rejected").inc()
+            raise AIUnavailable(f"{self.pending} jobs pending")
+        parts = max(self.size - self.pending, 1) if parallel else 1
+        shares = split(player, opponent, parts)
+        if not shares:
+            return SearchResult(None, 0, 0, 0, 0.0)
+        queued = time.perf_counter()
+        self.pending += len(shares)
+        AI_PENDING.inc(len(shares))
+        try:
+            executor = self.start()
+            futures = [
+                asyncio.wrap_future(executor.submit(run_job, player, opponent, budget, max_depth, moves))
+                for moves in shares
+            ]
+            # Cancelling the awaiting task cancels the jobs that have not started.
+            result = merge(await asyncio.gather(*futures))
+        except asyncio.CancelledError:
+            AI_JOBS.labels("cancelled").inc()
+            raise
+        except BrokenProcessPool as exc:
+            # A worker died (killed, out of memory): start afresh next time.
+            logger.error("Othello AI worker pool broke: %s", exc)
+            AI_JOBS.labels("failed").inc()
+            self.executor = None
+            raise AIUnavailable("worker pool broke") from exc
+        finally:
+            self.pending -= len(shares)
+            AI_PENDING.dec(len(shares))
+        AI_JOBS.labels("done").inc()
+        AI_SEARCH_DURATION.observe(result.elapsed)
+        AI_WAIT.observe(max(time.perf_counter() - queued - result.elapsed, 0.0))
+        return result
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+
+# Worker process side
+
+# The transposition table of this worker, bounded by othello_ai.MAX_TABLE_SIZE.
+table = {}
+
+
+def run_job(player, opponent, budget, max_depth, moves):
+    return deepen(player, opponent, budget, max_depth, moves, table)
@@ -0,0 +1,182 @@
+import struct
+
+# Wire formats a Pong client can ask for in its "firstdata" message
+# ({"protocol": "binary"}). JSON stays the default and the fallback.
+FORMAT_JSON = "json"
+FORMAT_BINARY = "binary"
+FORMAT_DELTA = "delta"
+FORMATS = (FORMAT_JSON, FORMAT_BINARY, FORMAT_DELTA)
+
+FRAME_STATE = 1
+FRAME_KEY = 2
+FRAME_DELTA = 3
+
+# Binary state frame, sent as a WebSocket binary message (little endian):
+#   uint8    kind          FRAME_STATE
+#   uint32   tick          physics tick of the game the frame was taken at
+#   float32  ball_x        already mirrored for the receiving side
+#   float32  ball_y
+#   float32  ball_dx       already mirrored for the receiving side
+#   float32  ball_dy
+#   float32  ball_radius
+#   float32  player_y      paddle of the receiving player
+#   float32  opponent_y    paddle of the other player
+STATE_FRAME = struct.Struct("<BI7f")
+
+# The "delta" format sends quantized snapshots: positions in 1/16 px and
+# velocities in 1/256 px per tick. Every snapshot carries a sequence number
+# the client acknowledges with {"message": "ack", "seq": n}; the next ones
+# are then sent as deltas against the acknowledged snapshot, or as a key
+# frame when there is no usable baseline.
+POSITION_SCALE = 16
+VELOCITY_SCALE = 256
+SNAPSHOT_HISTORY = 32
+
+# Snapshot fields, in order (bit i of a delta mask refers to field i):
+#   ball_x, ball_y, ball_dx, ball_dy, player_y, opponent_y
+SNAPSHOT_FIELDS = 6
+
+# Key frame:
+#   uint8    kind          FRAME_KEY
+#   uint32   seq
+#   uint32   tick
+#   int32    fields[6]     quantized snapshot fields
+#   int16    radius        quantized like positions
+KEY_FRAME = struct.Struct("<BII6ih")
+
+# Delta frame header, followed by one int16 difference per bit set in mask:
+#   uint8    kind          FRAME_DELTA
+#   uint32   seq
+#   uint8    base          seq - baseline seq
+#   uint8    ticks         tick - baseline tick
+#   uint8    mask          fields that changed since the baseline
+DELTA_HEADER = struct.Struct("<BIBBB")
+
+
+def negotiate(requested):
+    """Return the wire format to use for a client's requested protocol"""
+    return requested if requested in FORMATS else FORMAT_JSON
+
+
+def pack_state(tick, ball_x, ball_y, ball_dx, ball_dy, radius, player_y, opponent_y):
+    return STATE_FRAME.pack(
+        FRAME_STATE,
+        tick & 0xFFFFFFFF,
+        ball_x,
+        ball_y,
+        ball_dx,
+        ball_dy,
+        radius,
+        player_y,
+        opponent_y,
+    )
+
+
+def quantize(ball_x, ball_y, ball_dx, ball_dy, player_y, opponent_y):
+    return (
+        round(ball_x * POSITION_SCALE),
+        round(ball_y * POSITION_SCALE),
+        round(ball_dx * VELOCITY_SCALE),
+        round(ball_dy * VELOCITY_SCALE),
+        round(player_y * POSITION_SCALE),
+        round(opponent_y * POSITION_SCALE),
+    )
+
+
+class SnapshotHistory:
+    """The last quantized snapshots of a room, kept as delta baselines"""
+
+    def __init__(self, size=SNAPSHOT_HISTORY):
+        self.size = size
+        self.snapshots = {}
+
+    def add(self, seq, tick, sides):
+        self.snapshots[seq] = (tick, sides)
+        self.snapshots.pop(seq - self.size, None)
+
+    def get(self, seq):
+        return self.snapshots.get(seq)
+
+
+class Snapshot:
+    """One snapshot of a room, encoded lazily per side and baseline.
+
+    Subscribers that acknowledged the same snapshot share one encoding.
+    """
+
+    __slots__ = ("seq", "tick", "radius", "sides", "history", "encoded")
+
+    def __init__(self, seq, tick, radius, sides, history):
+        self.seq = seq
+        self.tick = tick
+        self.radius = round(radius * POSITION_SCALE)
+        self.sides = sides
+        self.history = history
+        self.encoded = {}
+        history.add(seq, tick, sides)
+
+    def encode(self, side, acked=None):
+        key = (side, acked)
+        frame = self.encoded.get(key)
+        if frame is None:
+            frame = self.encoded[key] = self._encode(side, acked)
+        return frame
+
+    def _encode(self, side, acked):
+        values = self.sides[side]
+        base = self.history.get(acked) if acked is not None else None
+        if base is None or not 0 < self.seq - acked <= 255 or self.tick - base[0] > 255:
+            return self._key_frame(values)
+        mask = 0
+        diffs = []
+        for i, (value, previous) in enumerate(zip(values, base[1][side])):
+            diff = value - previous
+            if diff:
+                if not -32768 <= diff <= 32767:
+                    return self._key_frame(values)
+                mask |= 1 << i
+                diffs.append(diff)
+        header = DELTA_HEADER.pack(
+            FRAME_DELTA, self.seq, self.seq - acked, self.tick - base[0], mask
+        )
+        return header + struct.pack(f"<{len(diffs)}h", *diffs)
+
+    def _key_frame(self, values):
+        return KEY_FRAME.pack(FRAME_KEY, self.seq, self.tick, *values, self.radius)
+
+
+def unpack_state(frame):
+    """Decode a state frame into a dict (used by tests and tooling)"""
+    kind, tick, ball_x, ball_y, ball_dx, ball_dy, radius, player_y, opponent_y = (
+        STATE_FRAME.unpack(frame)
+    )
+    return {
+        "kind": kind,
+        "tick": tick,
+        "ball_x": ball_x,
+        "ball_y": ball_y,
+        "ball_dx": ball_dx,
+        "ball_dy": ball_dy,
+        "radius": radius,
+        "player_y": player_y,
+        "opponent_y": opponent_y,
+    }
+
+
+def apply_snapshot(frame, baselines):
+    """Decode a key or delta frame against ``{seq: (tick, fields)}``.
+
+    Returns ``(seq, tick, fields)``; mirrors what a client has to do.
+    """
+    kind = frame[0]
+    if kind == FRAME_KEY:
+        _, seq, tick, *fields, _radius = KEY_FRAME.unpack(frame)
+        return seq, tick, tuple(fields)
+    _, seq, base, ticks, mask = DELTA_HEADER.unpack_from(frame)
+    base_tick, fields = baselines[seq - base]
+    diffs = iter(struct.unpack_from(f"<{bin(mask).count('1')}h", frame, DELTA_HEADER.size))
+    fields = tuple(
+        value + next(diffs) if mask & (1 << i) else value
+        for i, value in enumerate(fields)
+    )
+    return seq, base_tick + ticks, fields
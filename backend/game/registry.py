@@ -0,0 +1,149 @@
+import sys
+import time
+import types
+import asyncio
+import inspect
+import logging
+from collections import deque
+from collections.abc import MutableMapping
+
+from .metrics import REGISTRY_BYTES, REGISTRY_ENTRIES, REGISTRY_REAPED
+
+logger = logging.getLogger(__name__)
+
+REAP_INTERVAL = 30
+FINISHED_GRACE = 60
+
+# Never worth descending into when sizing an entry: shared by the process.
+SHARED_TYPES = (
+    type, types.ModuleType, types.FunctionType, types.MethodType,
+    types.BuiltinFunctionType, asyncio.AbstractEventLoop, asyncio.Future,
+)
+
+
+def approximate_size(obj, exclude=()):
+    """Bytes held by ``obj`` and everything it references, counted once.
+
+    Objects of the ``exclude`` types (sockets, shared engines, ...) and
+    anything shared by the whole process are not followed.
+    """
+    stop = SHARED_TYPES + tuple(exclude)
+    seen = set()
+    stack = [obj]
+    size = 0
+    while stack:
+        item = stack.pop()
+        if id(item) in seen or isinstance(item, stop):
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset, deque)):
+            stack.extend(item)
+        elif not isinstance(item, (str, bytes, bytearray, int, float)):
+            attributes = getattr(item, "__dict__", None)
+            if attributes is not None:
+                stack.append(attributes)
+            for slot in getattr(type(item), "__slots__", ()):
+                stack.append(getattr(item, slot, None))
+    return size
+
+
+class Registry(MutableMapping):
+    """A dict of live rooms whose forgotten entries are reaped.
+
+    Disconnect handlers normally delete entries as soon as they are done
+    with them. Whatever an abnormal close leaves behind is dropped by a
+    reaper task: entries ``ttl`` seconds after they were last set or looked
+    up, and entries ``grace`` seconds after ``finished(value)`` first held.
+    Rooms are stored once and then changed in place, but their consumers
+    look them up on every message, so only rooms nobody uses any more age.
+    ``on_expire(key, value)``, which may be a coroutine function, releases
+    what a reaped entry still holds. The reaper only runs while the registry
+    is not empty.
+
+    Entry count, approximate memory (measured on every pass with ``sizeof``)
+    and reaped entries are exported under the registry ``name``.
+    """
+
+    def __init__(self, name, ttl, grace=FINISHED_GRACE, finished=None, on_expire=None,
+                 sizeof=approximate_size, interval=REAP_INTERVAL):
+        self.name = name
+        self.ttl = ttl
+        self.grace = grace
+        self.finished = finished
+        self.on_expire = on_expire
+        self.sizeof = sizeof
+        self.interval = interval
+        self.entries = {}
+        self.updated = {}
+        self.finished_at = {}
+        self.bytes = 0
+        self.task = None
+        REGISTRY_ENTRIES.labels(name).set_function(lambda: len(self.entries))
+        REGISTRY_BYTES.labels(name).set_function(lambda: self.bytes)
+
+    def __getitem__(self, key):
+        value = self.entries[key]
+        self.updated[key] = time.monotonic()
+        return value
+
+    def __setitem__(self, key, value):
+        self.entries[key] = value
+        self.updated[key] = time.monotonic()
+        self.finished_at.pop(key, None)
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self.reaper())
+
+    def __delitem__(self, key):
+        del self.entries[key]
+        del self.updated[key]
+        self.finished_at.pop(key, None)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    async def reaper(self):
+        while self.entries:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.reap()
+            except Exception:
+                logger.exception("Failed to reap the %s registry", self.name)
+        self.bytes = 0
+
+    async def reap(self, now=None):
+        """Drop expired entries, return how many were dropped"""
+        if now is None:
+            now = time.monotonic()
+        expired = []
+        for key, value in self.entries.items():
+            if self.finished is not None and self.finished(value):
+                if now - self.finished_at.setdefault(key, now) >= self.grace:
+                    expired.append((key, value))
+                    continue
+            if now - self.updated[key] >= self.ttl:
+                expired.append((key, value))
+        reaped = 0
+        for key, value in expired:
+            if self.entries.get(key) is not value:
+                # Replaced or deleted by its owner while an on_expire ran.
+                continue
+            del self[key]
+            reaped += 1
+            REGISTRY_REAPED.labels(self.name).inc()
+            logger.info("Reaped %s entry %s", self.name, key)
+            if self.on_expire is not None:
+                result = self.on_expire(key, value)
+                if inspect.isawaitable(result):
+                    await result
+        self.bytes = sum(self.sizeof(value) for value in list(self.entries.values()))
+        return reaped
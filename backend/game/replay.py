@@ -0,0 +1,218 @@
+import zlib
+import struct
+import asyncio
+
+from .protocol import POSITION_SCALE
+
+# A match is recorded as the seed of its random.Random and an append-only
+# log of what the players did, instead of the frames that were sent. Ball
+# physics is deterministic given both, so playback re-simulates the match.
+#
+#   header   <BIH  version, seed, tick rate
+#   event    B     type
+#            var   ticks since the previous event
+#            ...   payload
+#
+#   EVENT_ROUND    <Bddd round, canvas width, canvas height, racquet height
+#   EVENT_SERVE    -           ball put in play (draws from the seeded RNG)
+#   EVENT_MOVE_*   zigzag var  paddle y minus the side's previous y, in
+#                              1/POSITION_SCALE px
+#   EVENT_FORFEIT  B           side that left
+#   EVENT_END      -
+#
+# The log is zlib-compressed before it is stored.
+
+# Version 2: swept physics, which version 1 logs cannot be replayed with.
+REPLAY_VERSION = 2
+REPLAY_HEADER = struct.Struct("<BIH")
+ROUND_EVENT = struct.Struct("<Bddd")
+
+EVENT_ROUND = 0
+EVENT_SERVE = 1
+EVENT_MOVE_LEFT = 2
+EVENT_MOVE_RIGHT = 3
+EVENT_FORFEIT = 4
+EVENT_END = 5
+
+# Bounds playback of a log cut short, where no END event says when to stop.
+MAX_ROUND_SECONDS = 60 * 10
+
+
+def quantize_paddle(y):
+    """Paddle positions are snapped to the grid the replay log stores"""
+    return round(y * POSITION_SCALE) / POSITION_SCALE
+
+
+def _write_varint(buffer, value):
+    while value >= 0x80:
+        buffer.append(value & 0x7F | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def _read_varint(data, offset):
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+class ReplayRecorder:
+    """Appends the events of one match to a compact binary log"""
+
+    def __init__(self, seed, tick_rate):
+        self.seed = seed
+        self.log = bytearray(REPLAY_HEADER.pack(REPLAY_VERSION, seed, tick_rate))
+        self.tick = 0
+        self.paddles = [0, 0]
+        self.rounds = 0
+
+    def __len__(self):
+        return len(self.log)
+
+    def _event(self, kind, tick):
+        self.log.append(kind)
+        _write_varint(self.log, tick - self.tick)
+        self.tick = tick
+
+    def round(self, tick, round, width, height, racquet_height):
+        self.rounds += 1
+        self._event(EVENT_ROUND, tick)
+        self.log += ROUND_EVENT.pack(round, width, height, racquet_height)
+
+    def serve(self, tick):
+        self._event(EVENT_SERVE, tick)
+
+    def move(self, tick, side, y):
+        position = round(y * POSITION_SCALE)
+        delta = position - self.paddles[side]
+        self.paddles[side] = position
+        self._event(EVENT_MOVE_LEFT if side == 0 else EVENT_MOVE_RIGHT, tick)
+        _write_varint(self.log, delta << 1 if delta >= 0 else (-delta << 1) - 1)
+
+    def forfeit(self, tick, side):
+        self._event(EVENT_FORFEIT, tick)
+        self.log.append(side)
+
+    def end(self, tick):
+        self._event(EVENT_END, tick)
+
+    def dump(self):
+        return zlib.compress(bytes(self.log), 9)
+
+
+def read_replay(blob):
+    """Return ``(seed, tick_rate, events)``; events are ``(type, tick, payload)`` tuples"""
+    data = zlib.decompress(blob)
+    version = data[0]
+    if version != REPLAY_VERSION:
+        raise ValueError(f"Unsupported replay version {version}")
+    _, seed, tick_rate = REPLAY_HEADER.unpack_from(data)
+    events = []
+    offset = REPLAY_HEADER.size
+    tick = 0
+    paddles = [0, 0]
+    while offset < len(data):
+        kind = data[offset]
+        delta, offset = _read_varint(data, offset + 1)
+        tick += delta
+        payload = None
+        if kind == EVENT_ROUND:
+            payload = ROUND_EVENT.unpack_from(data, offset)
+            offset += ROUND_EVENT.size
+        elif kind in (EVENT_MOVE_LEFT, EVENT_MOVE_RIGHT):
+            side = kind - EVENT_MOVE_LEFT
+            value, offset = _read_varint(data, offset)
+            paddles[side] += value >> 1 if not value & 1 else -((value + 1) >> 1)
+            payload = paddles[side] / POSITION_SCALE
+        elif kind == EVENT_FORFEIT:
+            payload = data[offset]
+            offset += 1
+        elif kind not in (EVENT_SERVE, EVENT_END):
+            raise ValueError(f"Unknown replay event {kind}")
+        events.append((kind, tick, payload))
+    return seed, tick_rate, events
+
+
+class ReplayViewer:
+    """Collects the frames a replayed GameLoop sends to its players"""
+
+    def __init__(self, id):
+        self.id = id
+        self.y = 0
+        self.score = 0
+        self.side = None
+        self.frames = []
+
+    async def send_frame(self, frame):
+        self.frames.append(frame.text)
+
+
+async def play(replay, speed=1.0):
+    """Re-simulate a GameReplay, yielding its frames as JSON lines.
+
+    Frames come at the live snapshot rate; ``speed`` scales playback time
+    and 0 streams them as fast as they are simulated.
+    """
+    from .clients import GameLoop
+
+    seed, tick_rate, events = read_replay(replay.log)
+    viewer = ReplayViewer(replay.player_1)
+    opponent = ReplayViewer(replay.player_2)
+    # Ticks in the log are ticks of the rate the match was played at.
+    game = GameLoop(viewer, opponent, seed=seed, record=False, tick_rate=tick_rate, save_result=False)
+    game.broadcast.unsubscribe(opponent)
+    game.active = True
+    delay = game.snapshot_every / tick_rate / speed if speed > 0 else 0
+    playing = False
+    end = None
+
+    async def run_until(tick):
+        nonlocal playing
+        while playing and game.ticks < tick:
+            scorer = game.advance()
+            if scorer is not None:
+                game.score_point(scorer)
+                playing = False
+                await game.round_over()
+            elif game.ticks - game.last_snapshot >= game.snapshot_every:
+                await game.publish()
+                if delay:
+                    await asyncio.sleep(delay)
+            for frame in viewer.frames:
+                yield frame + "\n"
+            viewer.frames.clear()
+
+    for kind, tick, payload in events:
+        async for frame in run_until(tick):
+            yield frame
+        if kind == EVENT_ROUND:
+            round, game.canvas_width, game.canvas_height, height = payload
+            game.racquet = {"height": height, "width": game.racquet["width"]}
+            await game.begin_round(round)
+        elif kind == EVENT_SERVE:
+            game.serve()
+            playing = True
+        elif kind == EVENT_MOVE_LEFT:
+            viewer.y = payload
+        elif kind == EVENT_MOVE_RIGHT:
+            opponent.y = payload
+        elif kind == EVENT_FORFEIT:
+            playing = False
+            viewer.score, opponent.score = (0, 5) if payload == 0 else (5, 0)
+        elif kind == EVENT_END:
+            end = tick
+        for frame in viewer.frames:
+            yield frame + "\n"
+        viewer.frames.clear()
+    if end is None:
+        end = game.ticks + MAX_ROUND_SECONDS * tick_rate
+    async for frame in run_until(end):
+        yield frame
+    await game.game_over()
+    for frame in viewer.frames:
+        yield frame + "\n"
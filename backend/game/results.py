@@ -0,0 +1,150 @@
+import asyncio
+import logging
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from backend.database import run
+
+from .metrics import RESULTS_PENDING, RESULTS_WRITTEN
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH = 200
+
+STATS_FIELDS = ["win", "loss", "rank", "progress_bar", "league", "xp"]
+GRAPH_FIELDS = ["skill", "speed", "accuracy", "defense", "offense", "consistency", "strategy"]
+
+
+def player_id(value):
+    """A player id sent by a client, or None when it is not one"""
+    if not str(value).isdigit():
+        return None
+    return int(value)
+
+
+def write_results(results):
+    """Record a batch of ``(player_1, player_2, score_1, score_2)`` matches.
+
+    One transaction inserts the GameHestory rows of both players and applies
+    each player's wins and losses of the whole batch to its Stats (and
+    Graph) at once, as the stats PUT of the profile API does for one match.
+    League ranks are read once per league, so the number of queries does
+    not grow with the batch. Matches of unknown players are skipped.
+    Returns how many were recorded.
+    """
+    from Player.Models.GraphModel import Graph
+    from Player.Models.PlayerModel import Player
+    from Player.Models.StatsModel import Stats
+    from Player.Views.StatsView import calculateStats, generateGraphValues
+    from .models import GameHestory
+
+    ids = {player for result in results for player in result[:2]}
+    known = set(Player.objects.filter(id__in=ids).values_list("id", flat=True))
+    rows = []
+    tally = defaultdict(lambda: [0, 0])
+    for player_1, player_2, score_1, score_2 in results:
+        if player_1 not in known or player_2 not in known:
+            logger.warning("Dropped the result of %s vs %s: unknown player", player_1, player_2)
+            continue
+        for player, opponent, score, opponent_score in (
+            (player_1, player_2, score_1, score_2),
+            (player_2, player_1, score_2, score_1),
+        ):
+            won = score > opponent_score
+            rows.append(GameHestory(
+                player_id=player,
+                opponent_player_id=opponent,
+                player_score=score,
+                opponent_score=opponent_score,
+                result="win" if won else "lose",
+            ))
+            tally[player][0 if won else 1] += 1
+    if not rows:
+        return 0
+
+    with transaction.atomic():
+        GameHestory.objects.bulk_create(rows)
+        stats = list(
+            Stats.objects.select_for_update()
+            .filter(stats__id__in=tally)
+            .annotate(player_id=F("stats__id"))
+        )
+        graphs = Graph.objects.in_bulk(
+            [row.graph_id for row in stats if row.graph_id is not None]
+        )
+        updated_graphs = []
+        ranks = {}
+        for row in stats:
+            win, loss = tally[row.player_id]
+            for field, value in calculateStats(row, win, loss, ranks).items():
+                setattr(row, field, value)
+            if row.graph_id in graphs:
+                row.graph = graphs[row.graph_id]
+                for field, value in generateGraphValues(row).items():
+                    setattr(row.graph, field, value)
+                updated_graphs.append(row.graph)
+        Stats.objects.bulk_update(stats, STATS_FIELDS)
+        Graph.objects.bulk_update(updated_graphs, GRAPH_FIELDS)
+    return len(rows) // 2
+
+
+class ResultQueue:
+    """Write-behind persistence of finished Pong matches.
+
+    ``GameLoop.game_over`` only appends its result here, so no database
+    write ever runs on the tick path. A writer task flushes what has
+    accumulated every ``interval`` seconds, or as soon as ``max_batch``
+    results wait, with one ``write_results`` call in the database pool. It
+    exits once the queue is empty and is restarted by the next result.
+    Results still waiting when the process dies are lost.
+    """
+
+    def __init__(self, interval, max_batch=MAX_BATCH):
+        self.interval = interval
+        self.max_batch = max_batch
+        self.pending = []
+        self.full = asyncio.Event()
+        self.task = None
+        RESULTS_PENDING.set_function(lambda: len(self.pending))
+
+    def put(self, player_1, player_2, score_1, score_2):
+        player_1, player_2 = player_id(player_1), player_id(player_2)
+        if player_1 is None or player_2 is None or player_1 == player_2:
+            return
+        self.pending.append((player_1, player_2, score_1, score_2))
+        if len(self.pending) >= self.max_batch:
+            self.full.set()
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self.writer())
+
+    async def writer(self):
+        while self.pending:
+            try:
+                await asyncio.wait_for(self.full.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    async def flush(self):
+        """Write up to ``max_batch`` pending results, return how many were recorded"""
+        batch = self.pending[:self.max_batch]
+        del self.pending[:self.max_batch]
+        if len(self.pending) < self.max_batch:
+            self.full.clear()
+        if not batch:
+            return 0
+        try:
+            written = await run(write_results, batch)
+        except Exception:
+            logger.exception("Could not save the results of %d games", len(batch))
+            RESULTS_WRITTEN.labels("failed").inc(len(batch))
+            return 0
+        RESULTS_WRITTEN.labels("saved").inc(written)
+        RESULTS_WRITTEN.labels("dropped").inc(len(batch) - written)
+        return written
+
+
+results = ResultQueue(settings.GAME_RESULTS_FLUSH_INTERVAL)
@@ -0,0 +1,149 @@
+import asyncio
+import logging
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+TICK_RATE = settings.GAME_TICK_RATE
+MAX_CATCH_UP_TICKS = 5
+
+
+def snapshot_interval(snapshot_rate, tick_rate=TICK_RATE):
+    """Number of ticks between two state snapshots sent to the players"""
+    return max(1, round(tick_rate / snapshot_rate))
+
+
+class TickScheduler:
+    """Steps every registered GameLoop on one shared fixed timestep.
+
+    A single task drives all games of the process instead of one
+    ``asyncio.sleep`` loop per game. Ticks are scheduled against absolute
+    deadlines so they do not drift; when the event loop falls behind, up to
+    ``max_catch_up`` physics steps are run back to back (only the last one is
+    broadcast) and any remaining backlog is dropped. Suspended (paused) games
+    are taken off the schedule, and the task exits when nothing is left to
+    step, so an idle process does not wake up at all.
+
+    With a batch ``engine`` (see batch_physics.BatchPhysics), the balls of all
+    games are advanced in one vectorized step and only games that scored or
+    are due a snapshot are visited in Python.
+    """
+
+    def __init__(self, rate=TICK_RATE, max_catch_up=MAX_CATCH_UP_TICKS, engine=None):
+        self.rate = rate
+        self.timestep = 1 / rate
+        self.max_catch_up = max_catch_up
+        self.engine = engine
+        self.games = {}
+        self.suspended = {}
+        self.task = None
+        self.tick = 0
+        # Callables run after every wake-up with (started, lateness,
+        # duration, steps), all times in seconds of the event loop clock.
+        self.observers = []
+
+    def add(self, game, paused=False):
+        if paused:
+            self.suspend(game)
+            self.suspended[game] = None
+            return
+        self.suspended.pop(game, None)
+        self.games[game] = None
+        if self.engine is not None:
+            self.engine.add(game)
+        self._ensure_running()
+
+    def remove(self, game):
+        self.games.pop(game, None)
+        self.suspended.pop(game, None)
+        if self.engine is not None:
+            self.engine.remove(game)
+
+    def suspend(self, game):
+        if self.games.pop(game, 0) is None:
+            self.suspended[game] = None
+            if self.engine is not None:
+                self.engine.remove(game)
+
+    def resume(self, game):
+        if self.suspended.pop(game, 0) is None:
+            self.games[game] = None
+            if self.engine is not None:
+                self.engine.add(game)
+            self._ensure_running()
+
+    def __len__(self):
+        return len(self.games)
+
+    def _ensure_running(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time()
+        while self.games:
+            delay = deadline - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            started = loop.time()
+            lateness = started - deadline
+            steps = 0
+            while True:
+                deadline += self.timestep
+                steps += 1
+                behind = loop.time() >= deadline
+                if behind and steps < self.max_catch_up:
+                    await self.step(send=False)
+                    continue
+                await self.step(send=True)
+                break
+            for observer in self.observers:
+                observer(started, lateness, loop.time() - started, steps)
+            if loop.time() >= deadline:
+                # Too far behind to catch up: skip the backlog instead of
+                # bursting frames at the clients.
+                deadline = loop.time()
+
+    async def step(self, send=True):
+        self.tick += 1
+        if self.engine is not None:
+            await self.step_batch(send)
+            return
+        games = list(self.games)
+        if not games:
+            return
+        results = await asyncio.gather(
+            *(game.tick(send) for game in games), return_exceptions=True
+        )
+        for game, result in zip(games, results):
+            if isinstance(result, BaseException):
+                logger.error("Game tick failed: %r", result)
+                self.fail(game, result)
+
+    async def step_batch(self, send):
+        for game, scorer in self.engine.step():
+            game.score_point(scorer)
+        if not send:
+            return
+        games = self.engine.due()
+        for game in games:
+            self.engine.sync(game)
+        results = await asyncio.gather(
+            *(game.publish() for game in games), return_exceptions=True
+        )
+        for game, result in zip(games, results):
+            if isinstance(result, BaseException):
+                logger.error("Game publish failed: %r", result)
+                self.fail(game, result)
+
+    def fail(self, game, error):
+        # Ends the game's round with the error (which also takes the game
+        # off the schedule), so its rounds loop does not wait forever.
+        if not isinstance(error, Exception):
+            error = RuntimeError(repr(error))
+        game._end_round(error)
+
+
+scheduler = TickScheduler()
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import GamePlay, GameHestory, OthelloGameHistory, OthelloStats
+from .models import GamePlay, GameHestory, GameReplay, OthelloGameHistory, OthelloStats
 from Player.Serializers.PlayerSerializer import DefaultPlayerSerializer
 
 
@@ -17,6 +17,20 @@ class GamePlaySerializer(serializers.ModelSerializer):
         ]
 
 
+class GameReplaySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = GameReplay
+        fields = [
+            "id",
+            "player_1",
+            "player_2",
+            "player_1_score",
+            "player_2_score",
+            "ticks",
+            "created_at",
+        ]
+
+
 class GameHestorySerializer(serializers.ModelSerializer):
     player = DefaultPlayerSerializer(required=False)
     opponent_player = DefaultPlayerSerializer(required=False)
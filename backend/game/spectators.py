@@ -0,0 +1,98 @@
+import asyncio
+import logging
+from collections import deque
+
+from .metrics import FRAMES_SENT, SPECTATOR_FRAMES_SKIPPED
+
+logger = logging.getLogger(__name__)
+
+MAX_PENDING_EVENTS = 16
+
+
+class Spectator:
+    """One spectator socket, written to by its own task.
+
+    It holds at most one pending ball state frame, which newer ones replace,
+    plus the round events not sent yet; a slow socket therefore skips state
+    frames instead of buffering them or blocking anyone else.
+    """
+
+    def __init__(self, consumer):
+        self.consumer = consumer
+        self.state = None
+        self.events = deque(maxlen=MAX_PENDING_EVENTS)
+        self.ready = asyncio.Event()
+        self.task = asyncio.create_task(self.run())
+
+    def push(self, frame):
+        if frame.status == "Game":
+            if self.state is not None:
+                SPECTATOR_FRAMES_SKIPPED.inc()
+            self.state = frame
+        else:
+            # Keep the order: the last ball position, then the event.
+            if self.state is not None:
+                self.events.append(self.state)
+                self.state = None
+            self.events.append(frame)
+        self.ready.set()
+
+    async def run(self):
+        try:
+            while True:
+                await self.ready.wait()
+                self.ready.clear()
+                while self.events:
+                    frame = self.events.popleft()
+                    await self.consumer.send(text_data=frame.text)
+                    FRAMES_SENT.labels("spectator").inc()
+                    if frame.status == "GameOver":
+                        await self.consumer.close()
+                        return
+                frame, self.state = self.state, None
+                if frame is not None:
+                    await self.consumer.send(text_data=frame.text)
+                    FRAMES_SENT.labels("spectator").inc()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.info("Dropping spectator: %r", e)
+
+    def close(self):
+        self.task.cancel()
+
+
+class SpectatorTier:
+    """Fans the frames of one room out to its spectators.
+
+    Subscribes to the room's RoomBroadcast like a player socket, but only
+    hands frames to the per-spectator writers, so the players' frames never
+    wait on a spectator. Only every ``every``-th ball state frame is passed
+    on; each frame is JSON-encoded once for all spectators.
+    """
+
+    def __init__(self, every=1):
+        self.every = every
+        self.states = 0
+        self.spectators = {}
+
+    def __len__(self):
+        return len(self.spectators)
+
+    def add(self, consumer):
+        self.spectators[consumer] = Spectator(consumer)
+
+    def remove(self, consumer):
+        spectator = self.spectators.pop(consumer, None)
+        if spectator:
+            spectator.close()
+
+    async def send_frame(self, frame):
+        if not self.spectators:
+            return
+        if frame.status == "Game":
+            self.states += 1
+            if self.states % self.every:
+                return
+        for spectator in self.spectators.values():
+            spectator.push(frame)
@@ -1,3 +1,1302 @@
-from django.test import TestCase
+import json
+import time
+import random
+import asyncio
+import threading
+import contextvars
+from concurrent.futures import Future
+from unittest import mock, skipIf
 
-# Create your tests here.
+from channels.layers import InMemoryChannelLayer
+from django.conf import settings
+from django.db import connections
+from django.test import SimpleTestCase
+from prometheus_client import REGISTRY
+
+from backend.database import database, run
+
+from .broadcast import Frame, RoomBroadcast
+from .clients import GameLoop
+from .consumers import GameConsumer
+from .inputs import InputCoalescer
+from .matchmaking import Matchmaker, RatedMatchmaker
+from .matchstore import RedisMatchStore
+from .metrics import observe_tick
+from .othello import (
+    BLACK, EMPTY, START_BLACK, START_WHITE, WHITE,
+    Board, flips, from_rows, legal_moves, perft, play, square, to_rows,
+)
+from .othello_ai import deepen, merge, search, split
+from .othello_workers import AIUnavailable, SearchPool
+from .physics import LEFT, RIGHT, Ball, sweep
+from .protocol import (
+    FORMAT_BINARY, FORMAT_DELTA, FRAME_DELTA, FRAME_KEY, FRAME_STATE, SNAPSHOT_HISTORY,
+    Snapshot, SnapshotHistory, apply_snapshot, negotiate, pack_state, unpack_state,
+)
+from .registry import Registry, approximate_size
+from .replay import (
+    EVENT_END, EVENT_FORFEIT, EVENT_MOVE_LEFT, EVENT_MOVE_RIGHT, EVENT_ROUND, EVENT_SERVE,
+    ReplayRecorder, read_replay, play as play_replay,
+)
+from .results import ResultQueue
+from .scheduler import TickScheduler, scheduler, snapshot_interval
+from .spectators import SpectatorTier
+from .workers import SimulationPool
+
+try:
+    from .batch_physics import BatchPhysics
+except ImportError:
+    BatchPhysics = None
+
+try:
+    import fakeredis
+    # fakeredis runs the matchmaking Lua scripts with lupa.
+    import lupa  # noqa: F401
+except ImportError:
+    fakeredis = None
+
+
+class StubGame:
+    """Stands in for a GameLoop on a TickScheduler"""
+
+    def __init__(self, scheduler, rounds=None, error=None):
+        self.scheduler = scheduler
+        self.rounds = rounds
+        self.error = error
+        self.sends = []
+        self.ended = []
+
+    async def tick(self, send=True):
+        self.sends.append(send)
+        if self.error:
+            raise self.error
+        if self.rounds is not None and len(self.sends) >= self.rounds:
+            self._end_round(len(self.sends))
+
+    def _end_round(self, result):
+        self.scheduler.remove(self)
+        self.ended.append(result)
+
+
+class StubSocket:
+    def __init__(self, id=None):
+        self.id = id
+        self.y = 0
+        self.score = 0
+        self.frames = []
+
+    async def send_frame(self, frame):
+        self.frames.append(frame)
+
+
+class TickSchedulerTests(SimpleTestCase):
+    async def test_steps_a_game_until_its_round_ends(self):
+        ticks = TickScheduler(rate=200)
+        game = StubGame(ticks, rounds=5)
+        ticks.add(game)
+        await asyncio.wait_for(ticks.task, 5)
+        # Some steps may be silent catch-up ones on a busy machine.
+        self.assertEqual(len(game.sends), 5)
+        self.assertEqual(game.ended, [5])
+        self.assertEqual(len(ticks), 0)
+
+    async def test_paused_games_are_not_stepped(self):
+        ticks = TickScheduler(rate=200)
+        game = StubGame(ticks)
+        ticks.add(game, paused=True)
+        self.assertIsNone(ticks.task)
+        self.assertEqual(len(ticks), 0)
+        ticks.resume(game)
+        await asyncio.sleep(0.05)
+        self.assertTrue(game.sends)
+        ticks.suspend(game)
+        await asyncio.wait_for(ticks.task, 1)
+        stepped = len(game.sends)
+        await asyncio.sleep(0.05)
+        self.assertEqual(len(game.sends), stepped)
+        ticks.resume(game)
+        await asyncio.sleep(0.05)
+        self.assertGreater(len(game.sends), stepped)
+        ticks.remove(game)
+        await asyncio.wait_for(ticks.task, 1)
+        self.assertEqual(game.ended, [])
+
+    async def test_catches_up_silently_then_drops_the_backlog(self):
+        ticks = TickScheduler(rate=100, max_catch_up=5)
+        samples = []
+        ticks.observers.append(lambda *sample: samples.append(sample[3]))
+        game = StubGame(ticks, rounds=30)
+        ticks.add(game)
+        await asyncio.sleep(0.05)
+        # Hold the event loop for ten timesteps between two wake-ups.
+        time.sleep(0.1)
+        await asyncio.wait_for(ticks.task, 5)
+        self.assertEqual(max(samples), 5)
+        late = samples.index(5)
+        self.assertLess(samples[late + 1], 5)
+        # Only the last step of a wake-up is sent.
+        self.assertEqual(game.sends.count(True), len(samples))
+        self.assertEqual(len(game.sends), sum(samples))
+
+    async def test_failed_tick_ends_the_round(self):
+        ticks = TickScheduler(rate=200)
+        error = ValueError("boom")
+        game = StubGame(ticks, error=error)
+        with self.assertLogs("game.scheduler", "ERROR"):
+            ticks.add(game)
+            await asyncio.wait_for(ticks.task, 1)
+        self.assertEqual(game.ended, [error])
+        self.assertEqual(len(ticks), 0)
+
+    async def test_round_of_a_game_loop_ends_with_the_scorer(self):
+        game = GameLoop(StubSocket(1), StubSocket(2), seed=3, record=False, save_result=False)
+        game.canvas_width, game.canvas_height = 300, 150
+        # Paddles out of reach: the first side the ball reaches misses.
+        game.racquet = {'height': 1, 'width': 10}
+        game.controler.y = game.opponent.y = -100
+        game.active = True
+        scorer = await asyncio.wait_for(game.game_loop(), 5)
+        self.assertIn(scorer, game.get_players())
+        self.assertEqual(scorer.score, 1)
+        self.assertNotIn(game, scheduler.games)
+        self.assertTrue(game.controler.frames)
+
+
+class MatchmakerTests(SimpleTestCase):
+    async def test_pairs_in_arrival_order_per_key(self):
+        queue = Matchmaker()
+        a, b, c, d = (StubSocket(i) for i in range(4))
+        first = queue.join(a, "pong")
+        other = queue.join(b, "othello")
+        self.assertFalse(first.done())
+        self.assertEqual(len(queue), 2)
+        second = queue.join(c, "pong")
+        self.assertEqual(await first, (a, c))
+        self.assertEqual(await second, (a, c))
+        self.assertEqual(queue.waiters("othello"), [b])
+        self.assertEqual(queue.join(d, "othello").result(), (b, d))
+        self.assertEqual(len(queue), 0)
+        self.assertEqual(await other, (b, d))
+
+    async def test_leave_cancels_the_wait(self):
+        queue = Matchmaker()
+        a, b = StubSocket(1), StubSocket(2)
+        future = queue.join(a)
+        self.assertTrue(queue.leave(a))
+        self.assertTrue(future.cancelled())
+        self.assertFalse(queue.leave(a))
+        self.assertFalse(queue.join(b).done())
+        self.assertEqual(queue.waiters(), [b])
+
+    async def test_skips_waiters_that_timed_out(self):
+        queue = Matchmaker()
+        a, b, c = StubSocket(1), StubSocket(2), StubSocket(3)
+        stale = queue.join(a)
+        stale.cancel()
+        waiting = queue.join(b)
+        self.assertFalse(waiting.done())
+        self.assertEqual(queue.join(c).result(), (b, c))
+        self.assertEqual(len(queue), 0)
+
+
+class BinaryStateFrameTests(SimpleTestCase):
+    def test_round_trip(self):
+        frame = pack_state(42, 150.5, 75.25, -10.0, 7.0, 12.0, 30.0, 60.0)
+        self.assertEqual(len(frame), 33)
+        self.assertEqual(unpack_state(frame), {
+            "kind": FRAME_STATE, "tick": 42, "ball_x": 150.5, "ball_y": 75.25,
+            "ball_dx": -10.0, "ball_dy": 7.0, "radius": 12.0, "player_y": 30.0, "opponent_y": 60.0,
+        })
+
+    def test_unknown_protocols_fall_back_to_json(self):
+        self.assertEqual(negotiate("binary"), FORMAT_BINARY)
+        self.assertEqual(negotiate("msgpack"), "json")
+        self.assertEqual(negotiate(None), "json")
+
+    def test_each_side_gets_its_mirrored_view(self):
+        left, right = StubSocket(1), StubSocket(2)
+        left.frame_format = FORMAT_BINARY
+        game = GameLoop(left, right, seed=3, record=False, save_result=False)
+        game.serve()
+        left.y, right.y = 10, 40
+        game.store_data()
+        ball = game.ball
+        mine, theirs = (unpack_state(frame) for frame in game.frames)
+        self.assertEqual(mine["ball_x"], ball.x)
+        self.assertEqual(mine["ball_dx"], ball.dx)
+        self.assertEqual((mine["player_y"], mine["opponent_y"]), (10, 40))
+        self.assertEqual(theirs["ball_x"], game.canvas_width - ball.x)
+        self.assertEqual(theirs["ball_dx"], -ball.dx)
+        self.assertEqual((theirs["player_y"], theirs["opponent_y"]), (40, 10))
+
+
+class FailingSocket(StubSocket):
+    async def send_frame(self, frame):
+        raise ConnectionError("socket closed")
+
+
+class RoomBroadcastTests(SimpleTestCase):
+    async def test_frame_is_encoded_once_for_every_subscriber(self):
+        sockets = [StubSocket(i) for i in range(3)]
+        broadcast = RoomBroadcast(sockets)
+        await broadcast.publish({"status": "Game", "seq": 1})
+        frames = [socket.frames[0] for socket in sockets]
+        self.assertTrue(all(frame is frames[0] for frame in frames))
+        self.assertEqual(frames[0].status, "Game")
+        self.assertIs(frames[0].text, frames[0].text)
+        self.assertEqual(frames[0].text, '{"message": {"status": "Game", "seq": 1}}')
+
+    async def test_failing_socket_does_not_stop_the_others(self):
+        good, bad = StubSocket(1), FailingSocket(2)
+        broadcast = RoomBroadcast((bad, good))
+        await broadcast.deliver(Frame({"status": "RoundStart"}))
+        self.assertEqual(len(good.frames), 1)
+
+    async def test_unsubscribed_sockets_get_nothing(self):
+        first, second = StubSocket(1), StubSocket(2)
+        broadcast = RoomBroadcast((first,))
+        broadcast.subscribe(second)
+        broadcast.unsubscribe(first)
+        await broadcast.publish({"status": "Pause"})
+        self.assertEqual((len(first.frames), len(second.frames)), (0, 1))
+
+
+class DeltaSnapshotTests(SimpleTestCase):
+    def play(self, ticks, receive):
+        """Step a delta game; ``receive(snapshot)`` stands for the sockets"""
+        left, right = StubSocket(1), StubSocket(2)
+        left.frame_format = FORMAT_DELTA
+        game = GameLoop(left, right, seed=9, record=False, save_result=False)
+        game.canvas_width, game.canvas_height = 1900, 900
+        game.racquet = {'height': 900, 'width': 10}
+        game.serve()
+        for tick in range(ticks):
+            game.advance()
+            left.y = right.y = tick % 50
+            game.store_data()
+            receive(game.snapshot)
+
+    def test_client_rebuilds_every_snapshot_from_its_acks(self):
+        rng = random.Random(2)
+        clients = [{"acked": None, "baselines": {}} for _ in range(2)]
+        kinds = set()
+
+        def receive(snapshot):
+            for side, client in enumerate(clients):
+                if rng.random() < 0.2:
+                    # Lost on the way: the client keeps its older baseline.
+                    continue
+                frame = snapshot.encode(side, client["acked"])
+                kinds.add(frame[0])
+                seq, tick, fields = apply_snapshot(frame, client["baselines"])
+                self.assertEqual((seq, tick, fields), (snapshot.seq, snapshot.tick, snapshot.sides[side]))
+                client["baselines"][seq] = (tick, fields)
+                if rng.random() < 0.5:
+                    client["acked"] = seq
+
+        self.play(300, receive)
+        self.assertEqual(kinds, {FRAME_KEY, FRAME_DELTA})
+
+    def test_deltas_need_a_known_recent_baseline(self):
+        snapshots = []
+        self.play(SNAPSHOT_HISTORY + 2, snapshots.append)
+        latest = snapshots[-1]
+        self.assertEqual(latest.encode(0)[0], FRAME_KEY)
+        self.assertEqual(latest.encode(0, latest.seq - 1)[0], FRAME_DELTA)
+        self.assertLess(len(latest.encode(0, latest.seq - 1)), len(latest.encode(0)))
+        # Fallen out of the history.
+        self.assertEqual(latest.encode(0, snapshots[0].seq)[0], FRAME_KEY)
+
+    def test_encodings_are_shared_per_side_and_baseline(self):
+        history = SnapshotHistory()
+        Snapshot(1, 1, 12, ((1,) * 6, (2,) * 6), history)
+        snapshot = Snapshot(2, 2, 12, ((3,) * 6, (5,) * 6), history)
+        self.assertIs(snapshot.encode(0, 1), snapshot.encode(0, 1))
+        self.assertNotEqual(snapshot.encode(0, 1), snapshot.encode(1, 1))
+
+    def test_snapshot_interval(self):
+        self.assertEqual(snapshot_interval(60, 60), 1)
+        self.assertEqual(snapshot_interval(20, 60), 3)
+        self.assertEqual(snapshot_interval(120, 60), 1)
+
+
+class SimulationWorkerTests(SimpleTestCase):
+    FIRSTDATA = {'message': 'firstdata', 'canvas_width': 800, 'canvas_height': 400, 'racquet': {'height': 80, 'width': 8}}
+
+    async def frame(self, socket, status, timeout=15):
+        """The first message with ``status`` the socket got, waiting for it"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            for frame in socket.frames:
+                message = json.loads(frame.text)["message"]
+                if message["status"] == status:
+                    return message
+            await asyncio.sleep(0.05)
+        self.fail(f"no {status} frame within {timeout} s")
+
+    async def start(self, pool, room):
+        left, right = StubSocket(), StubSocket()
+        game = pool.create_game(room, left, right)
+        for socket, id in ((left, 1), (right, 2)):
+            await game.assign_data(dict(self.FIRSTDATA, id=id), socket)
+        return game, left
+
+    async def test_room_runs_in_a_worker_that_is_restarted_when_it_dies(self):
+        layer = InMemoryChannelLayer()
+        channel = await layer.new_channel()
+        await layer.group_add("simulated", channel)
+        pool = SimulationPool(1)
+        with mock.patch("game.workers.get_channel_layer", return_value=layer):
+            game, left = await self.start(pool, "simulated")
+            worker = game.worker
+            try:
+                await self.frame(left, "RoundStart")
+                await game.assign_racquet({'y': 123}, left)
+                # Rounds start after a few seconds, with the paddle moved.
+                self.assertEqual((await self.frame(left, "Game"))['player_2']['y'], 123)
+
+                process = worker.process
+                with self.assertLogs("game.workers", "ERROR"):
+                    process.kill()
+                    event = await asyncio.wait_for(layer.receive(channel), 10)
+                self.assertEqual(event, {"type": "terminate_game"})
+                self.assertTrue(game._game_over)
+                self.assertEqual(worker.games, {})
+                self.assertIsNot(worker.process, process)
+
+                game, left = await self.start(pool, "simulated-again")
+                self.assertIs(game.worker, worker)
+                await self.frame(left, "RoundStart")
+                game.close()
+            finally:
+                worker.task.cancel()
+                worker.outbox.put(None)
+                worker.process.kill()
+
+
+@skipIf(BatchPhysics is None, "numpy is not installed")
+class BatchPhysicsTests(SimpleTestCase):
+    def game(self, seed, tick_rate):
+        game = GameLoop(StubSocket(1), StubSocket(2), seed=seed, tick_rate=tick_rate, record=False, save_result=False)
+        game.canvas_width, game.canvas_height = 600, 300
+        game.racquet = {'height': 60, 'width': 10}
+        game.serve()
+        return game
+
+    def move_paddles(self, game, ball_y, tick):
+        # Paddles follow the ball with a drifting error, so most balls are
+        # returned and some get past.
+        error = (tick // 20 * 7 + game.seed * 13) % 80 - 40
+        left = right = ball_y - 30 + error
+        game.controler.y, game.opponent.y = left, right
+        if game.engine:
+            game.engine.set_paddle(game, True, left)
+            game.engine.set_paddle(game, False, right)
+
+    def test_matches_the_python_physics(self):
+        for tick_rate in (60, 20):
+            with self.subTest(tick_rate=tick_rate):
+                engine = BatchPhysics()
+                games = {}
+                for seed in range(12):
+                    batch, single = self.game(seed, tick_rate), self.game(seed, tick_rate)
+                    engine.add(batch)
+                    games[batch] = single
+                for tick in range(2000):
+                    if not engine:
+                        break
+                    for batch, single in games.items():
+                        self.move_paddles(batch, single.ball.y, tick)
+                        self.move_paddles(single, single.ball.y, tick)
+                    points = dict(engine.step())
+                    for batch, single in list(games.items()):
+                        if batch not in engine:
+                            continue
+                        scorer = single.advance()
+                        if scorer is None:
+                            self.assertNotIn(batch, points)
+                            continue
+                        self.assertIs(points[batch], batch.get_players()[single.get_players().index(scorer)])
+                        # Leaving the engine writes the state back to the game.
+                        engine.remove(batch)
+                        self.assertIsNone(batch.engine)
+                        self.assertEqual(batch.ticks, single.ticks)
+                        for field in ("x", "y", "dx", "dy"):
+                            self.assertAlmostEqual(getattr(batch.ball, field), getattr(single.ball, field), places=6)
+                self.assertEqual(len(engine), 0)
+
+    def test_due_games_are_marked_published(self):
+        engine = BatchPhysics(snapshot_every=3)
+        game = self.game(1, 60)
+        engine.add(game)
+        due = []
+        for _ in range(9):
+            engine.step()
+            due.append(bool(engine.due()))
+        self.assertEqual(due, [False, False, True] * 3)
+        self.assertEqual(engine.tick(game), 9)
+
+
+class InputCoalescerTests(SimpleTestCase):
+    def coalescer(self, **options):
+        applied = []
+
+        async def apply(y):
+            applied.append(y)
+
+        return InputCoalescer(apply, **options), applied
+
+    async def test_one_position_per_window(self):
+        inputs, applied = self.coalescer(max_rate=1000, window=0.05)
+        for y in range(5):
+            await inputs.push({'y': y})
+        # The first is applied at once, the last replaces the ones between.
+        self.assertEqual(applied, [0.0])
+        self.assertEqual(inputs.coalesced, 3)
+        await asyncio.sleep(0.08)
+        self.assertEqual(applied, [0.0, 4.0])
+
+    async def test_drops_stale_duplicate_and_invalid_inputs(self):
+        inputs, applied = self.coalescer(max_rate=1000, window=0)
+        await inputs.push({'y': 10, 'seq': 2})
+        await inputs.push({'y': 20, 'seq': 1})
+        await inputs.push({'y': 10, 'seq': 3})
+        await inputs.push({'y': 'top'})
+        await inputs.push({})
+        self.assertEqual(applied, [10.0])
+        self.assertEqual(inputs.dropped, 4)
+
+    async def test_rate_limit_allows_bursts_then_refills(self):
+        inputs, applied = self.coalescer(max_rate=50, burst=5, window=0)
+        with self.assertLogs("game.inputs", "WARNING"):
+            for y in range(20):
+                await inputs.push({'y': y})
+        self.assertEqual(applied, [0.0, 1.0, 2.0, 3.0, 4.0])
+        self.assertEqual(inputs.dropped, 15)
+        # 50 inputs a second: one more token every 20 ms.
+        await asyncio.sleep(0.05)
+        for y in range(100, 110):
+            await inputs.push({'y': y})
+        self.assertIn(len(applied), (7, 8))
+
+    async def test_close_drops_the_pending_position(self):
+        inputs, applied = self.coalescer(max_rate=1000, window=0.02)
+        await inputs.push({'y': 1})
+        await inputs.push({'y': 2})
+        inputs.close()
+        await asyncio.sleep(0.05)
+        self.assertEqual(applied, [1.0])
+
+
+class StoredReplay:
+    def __init__(self, log, player_1, player_2):
+        self.log = log
+        self.player_1 = player_1
+        self.player_2 = player_2
+
+
+class ReplayTests(SimpleTestCase):
+    def test_log_round_trip(self):
+        recorder = ReplayRecorder(1234, 60)
+        recorder.round(0, 1, 800.0, 400.0, 80.0)
+        recorder.serve(0)
+        recorder.move(3, 0, 120.5)
+        recorder.move(300, 1, 7.25)
+        recorder.move(301, 0, 0.0)
+        recorder.forfeit(400, 1)
+        recorder.end(400)
+        self.assertEqual(read_replay(recorder.dump()), (1234, 60, [
+            (EVENT_ROUND, 0, (1, 800.0, 400.0, 80.0)),
+            (EVENT_SERVE, 0, None),
+            (EVENT_MOVE_LEFT, 3, 120.5),
+            (EVENT_MOVE_RIGHT, 300, 7.25),
+            (EVENT_MOVE_LEFT, 301, 0.0),
+            (EVENT_FORFEIT, 400, 1),
+            (EVENT_END, 400, None),
+        ]))
+
+    async def test_playback_sends_the_frames_of_the_live_match(self):
+        left, right = StubSocket(1), StubSocket(2)
+        game = GameLoop(left, right, seed=77, record=True, save_result=False)
+        game.canvas_width, game.canvas_height = 800, 400
+        game.racquet = {'height': 80, 'width': 8}
+        rng = random.Random(4)
+        # Rounds as rounds_loop plays them, ticked as the scheduler does.
+        for round in range(1, 6):
+            await game.begin_round(round)
+            game.active = True
+            game.serve()
+            points = left.score + right.score
+            while left.score + right.score == points:
+                if game.ticks % 3 == 0:
+                    for player in (left, right):
+                        await game.assign_racquet({'y': game.ball.y - 40 + rng.uniform(-50, 50)}, player)
+                await game.tick()
+            await game.round_over()
+            if max(left.score, right.score) >= 3:
+                break
+        recorder, game.recorder = game.recorder, None
+        recorder.end(game.ticks)
+        await game.game_over()
+        live = [frame.text + "\n" for frame in left.frames]
+
+        replayed = [line async for line in play_replay(StoredReplay(recorder.dump(), 1, 2), speed=0)]
+        self.assertGreater(sum('"Game"' in line for line in live), 100)
+        self.assertEqual(replayed, live)
+
+
+class Watcher:
+    """A spectator socket; a held ``gate`` stands for a slow connection"""
+
+    def __init__(self):
+        self.sent = []
+        self.closed = False
+        self.gate = asyncio.Event()
+        self.gate.set()
+
+    async def send(self, text_data=None, bytes_data=None):
+        await self.gate.wait()
+        self.sent.append(json.loads(text_data)["message"])
+
+    async def close(self):
+        self.closed = True
+
+
+class ClosedWatcher(Watcher):
+    async def send(self, text_data=None, bytes_data=None):
+        raise ConnectionError("socket closed")
+
+
+class SpectatorTierTests(SimpleTestCase):
+    async def settle(self):
+        for _ in range(5):
+            await asyncio.sleep(0)
+
+    def tearDown(self):
+        for spectator in self.tier.spectators.values():
+            spectator.close()
+
+    async def test_state_frames_are_thinned_to_the_spectator_rate(self):
+        self.tier = SpectatorTier(every=3)
+        watcher = Watcher()
+        self.tier.add(watcher)
+        for seq in range(1, 10):
+            await self.tier.send_frame(Frame({"status": "Game", "seq": seq}))
+            await self.settle()
+        await self.tier.send_frame(Frame({"status": "RoundEnd"}))
+        await self.settle()
+        self.assertEqual([m.get("seq") for m in watcher.sent], [3, 6, 9, None])
+
+    async def test_slow_spectator_skips_frames_without_stalling_the_room(self):
+        self.tier = SpectatorTier()
+        players = [StubSocket(1), StubSocket(2)]
+        broadcast = RoomBroadcast(players)
+        broadcast.subscribe(self.tier)
+        fast, slow = Watcher(), Watcher()
+        slow.gate.clear()
+        self.tier.add(fast)
+        self.tier.add(slow)
+        for seq in range(1, 6):
+            await asyncio.wait_for(broadcast.publish({"status": "Game", "seq": seq}), 1)
+            await self.settle()
+        await broadcast.publish({"status": "Pause"})
+        await self.settle()
+        self.assertEqual([len(p.frames) for p in players], [6, 6])
+        self.assertEqual(len(fast.sent), 6)
+        self.assertEqual(slow.sent, [])
+
+        slow.gate.set()
+        await self.settle()
+        # Stuck on the first frame, then only the latest state and the event.
+        self.assertEqual([m.get("seq") for m in slow.sent], [1, 5, None])
+
+    async def test_failing_spectator_is_dropped(self):
+        self.tier = SpectatorTier()
+        good, bad = Watcher(), ClosedWatcher()
+        self.tier.add(good)
+        self.tier.add(bad)
+        with self.assertLogs("game.spectators", "INFO"):
+            await self.tier.send_frame(Frame({"status": "Game", "seq": 1}))
+            await self.settle()
+        self.assertTrue(self.tier.spectators[bad].task.done())
+        await self.tier.send_frame(Frame({"status": "GameOver"}))
+        await self.settle()
+        self.assertEqual(len(good.sent), 2)
+        self.assertTrue(good.closed)
+
+    async def test_players_are_not_sent_through_the_tier(self):
+        self.tier = SpectatorTier(every=2)
+        players = [StubSocket(1), StubSocket(2)]
+        broadcast = RoomBroadcast(players)
+        broadcast.subscribe(self.tier)
+        watcher = Watcher()
+        self.tier.add(watcher)
+        for seq in range(1, 5):
+            await broadcast.publish({"status": "Game", "seq": seq})
+            await self.settle()
+        self.assertEqual(list(self.tier.spectators), [watcher])
+        self.assertEqual([f.message["seq"] for f in players[0].frames], [1, 2, 3, 4])
+        self.assertEqual([m["seq"] for m in watcher.sent], [2, 4])
+
+
+class FrameSocket:
+    """Writes frames the way GameConsumer does, into a list"""
+
+    send_frame = GameConsumer.send_frame
+
+    def __init__(self, frame_format, side=0):
+        self.frame_format = frame_format
+        self.side = side
+        self.acked_seq = None
+        self.sent = []
+
+    async def send(self, text_data=None, bytes_data=None):
+        self.sent.append(text_data if bytes_data is None else bytes_data)
+
+
+class GameMetricsTests(SimpleTestCase):
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_tick_observer(self):
+        ticks = self.sample("pong_tick_duration_seconds_count")
+        late = self.sample("pong_tick_lateness_seconds_bucket", le="0.002")
+        catch_up = self.sample("pong_tick_catch_up_steps_total")
+        observe_tick(10.0, 0.001, 0.003, 1)
+        observe_tick(10.1, 0.2, 0.004, 4)
+        self.assertEqual(self.sample("pong_tick_duration_seconds_count"), ticks + 2)
+        self.assertEqual(self.sample("pong_tick_lateness_seconds_bucket", le="0.002"), late + 1)
+        self.assertEqual(self.sample("pong_tick_catch_up_steps_total"), catch_up + 3)
+
+    async def test_frames_are_counted_by_the_format_sent(self):
+        history = SnapshotHistory()
+        sides = ((16,) * 6, (32,) * 6)
+        frame = Frame(
+            {"status": "Game"},
+            binary=[b"left", b"right"],
+            snapshot=Snapshot(1, 1, 12, sides, history),
+        )
+        sockets = [FrameSocket("json"), FrameSocket(FORMAT_BINARY, side=1), FrameSocket(FORMAT_DELTA)]
+        before = {socket.frame_format: self.sample("pong_frames_sent_total", format=socket.frame_format) for socket in sockets}
+        for socket in sockets:
+            await socket.send_frame(frame)
+        self.assertEqual(sockets[0].sent, [frame.text])
+        self.assertEqual(sockets[1].sent, [b"right"])
+        self.assertEqual(sockets[2].sent[0][0], FRAME_KEY)
+        for socket in sockets:
+            self.assertEqual(self.sample("pong_frames_sent_total", format=socket.frame_format), before[socket.frame_format] + 1)
+
+
+class RatedMatchmakerTests(SimpleTestCase):
+    async def test_pairs_the_closest_rating_within_the_window(self):
+        queue = RatedMatchmaker(base_window=100, growth=0)
+        players = {rating: StubSocket(rating) for rating in (1000, 1500, 1090, 1480)}
+        futures = {rating: queue.join(player, rating) for rating, player in players.items()}
+        self.assertEqual(futures[1090].result(), (players[1000], players[1090]))
+        self.assertEqual(futures[1480].result(), (players[1500], players[1480]))
+        self.assertEqual(len(queue), 0)
+        self.assertEqual(list(queue.ladder), [])
+        queue.task.cancel()
+
+    async def test_window_widens_while_waiting(self):
+        queue = RatedMatchmaker(base_window=50, growth=2000, interval=0.02)
+        low, high = StubSocket(1), StubSocket(2)
+        first = queue.join(low, 1000)
+        second = queue.join(high, 1200)
+        self.assertFalse(second.done())
+        self.assertEqual(await asyncio.wait_for(first, 1), (low, high))
+        await asyncio.wait_for(queue.task, 1)
+
+    async def test_duplicates_and_leave(self):
+        queue = RatedMatchmaker(base_window=10, growth=0, interval=10)
+        player, impostor = StubSocket(1), StubSocket(1)
+        future = queue.join(player, 1000)
+        with self.assertRaises(ValueError):
+            queue.join(StubSocket(1), 1000)
+        self.assertIn(1, queue)
+        self.assertFalse(queue.leave(impostor))
+        self.assertTrue(queue.leave(player))
+        self.assertTrue(future.cancelled())
+        self.assertNotIn(1, queue)
+        self.assertEqual(list(queue.ladder), [])
+        queue.task.cancel()
+
+    async def test_skips_tickets_that_timed_out(self):
+        queue = RatedMatchmaker(base_window=100, growth=0, interval=10)
+        a, b, c = StubSocket(1), StubSocket(2), StubSocket(3)
+        queue.join(a, 1000).cancel()
+        self.assertFalse(queue.join(b, 1010).done())
+        self.assertEqual(queue.join(c, 1005).result(), (b, c))
+        self.assertEqual(len(queue), 0)
+        queue.task.cancel()
+
+
+class QueuedSocket:
+    def __init__(self, id, channel_layer, channel_name):
+        self.id = id
+        self.channel_layer = channel_layer
+        self.channel_name = channel_name
+
+
+@skipIf(fakeredis is None, "fakeredis[lua] is not installed")
+class RedisMatchStoreTests(SimpleTestCase):
+    def setUp(self):
+        self.server = fakeredis.FakeServer()
+        self.layer = InMemoryChannelLayer()
+        self.stores = []
+
+    def tearDown(self):
+        for store in self.stores:
+            if store.task:
+                store.task.cancel()
+
+    def worker(self):
+        """The match store of one more worker, on the shared Redis"""
+        client = fakeredis.FakeAsyncRedis(server=self.server, decode_responses=True)
+        with mock.patch("redis.asyncio.Redis.from_url", return_value=client):
+            store = RedisMatchStore("redis://matchmaking", base_window=100, growth=0, interval=60)
+        self.stores.append(store)
+        return store
+
+    async def socket(self, id):
+        return QueuedSocket(id, self.layer, await self.layer.new_channel())
+
+    async def game_consumer(self, room):
+        consumer = GameConsumer()
+        consumer.channel_layer = self.layer
+        consumer.channel_name = await self.layer.new_channel()
+        consumer.room_group_name = room
+        consumer.relay_to = None
+        consumer.peers = {}
+        return consumer
+
+    async def test_pairs_players_queued_on_different_workers(self):
+        first, second = self.worker(), self.worker()
+        a, b = await self.socket("1"), await self.socket("2")
+        waiting = await first.join_queue(a, 1000)
+        self.assertFalse(waiting.done())
+        self.assertEqual((await second.join_queue(b, 1050)).result(), ("1", "2"))
+        # The pairing worker tells the other one through the channel layer.
+        event = await self.layer.receive(a.channel_name)
+        self.assertEqual(event["type"], "matched")
+        first.matched(a, event["pair"])
+        self.assertEqual(waiting.result(), ("1", "2"))
+        self.assertEqual((first.queued(), second.queued()), (0, 0))
+
+    async def test_duplicate_join_keeps_the_first_socket(self):
+        first, second = self.worker(), self.worker()
+        a, again, elsewhere = await self.socket("1"), await self.socket("1"), await self.socket("1")
+        waiting = await first.join_queue(a, 1000)
+        self.assertIsNone(await first.join_queue(again, 1000))
+        self.assertIsNone(await second.join_queue(elsewhere, 1000))
+        await first.leave_queue(again)
+        self.assertIs(first.waiting["1"][0], a)
+        self.assertEqual(second.queued(), 0)
+        b = await self.socket("2")
+        await second.join_queue(b, 1000)
+        first.matched(a, (await self.layer.receive(a.channel_name))["pair"])
+        self.assertEqual(waiting.result(), ("1", "2"))
+
+    async def test_leave_takes_the_ticket_out_of_redis(self):
+        store = self.worker()
+        a, b = await self.socket("1"), await self.socket("2")
+        waiting = await store.join_queue(a, 1000)
+        await store.leave_queue(a)
+        self.assertEqual(await store.redis.hlen(store.tickets), 0)
+        self.assertFalse((await store.join_queue(b, 1000)).done())
+        self.assertFalse(waiting.done())
+
+    async def test_game_socket_relays_to_a_waiter_on_another_worker(self):
+        first, second = self.worker(), self.worker()
+        owner, joiner = await self.game_consumer("room"), await self.game_consumer("room")
+        joiner.player_id = 7
+        owner.pairing = await first.join_room("room", owner)
+        self.assertFalse(owner.pairing.done())
+        self.assertEqual((await second.join_room("room", joiner)).result(), (None, joiner))
+        self.assertEqual(joiner.relay_to, owner.channel_name)
+
+        event = await self.layer.receive(owner.channel_name)
+        self.assertEqual(event, {"type": "room_paired", "channel": joiner.channel_name, "player": 7})
+        with mock.patch("game.consumers.get_match_store", return_value=first):
+            await owner.room_paired(event)
+        _, peer = owner.pairing.result()
+        self.assertEqual((peer.channel_name, peer.player_id), (joiner.channel_name, 7))
+        self.assertEqual(first.waiting_rooms(), 0)
+
+        # Frames for the peer go to its socket's worker, its messages come back.
+        await peer.send(text_data="frame")
+        self.assertEqual(await self.layer.receive(joiner.channel_name), {"type": "peer_frame", "text": "frame", "bytes": None})
+        await joiner.receive('{"message": "ack", "seq": 3}')
+        await owner.peer_message(await self.layer.receive(owner.channel_name))
+        self.assertEqual(peer.acked_seq, 3)
+
+    async def test_ready_count_is_shared(self):
+        first, second = self.worker(), self.worker()
+        self.assertEqual(await first.ready("room"), 1)
+        self.assertEqual(await second.ready("room"), 2)
+        await first.unready("room")
+        await second.unready("room")
+        self.assertEqual(await first.redis.exists("matchmaking:ready:room"), 0)
+
+
+class Room:
+    def __init__(self):
+        self.over = False
+        self.scores = [0] * 100
+
+
+class RegistryTests(SimpleTestCase):
+    async def test_reaps_entries_nobody_used_for_ttl(self):
+        expired = []
+
+        async def on_expire(key, room):
+            expired.append(key)
+
+        rooms = Registry("test_ttl", 0.05, on_expire=on_expire, interval=60)
+        rooms["used"], rooms["forgotten"] = Room(), Room()
+        await asyncio.sleep(0.03)
+        rooms["used"]
+        await asyncio.sleep(0.03)
+        self.assertEqual(await rooms.reap(), 1)
+        self.assertEqual(expired, ["forgotten"])
+        self.assertEqual(list(rooms), ["used"])
+        self.assertGreater(rooms.bytes, approximate_size([0] * 100))
+        rooms.task.cancel()
+
+    async def test_finished_entries_get_a_grace_period(self):
+        rooms = Registry("test_grace", 3600, grace=10, finished=lambda room: room.over, interval=60)
+        room = rooms["room"] = Room()
+        self.assertEqual(await rooms.reap(now=1000), 0)
+        room.over = True
+        self.assertEqual(await rooms.reap(now=1001), 0)
+        # Looking it up does not keep a finished room alive.
+        rooms["room"]
+        self.assertEqual(await rooms.reap(now=1010), 0)
+        self.assertEqual(await rooms.reap(now=1011), 1)
+        self.assertEqual(len(rooms), 0)
+        rooms.task.cancel()
+
+    async def test_reaper_stops_once_empty(self):
+        rooms = Registry("test_reaper", 0, interval=0.01)
+        rooms["room"] = Room()
+        await asyncio.wait_for(rooms.task, 1)
+        self.assertEqual(len(rooms), 0)
+        self.assertEqual(rooms.bytes, 0)
+
+    def test_size_skips_excluded_types(self):
+        room = Room()
+        room.socket = StubSocket(1)
+        room.socket.frames = [b"x" * 10000]
+        self.assertGreater(approximate_size(room), 10000)
+        self.assertLess(approximate_size(room, exclude=(StubSocket,)), 10000)
+
+
+class GameLoopRoundTests(SimpleTestCase):
+    def game(self):
+        game = GameLoop(StubSocket(1), StubSocket(2), seed=5, record=False, save_result=False)
+        game.serve()
+        game._round = asyncio.get_running_loop().create_future()
+        return game
+
+    def test_ball_has_no_instance_dict(self):
+        ball = Ball(1, 2, 3, 4, 5)
+        self.assertFalse(hasattr(ball, "__dict__"))
+        with self.assertRaises(AttributeError):
+            ball.speed = 1
+
+    async def test_point_ends_the_round_with_the_scorer(self):
+        game = self.game()
+        game.score_point(game.opponent)
+        self.assertIs(game._round.result(), game.opponent)
+        self.assertEqual((game.controler.score, game.opponent.score), (0, 1))
+
+    async def test_stopped_game_ends_the_round_without_a_scorer(self):
+        game = self.game()
+        game.active = False
+        await game.tick()
+        self.assertIsNone(game._round.result())
+        self.assertEqual(game.ticks, 0)
+
+    async def test_physics_error_ends_the_round_with_it(self):
+        game = self.game()
+        game.active = True
+        game.ball = None
+        await game.tick()
+        self.assertIsInstance(game._round.exception(), AttributeError)
+
+
+class SweepTests(SimpleTestCase):
+    def random_ball(self, rng):
+        return Ball(rng.uniform(20, 580), rng.uniform(20, 280), rng.uniform(-30, 30), rng.uniform(-30, 30), 12)
+
+    def run_sweeps(self, ball, duration, parts, paddles):
+        ball = Ball(ball.x, ball.y, ball.dx, ball.dy, ball.radius)
+        for _ in range(parts):
+            missed = sweep(ball, duration / parts, 600, 300, 80, *paddles)
+            if missed is not None:
+                return ball, missed
+        return ball, None
+
+    def test_split_timesteps_give_the_same_outcome(self):
+        rng = random.Random(18)
+        for _ in range(300):
+            ball = self.random_ball(rng)
+            paddles = (rng.uniform(0, 220), rng.uniform(0, 220))
+            duration = rng.uniform(1, 40)
+            whole, missed = self.run_sweeps(ball, duration, 1, paddles)
+            for parts in (2, 3, 8):
+                with self.subTest(parts=parts):
+                    split_ball, split_missed = self.run_sweeps(ball, duration, parts, paddles)
+                    self.assertEqual(split_missed, missed)
+                    for field in ("x", "y", "dx", "dy"):
+                        self.assertAlmostEqual(getattr(split_ball, field), getattr(whole, field), places=6)
+
+    def test_fast_ball_does_not_tunnel_through_a_paddle(self):
+        # Crosses the whole court several times in one sweep.
+        ball = Ball(300, 150, 500, 0, 12)
+        self.assertIsNone(sweep(ball, 5, 600, 300, 80, 110, 110))
+        self.assertTrue(12 <= ball.x <= 588)
+        ball = Ball(300, 150, 500, 0, 12)
+        self.assertEqual(sweep(ball, 5, 600, 300, 80, 110, 0), RIGHT)
+        self.assertEqual(ball.x, 588)
+
+    def test_miss_rests_on_the_goal_line(self):
+        ball = Ball(100, 150, -30, 0, 12)
+        self.assertEqual(sweep(ball, 10, 600, 300, 80, 0, 110), LEFT)
+        self.assertAlmostEqual(ball.x, 12)
+        self.assertLess(ball.dx, 0)
+
+
+class ResultQueueTests(SimpleTestCase):
+    def setUp(self):
+        # The batches go through the database pool as they would, but are
+        # only collected here.
+        self.batches = []
+
+        def write_results(batch):
+            self.batches.append(batch)
+            return len(batch)
+
+        patcher = mock.patch("game.results.write_results", write_results)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_full_batches_are_written_at_once(self):
+        queue = ResultQueue(interval=0.05, max_batch=3)
+        for match in range(7):
+            queue.put(match + 1, match + 100, 3, match % 3)
+        await asyncio.sleep(0.02)
+        self.assertEqual([len(batch) for batch in self.batches], [3, 3])
+        await asyncio.wait_for(queue.task, 1)
+        self.assertEqual([len(batch) for batch in self.batches], [3, 3, 1])
+        self.assertEqual(self.batches[0][0], (1, 100, 3, 0))
+        self.assertEqual(queue.pending, [])
+
+    async def test_results_wait_for_the_interval(self):
+        queue = ResultQueue(interval=0.05)
+        queue.put(1, 2, 3, 1)
+        queue.put("3", "4", 0, 3)
+        await asyncio.sleep(0.01)
+        self.assertEqual(self.batches, [])
+        await asyncio.wait_for(queue.task, 1)
+        self.assertEqual(self.batches, [[(1, 2, 3, 1), (3, 4, 0, 3)]])
+
+    async def test_invalid_players_are_not_queued(self):
+        queue = ResultQueue(interval=0.05)
+        queue.put("guest", 2, 3, 1)
+        queue.put(None, 2, 3, 1)
+        queue.put(5, 5, 3, 1)
+        self.assertEqual(queue.pending, [])
+        self.assertIsNone(queue.task)
+
+    async def test_failed_batch_is_dropped_and_logged(self):
+        queue = ResultQueue(interval=0.01)
+        queue.put(1, 2, 3, 1)
+        with mock.patch("game.results.write_results", side_effect=RuntimeError("database down")):
+            with self.assertLogs("game.results", "ERROR"):
+                await asyncio.wait_for(queue.task, 1)
+        self.assertEqual(queue.pending, [])
+        queue.put(1, 2, 3, 2)
+        await asyncio.wait_for(queue.task, 1)
+        self.assertEqual(self.batches, [[(1, 2, 3, 2)]])
+
+
+class MatchResultTests(SimpleTestCase):
+    FIRSTDATA = {'canvas_width': 800, 'canvas_height': 400, 'racquet': {'height': 80, 'width': 8}}
+
+    async def finish(self, sockets, claims):
+        game = GameLoop(*sockets, seed=1, record=False)
+        for socket, claim in zip(sockets, claims):
+            await game.assign_data(dict(self.FIRSTDATA, **claim), socket)
+        # Both sent their first data: skip the match itself.
+        game.task.cancel()
+        game.controler.score = 3
+        with mock.patch("game.clients.results") as results:
+            await game.game_over()
+        return game, results.put.call_args_list
+
+    async def test_result_goes_to_the_authenticated_players(self):
+        left, right = StubSocket(), StubSocket()
+        left.player_id, right.player_id = 11, 12
+        game, calls = await self.finish((left, right), ({'id': 99, 'save': True}, {'id': 98, 'save': True}))
+        self.assertEqual((game.controler.id, game.opponent.id), (11, 12))
+        self.assertEqual(calls, [mock.call(11, 12, 3, 0)])
+
+    async def test_result_needs_both_players_to_ask_for_it(self):
+        left, right = StubSocket(), StubSocket()
+        left.player_id, right.player_id = 11, 12
+        _, calls = await self.finish((left, right), ({'id': 11, 'save': True}, {'id': 12}))
+        self.assertEqual(calls, [])
+
+    async def test_anonymous_players_are_not_recorded(self):
+        left, right = StubSocket(), StubSocket()
+        left.player_id, right.player_id = 11, None
+        game, calls = await self.finish((left, right), ({'id': 11, 'save': True}, {'id': 12, 'save': True}))
+        # An anonymous socket is shown under the id it claims.
+        self.assertEqual(game.opponent.id, 12)
+        self.assertEqual(calls, [])
+
+
+request_id = contextvars.ContextVar("request_id", default=None)
+
+
+def where():
+    return threading.current_thread().name, request_id.get()
+
+
+class DatabasePoolTests(SimpleTestCase):
+    async def test_run_calls_on_a_database_thread(self):
+        request_id.set(7)
+        thread, seen = await run(where)
+        self.assertTrue(thread.startswith("database"), thread)
+        self.assertEqual(seen, 7)
+        self.assertEqual(await run(round, 2.567, ndigits=1), 2.6)
+        with self.assertRaises(ZeroDivisionError):
+            await run(divmod, 1, 0)
+
+    async def test_decorated_function_is_awaited_in_the_pool(self):
+        @database
+        def lookup(key, default=None):
+            return where()[0], key, default
+
+        count = REGISTRY.get_sample_value(
+            "db_call_duration_seconds_count", {"call": lookup.__qualname__}
+        ) or 0
+        self.assertTrue(asyncio.iscoroutinefunction(lookup))
+        self.assertEqual(lookup.__name__, "lookup")
+        thread, key, default = await lookup("a", default=1)
+        self.assertTrue(thread.startswith("database"), thread)
+        self.assertEqual((key, default), ("a", 1))
+        self.assertEqual(REGISTRY.get_sample_value(
+            "db_call_duration_seconds_count", {"call": lookup.__qualname__}
+        ), count + 1)
+
+    async def test_only_pool_threads_keep_their_connections(self):
+        def connection_settings():
+            settings_dict = connections["default"].settings_dict
+            return settings_dict["CONN_MAX_AGE"], settings_dict["CONN_HEALTH_CHECKS"]
+
+        self.assertEqual(await run(connection_settings), (settings.DATABASE_CONN_MAX_AGE, True))
+        self.assertEqual(connection_settings()[0], settings.DATABASES["default"].get("CONN_MAX_AGE", 0))
+
+
+# Move sequences from the start position, passes included.
+PERFT = {1: 4, 2: 12, 3: 56, 4: 244, 5: 1396, 6: 8200, 7: 55092, 8: 390216}
+
+STEPS = [(dr, dc) for dr in (-1, 0, 1) for dc in (-1, 0, 1) if dr or dc]
+
+
+def naive_flips(rows, row, col, player):
+    """The squares ``player`` flips at ``row``, ``col``, walking each direction"""
+    if rows[row][col] != EMPTY:
+        return []
+    opponent = WHITE if player == BLACK else BLACK
+    flipped = []
+    for dr, dc in STEPS:
+        line = []
+        r, c = row + dr, col + dc
+        while 0 <= r < 8 and 0 <= c < 8 and rows[r][c] == opponent:
+            line.append((r, c))
+            r, c = r + dr, c + dc
+        if line and 0 <= r < 8 and 0 <= c < 8 and rows[r][c] == player:
+            flipped += line
+    return flipped
+
+
+def bits(cells):
+    result = 0
+    for row, col in cells:
+        result |= square(row, col)
+    return result
+
+
+class OthelloPerftTests(SimpleTestCase):
+    def test_start_position(self):
+        for depth, count in PERFT.items():
+            with self.subTest(depth=depth):
+                self.assertEqual(perft(START_BLACK, START_WHITE, depth), count)
+
+    def test_finished_game_is_a_leaf(self):
+        full = (1 << 64) - 1
+        self.assertEqual(perft(full, 0, 3), 1)
+
+
+class OthelloMoveTests(SimpleTestCase):
+    def test_matches_square_by_square_rules(self):
+        rng = random.Random(7)
+        for _ in range(40):
+            black, white, color = START_BLACK, START_WHITE, BLACK
+            while True:
+                player, opponent = (black, white) if color == BLACK else (white, black)
+                rows = to_rows(black, white)
+                expected = {
+                    (row, col): bits(naive_flips(rows, row, col, color))
+                    for row in range(8)
+                    for col in range(8)
+                }
+                expected = {cell: flipped for cell, flipped in expected.items() if flipped}
+                moves = legal_moves(player, opponent)
+                self.assertEqual(moves, bits(expected))
+                for (row, col), flipped in expected.items():
+                    self.assertEqual(flips(player, opponent, square(row, col)), flipped)
+                if not moves:
+                    if not legal_moves(opponent, player):
+                        break
+                else:
+                    move = square(*rng.choice(sorted(expected)))
+                    player, opponent = play(player, opponent, move)
+                    black, white = (player, opponent) if color == BLACK else (opponent, player)
+                color = WHITE if color == BLACK else BLACK
+
+    def test_rows_round_trip(self):
+        rows = to_rows(START_BLACK, START_WHITE)
+        self.assertEqual(rows[3][3], WHITE)
+        self.assertEqual(rows[3][4], BLACK)
+        self.assertEqual(from_rows(rows), (START_BLACK, START_WHITE))
+
+
+class OthelloBoardTests(SimpleTestCase):
+    def test_tracks_moves_counts_and_passes(self):
+        rng = random.Random(11)
+        passes = 0
+        for _ in range(60):
+            board = Board()
+            while not board.game_over:
+                color = board.to_move
+                row, col = rng.choice(board.legal_squares(color))
+                _, passed = board.play(row, col)
+                black, white = board.discs[BLACK], board.discs[WHITE]
+                self.assertEqual(board.moves[BLACK], legal_moves(black, white))
+                self.assertEqual(board.moves[WHITE], legal_moves(white, black))
+                self.assertEqual(board.score(), {BLACK: black.bit_count(), WHITE: white.bit_count()})
+                if passed:
+                    passes += 1
+                    self.assertEqual(board.to_move, color)
+                else:
+                    self.assertNotEqual(board.to_move, color)
+                self.assertTrue(board.game_over or board.moves[board.to_move])
+            self.assertFalse(legal_moves(black, white) or legal_moves(white, black))
+        self.assertGreater(passes, 0)
+
+    def test_starts_with_the_side_that_can_move(self):
+        # White has no move here, so black moves first anyway.
+        rows = [[EMPTY] * 8 for _ in range(8)]
+        rows[0][0], rows[0][1] = BLACK, WHITE
+        board = Board(*from_rows(rows), to_move=WHITE)
+        self.assertEqual(board.to_move, BLACK)
+        _, passed = board.play(0, 2)
+        self.assertFalse(passed)
+        self.assertTrue(board.game_over)
+        self.assertEqual(board.winner(), BLACK)
+
+
+class StubExecutor:
+    """Holds the submitted jobs until the test runs them"""
+
+    def __init__(self):
+        self.jobs = []
+
+    def submit(self, fn, *args):
+        future = Future()
+        self.jobs.append((future, fn, args))
+        return future
+
+    def run(self):
+        for future, fn, args in self.jobs:
+            if not future.done():
+                future.set_result(fn(*args))
+
+
+class SearchPoolTests(SimpleTestCase):
+    def stub_pool(self, size=2, max_pending=2):
+        pool = SearchPool(size, max_pending)
+        pool.executor = StubExecutor()
+        return pool
+
+    async def test_rejects_searches_over_max_pending(self):
+        pool = self.stub_pool(max_pending=1)
+        first = asyncio.create_task(pool.search(START_BLACK, START_WHITE, 60, 4))
+        await asyncio.sleep(0)
+        with self.assertRaises(AIUnavailable):
+            await pool.search(START_BLACK, START_WHITE, 60, 4)
+        pool.executor.run()
+        self.assertTrue(legal_moves(START_BLACK, START_WHITE) & (await first).move)
+        self.assertEqual((pool.pending, len(pool.executor.jobs)), (0, 1))
+
+    async def test_cancelling_drops_the_queued_jobs(self):
+        pool = self.stub_pool()
+        # The room closed: the consumer cancels the task awaiting the search.
+        task = asyncio.create_task(pool.search(START_BLACK, START_WHITE, 60, 4, parallel=True))
+        await asyncio.sleep(0)
+        self.assertEqual(pool.pending, 2)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        self.assertTrue(all(job.cancelled() for job, _, _ in pool.executor.jobs))
+        self.assertEqual(pool.pending, 0)
+
+    async def test_broken_pool_is_replaced(self):
+        pool = SearchPool(1, 2)
+        try:
+            result = await pool.search(START_BLACK, START_WHITE, 20, 2)
+            self.assertTrue(legal_moves(START_BLACK, START_WHITE) & result.move)
+
+            for process in pool.executor._processes.values():
+                process.kill()
+            with self.assertLogs("game.othello_workers", "ERROR"), self.assertRaises(AIUnavailable):
+                for _ in range(10):
+                    # The pool may only notice once a job is submitted.
+                    await pool.search(START_BLACK, START_WHITE, 20, 2)
+                    await asyncio.sleep(0.1)
+            self.assertIsNone(pool.executor)
+            self.assertEqual(pool.pending, 0)
+
+            result = await pool.search(START_BLACK, START_WHITE, 20, 2)
+            self.assertTrue(legal_moves(START_BLACK, START_WHITE) & result.move)
+        finally:
+            pool.shutdown()
+
+
+class OthelloSplitSearchTests(SimpleTestCase):
+    def test_split_search_scores_as_a_whole_search(self):
+        rng = random.Random(5)
+        for _ in range(12):
+            player, opponent = START_BLACK, START_WHITE
+            for _ in range(rng.randrange(4, 40)):
+                moves = legal_moves(player, opponent)
+                if moves:
+                    move = rng.choice([1 << index for index in range(64) if moves >> index & 1])
+                    player, opponent = play(player, opponent, move)
+                player, opponent = opponent, player
+            if not legal_moves(player, opponent):
+                continue
+            whole = search(player, opponent, 60, 4)
+            for parts in (2, 3, 8):
+                with self.subTest(parts=parts):
+                    result = merge([
+                        deepen(player, opponent, 60, 4, moves)
+                        for moves in split(player, opponent, parts)
+                    ])
+                    self.assertEqual(result.depth, whole.depth)
+                    self.assertEqual(result.score, whole.score)
+                    self.assertTrue(legal_moves(player, opponent) & result.move)
@@ -13,6 +13,8 @@ urlpatterns = [
         views.getGameHistoryByUserName,
         name="getGameHistoryByUserName",
     ),
+    path("replays/me/", views.getMyReplays, name="getMyReplays"),
+    path("replays/<int:replay_id>/", views.playReplay, name="playReplay"),
     # Othello endpoints
     path("othello/history/", views.othello_game_history, name="othello_game_history"),
     path("othello/stats/", views.othello_stats, name="othello_stats"),
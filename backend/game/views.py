@@ -2,16 +2,19 @@ from rest_framework.decorators import api_view, permission_classes
 from django.views.decorators.csrf import csrf_exempt
 
 from rest_framework import status
-from django.http import JsonResponse
+from django.db.models import Q
+from django.http import JsonResponse, StreamingHttpResponse
 from rest_framework.permissions import IsAuthenticated
-from .models import GamePlay, GameHestory, OthelloGameHistory, OthelloStats
+from .models import GamePlay, GameHestory, GameReplay, OthelloGameHistory, OthelloStats
 from .serializers import (
     GamePlaySerializer,
     GameHestorySerializer,
+    GameReplaySerializer,
     OthelloGameHistorySerializer,
     OthelloStatsSerializer,
     OthelloLeaderboardSerializer,
 )
+from .replay import play
 from Player.Models.PlayerModel import Player
 
 
@@ -91,6 +94,52 @@ def getGameHistoryByUserName(request, username):
         )
 
 
+@csrf_exempt
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def getMyReplays(request):
+    try:
+        player = Player.objects.get(user=request.user)
+    except Player.DoesNotExist:
+        return JsonResponse(
+            {"error": "User profile does not exist"}, status=status.HTTP_404_NOT_FOUND
+        )
+    replays = GameReplay.objects.filter(Q(player_1=player.id) | Q(player_2=player.id))
+    serializer = GameReplaySerializer(replays, many=True)
+    return JsonResponse(serializer.data, safe=False, status=status.HTTP_200_OK)
+
+
+@csrf_exempt
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def playReplay(request, replay_id):
+    """Stream a recorded match of the user as JSON lines, re-simulated from its log"""
+    try:
+        player = Player.objects.get(user=request.user)
+    except Player.DoesNotExist:
+        return JsonResponse(
+            {"error": "User profile does not exist"}, status=status.HTTP_404_NOT_FOUND
+        )
+    try:
+        # Other players' matches are reported as missing, not as forbidden.
+        replay = GameReplay.objects.get(
+            Q(player_1=player.id) | Q(player_2=player.id), id=replay_id
+        )
+    except GameReplay.DoesNotExist:
+        return JsonResponse(
+            {"error": "Replay does not exist"}, status=status.HTTP_404_NOT_FOUND
+        )
+    try:
+        speed = max(0.0, float(request.GET.get("speed", 1)))
+    except ValueError:
+        return JsonResponse(
+            {"error": "speed must be a number"}, status=status.HTTP_400_BAD_REQUEST
+        )
+    return StreamingHttpResponse(
+        play(replay, speed), content_type="application/x-ndjson"
+    )
+
+
 # Othello API Views
 @csrf_exempt
 @api_view(["GET", "POST"])
@@ -0,0 +1,369 @@
+import json
+import zlib
+import queue
+import asyncio
+import logging
+import threading
+import multiprocessing
+
+import django
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from .broadcast import Frame, RoomBroadcast
+from .clients import GameLoop
+from .metrics import observe_tick
+from .protocol import FORMAT_JSON, POSITION_SCALE, Snapshot, SnapshotHistory, negotiate
+from .scheduler import scheduler
+
+logger = logging.getLogger(__name__)
+
+CANCEL_TIMEOUT = 1
+TICK_REPORT_INTERVAL = 1
+
+# Pong simulations can run in separate worker processes so that a slow view
+# or consumer on the main event loop never delays ball physics. Each room is
+# pinned to one worker by the hash of its name. The GameConsumers stay in the
+# main process and talk to their worker over a pipe:
+#
+#   main -> worker   ("create", room)
+#                    ("firstdata", room, side, data, player_id)
+#                    ("move", room, side, data)
+#                    ("pause", room) / ("resume", room)
+#                    ("cancel", room, side)
+#                    ("close", room)
+#   worker -> main   ("frame", room, text, binary, snapshot, status)
+#                    ("cancelled", room)
+#                    ("ticks", None, [(started, lateness, duration, steps)])
+#
+# Frames are JSON-encoded in the worker; the main process only fans them out.
+# A worker that dies takes its rooms with it: their sockets are closed and
+# a fresh worker is started for the rooms that come next.
+
+
+def create_game(room, controler, opponent):
+    """Return the GameLoop for a freshly paired room"""
+    if settings.GAME_SIMULATION_WORKERS:
+        return get_pool().create_game(room, controler, opponent)
+    return GameLoop(controler, opponent)
+
+
+_pool = None
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        _pool = SimulationPool(settings.GAME_SIMULATION_WORKERS)
+    return _pool
+
+
+class SimulationPool:
+    """The simulation worker processes, started on first use"""
+
+    def __init__(self, size):
+        self.size = size
+        self.workers = []
+
+    def worker_for(self, room):
+        if not self.workers:
+            self.workers = [WorkerHandle(i) for i in range(self.size)]
+        return self.workers[zlib.crc32(room.encode()) % self.size]
+
+    def create_game(self, room, controler, opponent):
+        return RemoteGameLoop(self.worker_for(room), room, controler, opponent)
+
+
+class WorkerHandle:
+    """Main-process end of the pipe to one simulation worker.
+
+    The pipe is written and read by two threads of its own, so neither a full
+    pipe nor a large frame blocks the event loop. When the worker dies, its
+    rooms are ended and a new worker takes its place.
+    """
+
+    def __init__(self, index):
+        self.name = f"pong-simulation-{index}"
+        self.loop = asyncio.get_running_loop()
+        self.games = {}
+        self.inbox = asyncio.Queue()
+        self.start()
+        self.task = asyncio.create_task(self._dispatch())
+
+    def start(self):
+        context = multiprocessing.get_context("spawn")
+        self.conn, child = context.Pipe()
+        self.process = context.Process(
+            target=run_worker, args=(child,), name=self.name, daemon=True
+        )
+        self.process.start()
+        child.close()
+        self.outbox = queue.SimpleQueue()
+        threading.Thread(
+            target=self._write, args=(self.conn, self.outbox), name=f"{self.name}-writer", daemon=True
+        ).start()
+        threading.Thread(
+            target=self._read, args=(self.conn,), name=f"{self.name}-reader", daemon=True
+        ).start()
+
+    def send(self, *command):
+        self.outbox.put(command)
+
+    def _write(self, conn, outbox):
+        while True:
+            command = outbox.get()
+            if command is None:
+                break
+            try:
+                conn.send(command)
+            except OSError:
+                # The worker is gone; the reader sees the EOF and restarts it.
+                pass
+        conn.close()
+
+    def _read(self, conn):
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                message = ("exited", None)
+            try:
+                self.loop.call_soon_threadsafe(self.inbox.put_nowait, message)
+            except RuntimeError:
+                # The event loop is closed: the server is shutting down.
+                return
+            if message[0] == "exited":
+                return
+
+    async def _dispatch(self):
+        # Messages are handled one at a time so frames keep their order.
+        while True:
+            kind, room, *args = await self.inbox.get()
+            if kind == "ticks":
+                for sample in args[0]:
+                    observe_tick(*sample)
+                continue
+            if kind == "exited":
+                await self.restart()
+                continue
+            game = self.games.get(room)
+            if game is None:
+                continue
+            try:
+                if kind == "frame":
+                    await game.deliver(*args)
+                elif kind == "cancelled" and not game.cancelled.done():
+                    game.cancelled.set_result(None)
+            except Exception:
+                logger.exception("Failed to deliver %s for room %s", kind, room)
+
+    async def restart(self):
+        games, self.games = self.games, {}
+        logger.error("Simulation worker %s exited, ending %d rooms", self.name, len(games))
+        self.outbox.put(None)
+        self.start()
+        for game in games.values():
+            try:
+                await game.fail()
+            except Exception:
+                logger.exception("Failed to end room %s", game.room)
+
+
+class RemoteGameLoop:
+    """Stands in for a GameLoop that runs in a simulation worker"""
+
+    def __init__(self, worker, room, controler, opponent):
+        self.worker = worker
+        self.room = room
+        self.controler = controler
+        self.opponent = opponent
+        self.broadcast = RoomBroadcast((controler, opponent))
+        self.spectators = None
+        self.history = SnapshotHistory()
+        self.closed = 0
+        self._game_over = False
+        self.cancelling = False
+        self.cancelled = asyncio.get_running_loop().create_future()
+        worker.games[room] = self
+        worker.send("create", room)
+
+    def side(self, ws):
+        return 0 if ws is self.controler else 1
+
+    async def assign_data(self, data, ws):
+        ws.frame_format = negotiate(data.get("protocol"))
+        ws.side = self.side(ws)
+        self.worker.send("firstdata", self.room, ws.side, data, getattr(ws, "player_id", None))
+
+    async def assign_racquet(self, data, ws):
+        self.worker.send("move", self.room, self.side(ws), data)
+
+    async def pause_game(self):
+        self.worker.send("pause", self.room)
+
+    async def resume_game(self):
+        self.worker.send("resume", self.room)
+
+    async def cancel_game(self, ws):
+        # Wait for the worker's forfeit frames before the room is torn down.
+        self.cancelling = True
+        self.worker.send("cancel", self.room, self.side(ws))
+        try:
+            await asyncio.wait_for(asyncio.shield(self.cancelled), CANCEL_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning("Simulation worker did not cancel room %s", self.room)
+        self.worker.games.pop(self.room, None)
+
+    def close(self):
+        self._game_over = True
+        self.worker.games.pop(self.room, None)
+        self.worker.send("close", self.room)
+
+    async def fail(self):
+        """End the room after its worker died: the players' sockets are closed"""
+        self._game_over = True
+        if not self.cancelled.done():
+            self.cancelled.set_result(None)
+        await get_channel_layer().group_send(self.room, {"type": "terminate_game"})
+
+    async def deliver(self, text, binary, snapshot, status):
+        if status == "GameOver":
+            self._game_over = True
+            if not self.cancelling:
+                self.worker.games.pop(self.room, None)
+        if snapshot:
+            seq, tick, radius, sides = snapshot
+            snapshot = Snapshot(seq, tick, radius / POSITION_SCALE, sides, self.history)
+        await self.broadcast.deliver(Frame(None, binary, snapshot, text=text, status=status))
+
+
+# Worker process side
+
+
+class RemotePlayer:
+    """Worker-side stand-in for one player's GameConsumer"""
+
+    def __init__(self, side):
+        self.side = side
+        self.id = None
+        # The authenticated player of the socket in the main process.
+        self.player_id = None
+        self.y = 0
+        self.score = 0
+        self.frame_format = FORMAT_JSON
+
+
+class PipeBroadcast:
+    """Sends a worker GameLoop's messages back to the main process"""
+
+    def __init__(self, conn, room):
+        self.conn = conn
+        self.room = room
+
+    async def publish(self, message, binary=None, snapshot=None):
+        if snapshot:
+            snapshot = (snapshot.seq, snapshot.tick, snapshot.radius, snapshot.sides)
+        self.conn.send((
+            "frame",
+            self.room,
+            json.dumps({"message": message}),
+            binary,
+            snapshot,
+            message.get("status"),
+        ))
+
+
+class SimulationWorker:
+    """Runs the GameLoops pinned to this worker on the worker's own event loop"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.games = {}
+        self.tick_samples = []
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self.stopped = loop.create_future()
+        loop.add_reader(self.conn.fileno(), self._on_readable)
+        # Nothing scrapes this process: tick timings go to the main process.
+        scheduler.observers[:] = [self.observe_tick]
+        reporter = asyncio.create_task(self.report_ticks())
+        try:
+            await self.stopped
+        finally:
+            reporter.cancel()
+
+    def observe_tick(self, *sample):
+        self.tick_samples.append(sample)
+
+    async def report_ticks(self):
+        while True:
+            await asyncio.sleep(TICK_REPORT_INTERVAL)
+            if self.tick_samples:
+                self.conn.send(("ticks", None, self.tick_samples))
+                self.tick_samples = []
+
+    def _on_readable(self):
+        try:
+            command, room, *args = self.conn.recv()
+        except EOFError:
+            asyncio.get_running_loop().remove_reader(self.conn.fileno())
+            self.stopped.set_result(None)
+            return
+        getattr(self, f"do_{command}")(room, *args)
+
+    def do_create(self, room):
+        game = GameLoop(RemotePlayer(0), RemotePlayer(1))
+        game.broadcast = PipeBroadcast(self.conn, room)
+        self.games[room] = game
+
+    def do_firstdata(self, room, side, data, player_id):
+        game = self.games.get(room)
+        if game:
+            game.get_players()[side].player_id = player_id
+            asyncio.create_task(self._assign_data(room, game, side, data))
+
+    async def _assign_data(self, room, game, side, data):
+        await game.assign_data(data, game.get_players()[side])
+        if game.task:
+            game.task.add_done_callback(lambda task: self.games.pop(room, None))
+
+    def do_move(self, room, side, data):
+        game = self.games.get(room)
+        if game:
+            asyncio.create_task(game.assign_racquet(data, game.get_players()[side]))
+
+    def do_pause(self, room):
+        game = self.games.get(room)
+        if game:
+            asyncio.create_task(game.pause_game())
+
+    def do_resume(self, room):
+        game = self.games.get(room)
+        if game:
+            asyncio.create_task(game.resume_game())
+
+    def do_cancel(self, room, side):
+        game = self.games.pop(room, None)
+        if game:
+            asyncio.create_task(self._cancel(room, game, side))
+        else:
+            self.conn.send(("cancelled", room))
+
+    def do_close(self, room):
+        game = self.games.pop(room, None)
+        if game:
+            game.close()
+
+    async def _cancel(self, room, game, side):
+        try:
+            await game.cancel_game(game.get_players()[side])
+        finally:
+            self.conn.send(("cancelled", room))
+
+
+def run_worker(conn):
+    # Spawned interpreters start bare: load the apps so GameConfig.ready()
+    # sets up the physics engine here too.
+    django.setup()
+    asyncio.run(SimulationWorker(conn).run())
@@ -1,56 +1,63 @@
 import json
-from channels.generic.websocket import WebsocketConsumer
-from asgiref.sync import async_to_sync
+from channels.generic.websocket import AsyncWebsocketConsumer
+from backend.database import database
 from .models import *
 from .serializers import NotificationSerializer, UserSerializer
 
 
-class UserNotificationConsumer(WebsocketConsumer):
-    def connect(self):
+class UserNotificationConsumer(AsyncWebsocketConsumer):
+    async def connect(self):
         self.id = self.scope['url_route']['kwargs']['id']
         self.group_name = f'notification_{self.id}'
         
         # Join room group
-        async_to_sync(self.channel_layer.group_add)(
+        await self.channel_layer.group_add(
             self.group_name,
             self.channel_name
         )
-        self.accept()
-    def disconnect(self, close_code):
+        await self.accept()
+    async def disconnect(self, close_code):
         
         # Leave room group
-        async_to_sync(self.channel_layer.group_discard)(
+        await self.channel_layer.group_discard(
             self.group_name,
             self.channel_name
         )
-    def receive(self, text_data):
+    async def receive(self, text_data):
         data = json.loads(text_data)
         self.is_signal = data["is_signal"]
         try:
-            receiver = self.get_user(data['receiver'])
-            sender   = self.get_user(self.id)
-            if not self.is_signal and data['type'] != 'friend':
-                new_notification = Notification.objects.create(sender=sender, receiver=receiver, content=data['message'], type=data['type'], data=data['data'])
-                if new_notification:
-                    self.broadcast_notification(NotificationSerializer(new_notification).data)
-                else:
-                    self.send_error('Notification data not valid!')
-            else :
-                notification = {
-                    'sender': sender.id,
-                    'receiver': UserSerializer(receiver).data,
-                    'content': data['message'],
-                    'type': data['type'],
-                    'data': data['data']
-                }
-                self.broadcast_notification(notification)
+            notification = await self.create_notification(data)
+            if notification:
+                await self.broadcast_notification(notification)
+            else:
+                await self.send_error('Notification data not valid!')
         except User.DoesNotExist:
-            self.send_error('Receiver user not exists!')
+            await self.send_error('Receiver user not exists!')
 
-    def broadcast_notification(self, message_data):
-        message_data['sender'] = self.get_user(self.id).username
-        message_data['is_signal'] = self.is_signal
-        async_to_sync(self.channel_layer.group_send)(
+    @database
+    def create_notification(self, data):
+        receiver = self.get_user(data['receiver'])
+        sender   = self.get_user(self.id)
+        if not self.is_signal and data['type'] != 'friend':
+            new_notification = Notification.objects.create(sender=sender, receiver=receiver, content=data['message'], type=data['type'], data=data['data'])
+            if not new_notification:
+                return None
+            notification = NotificationSerializer(new_notification).data
+        else :
+            notification = {
+                'sender': sender.id,
+                'receiver': UserSerializer(receiver).data,
+                'content': data['message'],
+                'type': data['type'],
+                'data': data['data']
+            }
+        notification['sender'] = sender.username
+        notification['is_signal'] = self.is_signal
+        return notification
+
+    async def broadcast_notification(self, message_data):
+        await self.channel_layer.group_send(
             f'notification_{message_data["receiver"]["id"]}',
             {
                 'type': 'send_message',
@@ -62,8 +69,8 @@ class UserNotificationConsumer(WebsocketConsumer):
             return User.objects.get(id=user_id)
         except User.DoesNotExist:
             return None          
-    def send_error(self, error_message):
-        self.send(text_data=json.dumps({'error': error_message}))  
-    def send_message(self, event):
+    async def send_error(self, error_message):
+        await self.send(text_data=json.dumps({'error': error_message}))  
+    async def send_message(self, event):
         message = event['data']
-        self.send(text_data=json.dumps(message))
+        await self.send(text_data=json.dumps(message))
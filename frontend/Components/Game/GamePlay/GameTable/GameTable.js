@@ -5,10 +5,8 @@ import { goNextStage } from "/Components/Game/GamePlay/configs/ScoreManager.js";
 import { wsUrl, HOST, TOURNAMENT_API_URL } from "/Utils/GlobalVariables.js";
 import { PausePage } from "/Components/Game/GamePlay/PauseElements/Pause-Page.js";
 import { router } from "/root/Router.js";
-import { createApiData } from "/Utils/APIManager.js";
 import { gameBard } from "/Components/CustomElements/CustomSliders.js";
-import { updateApiData } from "/Utils/APIManager.js";
-import { PROFILE_API_URL, updateCurrentPlayer } from "/Utils/GlobalVariables.js";
+import { updateCurrentPlayer } from "/Utils/GlobalVariables.js";
 import { svgSlider } from "/Slides.js";
 import { CustomSpinner } from "/Components/CustomElements/CustomSpinner.js";
 import { isTokenValid } from "/root/fetchWithToken.js";
@@ -107,7 +105,9 @@ export class GameTable extends HTMLElement {
     async openSocket(room_name) {
         document.body.querySelector("footer-bar").remove();
         this.socket = null;
-        this.socket = new WebSocket(`${wsUrl}ws/game/${room_name}/`);
+        // The server records the result for the player this token belongs to.
+        const accessToken = localStorage.getItem('accessToken');
+        this.socket = new WebSocket(`${wsUrl}ws/game/${room_name}/?token=${accessToken}`);
         const spinner = new CustomSpinner();
         spinner.label = "Waiting for opponent to join ...";
         spinner.time = 150;
@@ -124,21 +124,6 @@ export class GameTable extends HTMLElement {
         this.socket.onerror = (error) => { };
     }
 
-    async saveMatchInforfitGame() {
-        score.player = 0;
-        score.opponent = 5;
-        const body = JSON.stringify({
-            'player_score': score.player,
-            'opponent_score': score.opponent,
-            'result': 'lose',
-            'opponent_player': opponentInfo.id
-        });
-        xhr.open('POST', HOST + '/game/game_history/me/', true);
-        xhr.setRequestHeader('Content-Type', 'application/json');
-        xhr.setRequestHeader('Authorization', `Bearer ${accessToken}`);
-        xhr.send(body);
-    }
-
     async forfitGame () {
         this.beforeunloadFunction = async function (e) {
             e.preventDefault();
@@ -156,7 +141,6 @@ export class GameTable extends HTMLElement {
 				xhr.setRequestHeader('Authorization', `Bearer ${accessToken}`);
 				xhr.send();
 			}
-            else this.saveMatchInforforfitGame();
         }
         window.addEventListener('beforeunload', this.beforeunloadFunction);
     }
@@ -191,6 +175,7 @@ export class GameTable extends HTMLElement {
             canvas_width: CANVAS_WIDTH,
             canvas_height: CANVAS_HEIGHT,
             id: userInfo.id,
+            save: this.save_match === true,
             racquet: {
                 height: this.racquet.height,
                 width: this.racquet.width,
@@ -293,24 +278,6 @@ export class GameTable extends HTMLElement {
         };
     }
 
-    async saveMatch(opponent_player, playerState, score, opponent_score) {
-        const body = JSON.stringify({
-            'player_score': score, 
-            'opponent_score': opponent_score,
-            'result': playerState,
-            'opponent_player': opponent_player
-        });
-        const form = new FormData();
-        if (playerState === "win"){
-            form.append('win', 1);
-        } else {
-            form.append('loss', 1);
-        }
-        const updateResponse =  await updateApiData(PROFILE_API_URL + "me/stats/", form);
-        await updateCurrentPlayer();
-        await createApiData(HOST + '/game/game_history/me/', body);
-    }
-
     async GameOver(playerState, score, opponent_score, opponent_player, time, winner) {
         this.reset();
         if (this.id && this.id !== "undefined"){
@@ -319,7 +286,8 @@ export class GameTable extends HTMLElement {
         }
         const gameOver = new GameOver(playerState, this.state, winner);
         document.body.appendChild(gameOver);
-        if (this.save_match === true) await this.saveMatch(opponent_player, playerState, score, opponent_score);
+        // The server records online matches and updates the stats itself.
+        if (this.save_match === true) await updateCurrentPlayer();
         setTimeout(() => {
             this.remove();
         }, time);
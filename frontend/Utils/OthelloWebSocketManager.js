@@ -2,16 +2,19 @@
 // Handles real-time multiplayer connections
 
 class OthelloWebSocketManager {
-    constructor(roomName, onGameUpdate) {
+    // mode: 'ai_easy', 'ai_medium' or 'ai_hard' plays against the server AI.
+    constructor(roomName, onGameUpdate, mode = null) {
         this.roomName = roomName;
         this.onGameUpdate = onGameUpdate;
+        this.mode = mode;
         this.socket = null;
         this.playerColor = null;
         this.isConnected = false;
     }
     
     connect() {
-        const wsUrl = `ws://${window.location.host}/ws/othello/${this.roomName}/`;
+        const query = this.mode ? `?mode=${this.mode}` : '';
+        const wsUrl = `ws://${window.location.host}/ws/othello/${this.roomName}/${query}`;
         this.socket = new WebSocket(wsUrl);
         
         this.socket.onopen = () => {
@@ -59,7 +62,8 @@ class OthelloWebSocketManager {
                     board: data.board,
                     currentPlayer: data.current_player,
                     row: data.row,
-                    col: data.col
+                    col: data.col,
+                    passed: data.passed
                 });
                 break;
                 